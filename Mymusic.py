@@ -1,12 +1,33 @@
 import streamlit as st
-import yt_dlp
 from io import BytesIO
 import requests
 import json
 import time
-import pickle
 import os
 import base64
+import tempfile
+import mimetypes
+import re
+from urllib.parse import unquote
+import math
+from collections import deque
+from contextlib import contextmanager
+import streamlit.components.v1 as components
+import uuid
+from url_cache import UrlCache
+from prefetch import Prefetcher, neighbour_ids, DEFAULT_DEPTH
+from search_cache import SearchCache
+from playlist_store import PlaylistStore
+from playlist_model import Playlist
+from metadata_store import MetadataStore
+from track import Track
+from extractors import ExtractorPool
+from playlist_import import PlaylistImporter
+from offline_library import OfflineLibrary, mime_type, to_song as local_song
+from transcode import ffprobe_binary
+from metrics import Registry, resolver_rows
+from resolver import CircuitBreaker, Resolver
+from loudness import TARGET_LUFS, replay_gain
 
 # Configuración de la página
 st.set_page_config(
@@ -14,38 +35,134 @@ st.set_page_config(
     page_icon="🎵",
     layout="wide"
 )
+# Inicio de esta ejecución del script, para medir la duración completa del rerun
+RERUN_STARTED = time.perf_counter()
 
-# Archivo para guardar las listas de reproducción
+# Base de datos de las listas de reproducción
+PLAYLISTS_DB = os.environ.get("PLAYLISTS_DB", "playlists.db")
+# Archivo antiguo de listas (pickle), se migra una vez a PLAYLISTS_DB
 PLAYLISTS_FILE = "playlists_data.pkl"
+# Número máximo de URLs de audio resueltas que se guardan en memoria
+URL_CACHE_SIZE = int(os.environ.get("URL_CACHE_SIZE", 256))
+# Canciones siguientes que se resuelven en segundo plano mientras suena la actual
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", DEFAULT_DEPTH))
+# Canciones por página en las listas guardadas y la cola
+LIST_PAGE_SIZE = int(os.environ.get("LIST_PAGE_SIZE", 25))
+# Canciones de la lista activa que se muestran en la barra lateral
+SIDEBAR_WINDOW = 15
+# Carpetas con audios ya descargados (separadas por os.pathsep) e índice de la biblioteca local
+OFFLINE_LIBRARY_DIRS = [d for d in os.environ.get("OFFLINE_LIBRARY_DIRS", os.pathsep.join(["Download", "downloads"])).split(os.pathsep) if d]
+OFFLINE_INDEX = os.environ.get("OFFLINE_INDEX", "offline_library.json")
+# Prefijo de las "URLs" de audio que apuntan a un archivo de la biblioteca local
+LOCAL_AUDIO_PREFIX = "local-file:"
+# Backend que convierte a mp3 (backend.py)
+BACKEND_URL = os.environ.get("MUSIC_BACKEND_URL", "https://music-ds9z.onrender.com")
+# Proxy de audio con Range (ruta /audio del backend); vacío = usar la URL de googlevideo directamente
+AUDIO_PROXY_URL = os.environ.get("AUDIO_PROXY_URL", "").rstrip("/")
+# Backend con /thumbnail (miniaturas reducidas y en caché); vacío = miniatura original de YouTube
+THUMBNAIL_PROXY_URL = os.environ.get("THUMBNAIL_PROXY_URL", "").rstrip("/")
+# Ancho en píxeles de las miniaturas de la cuadrícula de resultados
+THUMBNAIL_WIDTH = int(os.environ.get("THUMBNAIL_WIDTH", 320))
+# Tiempo máximo de cada petición al backend y de la descarga completa (segundos)
+BACKEND_REQUEST_TIMEOUT = 15
+DOWNLOAD_TIMEOUT = 5 * 60
+# Segundos que se reutilizan los resultados de una búsqueda
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 15 * 60))
+# Tope de resultados que se pueden ir cargando para una misma búsqueda
+SEARCH_MAX_RESULTS = 200
+# Buscar primero en el índice local (listas guardadas y búsquedas anteriores) y sólo después en YouTube
+LOCAL_SEARCH_FIRST = os.environ.get("LOCAL_SEARCH_FIRST", "1") == "1"
+# Canciones vistas en búsquedas que recuerda ese índice y sugerencias que se muestran al escribir
+SEARCH_HISTORY_SIZE = int(os.environ.get("SEARCH_HISTORY_SIZE", 5000))
+LOCAL_SUGGESTIONS = 5
+# Máximo de canciones por importación y videos que se completan en paralelo
+IMPORT_MAX_TRACKS = int(os.environ.get("IMPORT_MAX_TRACKS", 1000))
+IMPORT_WORKERS = int(os.environ.get("IMPORT_WORKERS", 4))
+# Llamadas a YouTube (búsquedas y resolución de audio): simultáneas en todo el proceso, segundos por
+# intento, reintentos, y fallos seguidos que abren el circuito y segundos hasta volver a probar
+EXTRACT_CONCURRENCY = int(os.environ.get("EXTRACT_CONCURRENCY", 4))
+EXTRACT_TIMEOUT = float(os.environ.get("EXTRACT_TIMEOUT", 20))
+EXTRACT_RETRIES = int(os.environ.get("EXTRACT_RETRIES", 2))
+BREAKER_THRESHOLD = int(os.environ.get("BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", 30))
+# Videos cuyos metadatos se comparten en memoria entre sesiones y JSON donde guardarlos (vacío = sólo memoria)
+METADATA_CACHE_SIZE = int(os.environ.get("METADATA_CACHE_SIZE", 5000))
+METADATA_STORE_PATH = os.environ.get("METADATA_STORE_PATH", "")
+# Segundos de fundido entre canciones (0 = sin fundido, la siguiente empieza justo al terminar)
+CROSSFADE_SECONDS = float(os.environ.get("CROSSFADE_SECONDS", 0))
+# Cada cuántos segundos el reproductor informa la posición mientras suena (0 = sólo al pausar, saltar o cambiar)
+PLAYER_REPORT_INTERVAL = float(os.environ.get("PLAYER_REPORT_INTERVAL", 10))
+# Igualar el volumen entre canciones con la sonoridad (EBU R128) que analiza el backend en /loudness
+# Sólo con un backend configurado a propósito: cada video consultado por primera vez se descarga para analizarlo
+LOUDNESS_URL = os.environ.get("LOUDNESS_URL", AUDIO_PROXY_URL).rstrip("/")
+NORMALIZE_VOLUME = bool(LOUDNESS_URL) and os.environ.get("NORMALIZE_VOLUME", "1") == "1"
+LOUDNESS_TARGET = float(os.environ.get("LOUDNESS_TARGET", TARGET_LUFS))
+# Segundos máximos de cada consulta y antes de volver a preguntar por un video aún sin analizar
+LOUDNESS_REQUEST_TIMEOUT = 3
+LOUDNESS_RETRY = 120
+# Panel de rendimiento en la barra lateral (PERF_PANEL=1) y tiempos que guarda cada sesión
+PERF_PANEL = os.environ.get("PERF_PANEL", "0") == "1"
+PERF_LOG_SIZE = 50
+
+@st.cache_resource
+def get_metrics():
+    """Histogramas y contadores del proceso, compartidos por todas las sesiones"""
+    return Registry('mymusic_')
+
+def operation_histogram():
+    return get_metrics().histogram('operation_duration_seconds', 'Duración de búsquedas, resoluciones, descargas y reruns')
+
+def record_timing(operation, elapsed):
+    """Guarda una duración en el histograma del proceso y en el registro de la sesión"""
+    operation_histogram().observe(elapsed, operation=operation)
+    st.session_state.setdefault('perf_log', deque(maxlen=PERF_LOG_SIZE)).append((time.strftime('%H:%M:%S'), operation, elapsed))
+
+@contextmanager
+def timed(operation):
+    """Mide un bloque, o una función si se usa como decorador"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(operation, time.perf_counter() - start)
+
+@st.cache_resource
+def get_metadata_store():
+    """Una sola copia de los metadatos de cada video para todas las sesiones"""
+    return MetadataStore(max_entries=METADATA_CACHE_SIZE, path=METADATA_STORE_PATH or None)
+
+@st.cache_resource
+def get_playlist_store():
+    """Repositorio SQLite de listas compartido por todas las sesiones"""
+    store = PlaylistStore(PLAYLISTS_DB, history_size=SEARCH_HISTORY_SIZE)
+    store.migrate_from_pickle(PLAYLISTS_FILE)
+    return store
 
 def load_playlists():
-    """Carga las listas de reproducción guardadas"""
-    if os.path.exists(PLAYLISTS_FILE):
-        try:
-            with open(PLAYLISTS_FILE, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
-
-def save_playlists(playlists_dict):
-    """Guarda las listas de reproducción"""
+    """Carga las listas de reproducción guardadas como {nombre: Playlist}"""
     try:
-        with open(PLAYLISTS_FILE, 'wb') as f:
-            pickle.dump(playlists_dict, f)
-        return True
-    except:
-        return False
+        playlists = get_playlist_store().load_all()
+    except Exception:
+        return {}
+    # Las canciones que ya cargó otra sesión no se duplican en memoria; la cola usa
+    # la misma Playlist que la lista guardada en lugar de una copia
+    metadata = get_metadata_store()
+    return {name: Playlist(metadata.intern(songs)) for name, songs in playlists.items()}
 
 # Inicializar session state
 if 'search_results' not in st.session_state:
     st.session_state.search_results = []
+if 'search_query' not in st.session_state:
+    st.session_state.search_query = ""
+if 'search_source' not in st.session_state:
+    # 'local' si los resultados salieron del índice local, 'youtube' si de yt-dlp
+    st.session_state.search_source = 'youtube'
 if 'current_audio_url' not in st.session_state:
     st.session_state.current_audio_url = None
 if 'current_title' not in st.session_state:
     st.session_state.current_title = None
 if 'playlist' not in st.session_state:
-    st.session_state.playlist = []
+    st.session_state.playlist = Playlist()
 if 'current_index' not in st.session_state:
     st.session_state.current_index = 0
 if 'autoplay' not in st.session_state:
@@ -58,78 +175,387 @@ if 'saved_playlists' not in st.session_state:
     st.session_state.saved_playlists = load_playlists()
 if 'current_playlist_name' not in st.session_state:
     st.session_state.current_playlist_name = "Lista Temporal"
+if 'session_key' not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
+if 'prefetch_depth' not in st.session_state:
+    st.session_state.prefetch_depth = PREFETCH_DEPTH
+if 'crossfade' not in st.session_state:
+    st.session_state.crossfade = CROSSFADE_SECONDS
+if 'normalize' not in st.session_state:
+    st.session_state.normalize = NORMALIZE_VOLUME
+if 'playback_position' not in st.session_state:
+    # Posición real según el navegador: {'position', 'duration', 'paused'} de la canción actual
+    st.session_state.playback_position = None
+if 'perf_log' not in st.session_state:
+    st.session_state.perf_log = deque(maxlen=PERF_LOG_SIZE)
+
+def entry_to_video(entry):
+    """Convierte una entrada de yt-dlp a la canción (Track) que usa la app"""
+    thumbnail = entry.get('thumbnail')
+    if not thumbnail and entry.get('thumbnails'):
+        thumbnail = entry['thumbnails'][-1].get('url', '')
+    return Track(
+        entry.get('id', ''),
+        title=entry.get('title'),
+        url=entry.get('url'),
+        duration=entry.get('duration'),
+        thumbnail=thumbnail,
+        uploader=entry.get('uploader') or entry.get('channel'),
+        view_count=entry.get('view_count'),
+    )
+
+@st.cache_resource
+def get_resolver():
+    """Límites compartidos de las llamadas a YouTube: concurrencia, tiempos, reintentos y circuito"""
+    resolver = Resolver(
+        max_concurrency=EXTRACT_CONCURRENCY,
+        timeout=EXTRACT_TIMEOUT,
+        retries=EXTRACT_RETRIES,
+        breaker=CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET)
+    )
+    get_metrics().collector(lambda: resolver_rows(resolver.stats()))
+    return resolver
+
+@st.cache_resource
+def get_extractor_pool():
+    """Instancias de YoutubeDL reutilizables entre reruns y sesiones, una familia por perfil"""
+    pool = ExtractorPool()
+    # socket_timeout: una llamada abandonada por el resolver no se queda colgada para siempre
+    pool.register('search', {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+        'socket_timeout': EXTRACT_TIMEOUT,
+    })
+    pool.register('import', {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'playlistend': IMPORT_MAX_TRACKS,
+        'socket_timeout': EXTRACT_TIMEOUT,
+    })
+    pool.register('metadata', {
+        'quiet': True,
+        'no_warnings': True,
+        'socket_timeout': EXTRACT_TIMEOUT,
+    })
+    pool.register('resolve', {
+        'format': 'bestaudio[ext=m4a]/bestaudio/best',  # Priorizar m4a para mejor compatibilidad
+        'quiet': True,
+        'no_warnings': True,
+        'prefer_ffmpeg': False,
+        'nocheckcertificate': True,
+        'socket_timeout': EXTRACT_TIMEOUT,
+    })
+    return pool
+
+def open_search(query):
+    """Abre una búsqueda perezosa en YouTube: yt-dlp pide cada página sólo al iterar"""
+    # process=False devuelve las entradas como generador sin recorrerlo, y ese generador
+    # sigue usando la instancia al pedir cada página: por eso cada búsqueda tiene la suya,
+    # fuera del pool (SearchResults la lee desde un solo hilo a la vez)
+    ydl = get_extractor_pool().detached('search')
+    results = ydl.extract_info(f"ytsearch{SEARCH_MAX_RESULTS}:{query}", download=False, process=False)
+    metadata = get_metadata_store()
+    return (metadata.put(entry_to_video(entry)) for entry in results.get('entries') or [] if entry)
+
+def import_playlist(url, playlist_name=None):
+    """Importa una lista o canal de YouTube a una lista guardada con una sola escritura"""
+    importer = PlaylistImporter(get_extractor_pool(), entry_to_video, workers=IMPORT_WORKERS)
+    existing = st.session_state.saved_playlists.get(playlist_name, []) if playlist_name else []
+    progress_bar = st.progress(0.0, text="Leyendo la lista...")
+    
+    def on_progress(done, total):
+        progress_bar.progress(done / total if total else 1.0, text=f"Completando datos: {done}/{total}")
+    
+    try:
+        result = importer.run(url, exclude_ids={song.id for song in existing}, progress=on_progress)
+    except Exception as e:
+        progress_bar.empty()
+        st.error(f"Error al importar la lista: {str(e)}")
+        return None
+    progress_bar.empty()
+    name = playlist_name or result.title or "Lista importada"
+    # Sin destino elegido el nombre sale del título de YouTube y puede ser el de una lista existente
+    existing_ids = {song.id for song in st.session_state.saved_playlists.get(name, [])}
+    result.songs = [song for song in result.songs if song.id not in existing_ids]
+    get_playlist_store().add_tracks(name, result.songs)
+    st.session_state.saved_playlists.setdefault(name, Playlist()).extend(get_metadata_store().intern(result.songs))
+    if st.session_state.current_playlist_name == name:
+        st.session_state.playlist = st.session_state.saved_playlists[name]
+    return name, result
+
+@st.cache_resource
+def get_search_cache():
+    """Caché de búsquedas compartida por todas las sesiones"""
+    resolver = get_resolver()
+    # Las páginas se piden a YouTube al leer los resultados: esa lectura es la que pasa por el resolver
+    return SearchCache(
+        open_search, ttl=SEARCH_CACHE_TTL,
+        guard=lambda fetch: resolver.call('search', fetch), on_fetch=remember_search
+    )
 
+def remember_search(songs):
+    """Guarda en el índice local los resultados recién llegados de YouTube (la próxima vez no hace falta ir)"""
+    try:
+        get_playlist_store().remember_tracks(songs)
+    except Exception:
+        pass
+
+@timed("search_music")
 def search_music(query, max_results=10):
-    """Busca música en YouTube usando yt-dlp"""
+    """Busca música en YouTube usando yt-dlp; devuelve los ids (los datos quedan en el MetadataStore)"""
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-            'default_search': 'ytsearch' + str(max_results),
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            results = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
-            
-            if 'entries' in results:
-                videos = []
-                for entry in results['entries']:
-                    if entry:
-                        video_info = {
-                            'title': entry.get('title', 'Sin título'),
-                            'url': entry.get('url', ''),
-                            'id': entry.get('id', ''),
-                            'duration': entry.get('duration', 0),
-                            'thumbnail': entry.get('thumbnail', ''),
-                            'uploader': entry.get('uploader', 'Desconocido'),
-                            'view_count': entry.get('view_count', 0)
-                        }
-                        videos.append(video_info)
-                return videos
+        return [song.id for song in get_search_cache().results(query, max_results)]
     except Exception as e:
         st.error(f"Error al buscar música: {str(e)}")
         return []
 
-def get_audio_url(video_id):
-    """Obtiene la URL de audio directa del video - Compatible con todas las plataformas"""
+@timed("local_search")
+def local_search(query, max_results=10):
+    """Busca en las listas guardadas y en búsquedas anteriores (índice FTS5 local); devuelve los ids"""
     try:
-        ydl_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio/best',  # Priorizar m4a para mejor compatibilidad
-            'quiet': True,
-            'no_warnings': True,
-            'prefer_ffmpeg': False,
-            'nocheckcertificate': True,
-        }
+        songs = get_playlist_store().search(query, max_results)
+    except Exception:
+        return []
+    return [song.id for song in get_metadata_store().intern(songs)]
+
+def search_songs(video_ids, query, source):
+    """Canciones de los ids de una búsqueda, en orden
+
+    Las que el MetadataStore ya expulsó se recuperan de la caché de búsquedas (o del
+    índice local) y se vuelven a guardar; sólo se omiten las que ya no están en ninguno.
+    """
+    metadata = get_metadata_store()
+    songs = [metadata.get(video_id) for video_id in video_ids]
+    if None in songs:
+        if source == 'local':
+            try:
+                known = get_playlist_store().search(query, len(video_ids))
+            except Exception:
+                known = []
+        else:
+            known = get_search_cache().cached(query)
+        known = {song.id: song for song in known}
+        missing = [known[video_id] for video_id, song in zip(video_ids, songs) if song is None and video_id in known]
+        recovered = {song.id: song for song in metadata.intern(missing)}
+        songs = [song or recovered.get(video_id) for video_id, song in zip(video_ids, songs)]
+    return [song for song in songs if song is not None]
+
+def count_search_source(source):
+    """Cuenta si una búsqueda se resolvió con el índice local o tuvo que ir a YouTube"""
+    get_metrics().counter('search_total', 'Búsquedas según dónde se resolvieron').inc(source=source)
+
+def has_more_results(query, count):
+    """Si la búsqueda tiene más resultados después de los primeros `count`"""
+    return count < SEARCH_MAX_RESULTS and get_search_cache().has_more(query, count)
+
+@st.cache_resource
+def get_url_cache():
+    """Caché de URLs de audio compartida por todas las sesiones y reruns"""
+    return UrlCache(max_entries=URL_CACHE_SIZE)
+
+def extract_audio_url(video_id, pool=None, metadata=None, resolver=None):
+    """Resuelve con yt-dlp la URL de audio directa del video - Compatible con todas las plataformas"""
+    # Los hilos de prefetch reciben pool, metadatos y resolver como argumento (fuera del script no hay contexto de Streamlit)
+    pool = pool or get_extractor_pool()
+    metadata = metadata or get_metadata_store()
+    resolver = resolver or get_resolver()
+    # Si otra sesión ya está resolviendo el mismo video, se espera ese resultado
+    info = metadata.extract(
+        video_id,
+        lambda: resolver.call(
+            'resolve',
+            lambda: pool.extract_info('resolve', f"https://www.youtube.com/watch?v={video_id}", download=False)
+        )
+    )
+    
+    # Buscar el mejor formato de audio compatible con móviles
+    if 'formats' in info:
+        # Priorizar formatos m4a y webm que son universalmente compatibles
+        audio_formats = [
+            f for f in info['formats'] 
+            if f.get('acodec') != 'none' and f.get('vcodec') == 'none'
+        ]
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-            
-            # Buscar el mejor formato de audio compatible con móviles
-            if 'formats' in info:
-                # Priorizar formatos m4a y webm que son universalmente compatibles
-                audio_formats = [
-                    f for f in info['formats'] 
-                    if f.get('acodec') != 'none' and f.get('vcodec') == 'none'
-                ]
-                
-                if audio_formats:
-                    # Ordenar: primero m4a, luego por calidad de audio
-                    audio_formats.sort(
-                        key=lambda x: (
-                            1 if x.get('ext') == 'm4a' else 0,
-                            x.get('abr', 0)
-                        ), 
-                        reverse=True
-                    )
-                    return audio_formats[0]['url']
-            
-            # Si no hay formato solo de audio, usar el URL directo
-            return info.get('url', '')
+        if audio_formats:
+            # Ordenar: primero m4a, luego por calidad de audio
+            audio_formats.sort(
+                key=lambda x: (
+                    1 if x.get('ext') == 'm4a' else 0,
+                    x.get('abr', 0)
+                ), 
+                reverse=True
+            )
+            return audio_formats[0]['url']
+    
+    # Si no hay formato solo de audio, usar el URL directo
+    return info.get('url', '')
+
+def proxy_audio_url(video_id):
+    """URL del proxy de audio para un video: no caduca y permite saltar con Range"""
+    return f"{AUDIO_PROXY_URL}/audio/{video_id}"
+
+def thumbnail_url(song):
+    """Miniatura de la cuadrícula: reducida por el backend si hay proxy, si no la original"""
+    if THUMBNAIL_PROXY_URL and song.thumbnail and not song.id.startswith('local:'):
+        return f"{THUMBNAIL_PROXY_URL}/thumbnail/{song.id}?w={THUMBNAIL_WIDTH}"
+    return song.thumbnail
+
+def warm_audio_proxy(video_id):
+    """Pide al proxy que resuelva la URL y guarde el primer bloque de la canción"""
+    response = requests.post(f"{proxy_audio_url(video_id)}/warm", timeout=BACKEND_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return proxy_audio_url(video_id)
+
+@st.cache_resource
+def get_offline_library():
+    """Biblioteca local compartida; al arrancar sólo se leen los archivos nuevos o modificados"""
+    library = OfflineLibrary(OFFLINE_LIBRARY_DIRS, OFFLINE_INDEX, ffprobe=ffprobe_binary("ffmpeg"))
+    library.scan()
+    return library
+
+def local_audio_path(audio_url):
+    """Ruta del archivo local si `audio_url` apunta a la biblioteca, o None"""
+    if audio_url and audio_url.startswith(LOCAL_AUDIO_PREFIX):
+        return audio_url[len(LOCAL_AUDIO_PREFIX):]
+    return None
+
+@st.cache_resource(max_entries=4)
+def read_local_audio(path, mtime):
+    """Bytes de un archivo local (el mtime invalida la copia si el archivo cambió)"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+@st.cache_resource
+def get_prefetcher():
+    """Pool de hilos compartido para resolver por adelantado las siguientes canciones"""
+    if AUDIO_PROXY_URL:
+        return Prefetcher(warm_audio_proxy, get_url_cache())
+    pool = get_extractor_pool()
+    metadata = get_metadata_store()
+    resolver = get_resolver()
+    return Prefetcher(lambda video_id: extract_audio_url(video_id, pool, metadata, resolver), get_url_cache())
+
+def count_audio_source(source):
+    """Cuenta de dónde salió la URL de audio (local, proxy, caché, precarga, yt-dlp o reserva caducando)"""
+    get_metrics().counter('audio_url_total', 'URLs de audio entregadas según su origen').inc(source=source)
+
+@timed("get_audio_url")
+def get_audio_url(video_id):
+    """Obtiene la URL de audio directa del video, usando la caché si aún es válida"""
+    # Si la canción ya está descargada se reproduce desde disco, sin red
+    local = get_offline_library().get(video_id)
+    if local:
+        count_audio_source('local')
+        return LOCAL_AUDIO_PREFIX + local['path']
+    if AUDIO_PROXY_URL:
+        # El proxy resuelve y renueva la URL de origen por su cuenta
+        count_audio_source('proxy')
+        return proxy_audio_url(video_id)
+    cache = get_url_cache()
+    audio_url = cache.get(video_id)
+    if audio_url:
+        count_audio_source('cache')
+        return audio_url
+    # Si el prefetch ya la está resolviendo, esperar ese resultado en vez de repetirlo
+    audio_url = get_prefetcher().wait(video_id)
+    if audio_url:
+        count_audio_source('prefetch')
+        return audio_url
+    try:
+        audio_url = extract_audio_url(video_id)
     except Exception as e:
+        # Con YouTube caído o limitando, mejor una URL a punto de caducar que ninguna
+        audio_url = cache.stale(video_id)
+        if audio_url:
+            count_audio_source('stale')
+            return audio_url
+        count_audio_source('error')
         st.error(f"Error al obtener audio: {str(e)}")
         return None
+    count_audio_source('extract')
+    cache.put(video_id, audio_url)
+    return audio_url
+
+def peek_audio_url(video_id):
+    """URL de audio sólo si ya está disponible sin esperar (local, proxy o caché), si no None"""
+    local = get_offline_library().get(video_id)
+    if local:
+        return LOCAL_AUDIO_PREFIX + local['path']
+    if AUDIO_PROXY_URL:
+        return proxy_audio_url(video_id)
+    return get_url_cache().get(video_id)
+
+def load_loudness(video_id, metadata):
+    """Pide al backend la sonoridad del video y la guarda con sus metadatos (desde un hilo de la precarga)
+
+    Devuelve None si aún no está; la primera consulta también pone en marcha el análisis.
+    """
+    try:
+        response = requests.get(f"{LOUDNESS_URL}/loudness/{video_id}", timeout=LOUDNESS_REQUEST_TIMEOUT)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    analysis = response.json()
+    metadata.set_loudness(video_id, analysis)
+    return analysis
+
+def get_loudness(video_id):
+    """Sonoridad del video guardada con sus metadatos, sin esperar a la red
+
+    Si aún no se tiene se pide en segundo plano y se usa en un rerun posterior.
+    """
+    if not LOUDNESS_URL or video_id.startswith('local:'):
+        return None
+    metadata = get_metadata_store()
+    analysis = metadata.loudness(video_id)
+    if analysis is None:
+        get_prefetcher().run_once(
+            ('loudness', video_id), lambda: load_loudness(video_id, metadata), retry_after=LOUDNESS_RETRY
+        )
+    return analysis
+
+def schedule_prefetch():
+    """Resuelve en segundo plano las siguientes canciones (y la anterior) de la lista actual"""
+    video_ids = neighbour_ids(
+        st.session_state.playlist,
+        st.session_state.current_index,
+        st.session_state.prefetch_depth
+    )
+    library = get_offline_library()
+    video_ids = [video_id for video_id in video_ids if library.get(video_id) is None]
+    get_prefetcher().prefetch(st.session_state.session_key, video_ids)
+
+def cancel_prefetch():
+    """Cancela el prefetch pendiente de esta sesión (p.ej. al cambiar de lista)"""
+    get_prefetcher().cancel(st.session_state.session_key)
+
+def sync_playlist_selector(key):
+    """Muestra en el selector `key` la lista activa si la cambió otro botón ("Cargar Lista"...)
+
+    Un selectbox con key conserva su valor anterior aunque cambie `index`, y ese
+    valor volvería a cambiar la lista. Sólo se toca antes de dibujar el selector
+    y cuando la lista activa cambió desde la última vez, así que no pisa una
+    elección del usuario.
+    """
+    synced = f"{key}_synced"
+    if st.session_state.get(synced) != st.session_state.current_playlist_name:
+        st.session_state[key] = st.session_state[synced] = st.session_state.current_playlist_name
+
+def page_window(total, key, focus_index=None):
+    """Selector de página para listas largas; devuelve el rango [inicio, fin) visible"""
+    pages = max(1, math.ceil(total / LIST_PAGE_SIZE))
+    if pages == 1:
+        return 0, total
+    if key not in st.session_state and focus_index is not None:
+        st.session_state[key] = focus_index // LIST_PAGE_SIZE + 1
+    elif st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, step=1, key=key)
+    start = (page - 1) * LIST_PAGE_SIZE
+    return start, min(start + LIST_PAGE_SIZE, total)
 
 def format_duration(seconds):
     """Formatea la duración en minutos:segundos"""
@@ -155,31 +581,42 @@ def play_next():
     if st.session_state.playlist and len(st.session_state.playlist) > 0:
         st.session_state.current_index = (st.session_state.current_index + 1) % len(st.session_state.playlist)
         current_song = st.session_state.playlist[st.session_state.current_index]
-        audio_url = get_audio_url(current_song['id'])
+        audio_url = get_audio_url(current_song.id)
         if audio_url:
             st.session_state.current_audio_url = audio_url
-            st.session_state.current_title = current_song['title']
-            st.session_state.song_duration = current_song.get('duration', 0)
+            st.session_state.current_title = current_song.title
+            st.session_state.song_duration = current_song.duration
 
 def play_previous():
     """Reproduce la canción anterior en la lista"""
     if st.session_state.playlist and len(st.session_state.playlist) > 0:
         st.session_state.current_index = (st.session_state.current_index - 1) % len(st.session_state.playlist)
         current_song = st.session_state.playlist[st.session_state.current_index]
-        audio_url = get_audio_url(current_song['id'])
+        audio_url = get_audio_url(current_song.id)
         if audio_url:
             st.session_state.current_audio_url = audio_url
-            st.session_state.current_title = current_song['title']
-            st.session_state.song_duration = current_song.get('duration', 0)
+            st.session_state.current_title = current_song.title
+            st.session_state.song_duration = current_song.duration
+
+def play_from_queue(idx):
+    """Reproduce la canción `idx` de la cola actual"""
+    st.session_state.current_index = idx
+    st.session_state.start_time = None
+    current_song = st.session_state.playlist[idx]
+    audio_url = get_audio_url(current_song.id)
+    if audio_url:
+        st.session_state.current_audio_url = audio_url
+        st.session_state.current_title = current_song.title
+        st.session_state.song_duration = current_song.duration
 
 def add_to_playlist(song):
-    """Agrega una canción a la lista de reproducción"""
-    if song not in st.session_state.playlist:
-        st.session_state.playlist.append(song)
+    """Agrega una canción a la lista de reproducción (si su video_id no está ya)"""
+    song = get_metadata_store().put(song)
+    if st.session_state.playlist.append(song):
         # Auto-guardar si es una lista guardada
         if st.session_state.current_playlist_name != "Lista Temporal":
             st.session_state.saved_playlists[st.session_state.current_playlist_name] = st.session_state.playlist
-            save_playlists(st.session_state.saved_playlists)
+            get_playlist_store().add_track(st.session_state.current_playlist_name, song)
         return True
     return False
 
@@ -189,21 +626,129 @@ def create_audio_player_with_autoplay(audio_url, autoplay_enabled=True):
     # En lugar del componente HTML personalizado
     pass  # Esta función ya no se usa, se reemplaza por st.audio directo
 
-def download_mp3(video_id, title):
-    """Descarga el audio en mp3 y lo retorna como bytes"""
+@timed("download_audio")
+def download_audio(video_id, title, duration=0, codec="mp3"):
+    """Descarga el audio del backend en streaming; retorna (archivo temporal, extensión, tipo MIME)
+
+    Con codec="original" el backend no recodifica: sólo cambia el contenedor del audio de YouTube.
+    El archivo temporal es del llamador, que debe cerrarlo.
+    """
+    audio_file = None
+    # Formato para los mensajes; con "original" se conoce al llegar la respuesta
+    label = "audio" if codec == "original" else codec
     try:
-        backend_url = "https://music-ds9z.onrender.com/download"
-        params = {"video_id": video_id}
-        response = requests.get(backend_url, params=params)
-        if response.status_code == 200:
-            return response.content
-        else:
-            st.error(f"Error del backend: {response.text}")
-            return None
+        with requests.get(
+            f"{BACKEND_URL}/stream",
+            params={"video_id": video_id, "codec": codec, "bitrate": "192"},
+            stream=True,
+            timeout=BACKEND_REQUEST_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"Error del backend: {response.text}")
+                return None
+            mimetype = response.headers.get('Content-Type', 'audio/mpeg').split(';')[0]
+            # La extensión real (p.ej. .opus) viene en el nombre que propone el backend
+            filename = re.search(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)", response.headers.get('Content-Disposition', ''))
+            ext = os.path.splitext(unquote(filename.group(1)))[1] if filename else ''
+            ext = ext or mimetypes.guess_extension(mimetype) or ("" if codec == "original" else f".{codec}")
+            label = ext.lstrip('.') or label
+            # Tamaño aproximado a 192 kbps, sólo para la barra de progreso
+            expected_bytes = int(response.headers.get('Content-Length') or duration * 192000 / 8)
+            progress_bar = st.progress(0.0, text=f"Recibiendo {label}...")
+            deadline = time.time() + DOWNLOAD_TIMEOUT
+            received = 0
+            # Los bloques van a disco mientras llegan (st.download_button lee luego el archivo entero)
+            audio_file = tempfile.TemporaryFile()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                audio_file.write(chunk)
+                received += len(chunk)
+                if expected_bytes:
+                    progress_bar.progress(min(received / expected_bytes, 1.0), text=f"Recibiendo {label}... {received / 1_000_000:.1f} MB")
+                if time.time() > deadline:
+                    audio_file.close()
+                    st.error(f"El backend tardó demasiado en enviar el {label}")
+                    return None
+            progress_bar.progress(1.0, text="Listo")
+            audio_file.seek(0)
+            return audio_file, ext, mimetype
+    except Exception as e:
+        if audio_file:
+            audio_file.close()
+        st.error(f"Error al descargar {label} desde backend: {str(e)}")
+        return None
+
+def export_playlist_zip(songs, name, codec, bitrate="192"):
+    """Pide al backend la lista completa en un zip y lo recibe en streaming a un archivo temporal
+
+    El archivo temporal es del llamador, que debe cerrarlo.
+    """
+    zip_file = None
+    # Las canciones que sólo existen en la biblioteca local no están en YouTube
+    video_ids = [song.id for song in songs if not song.id.startswith('local:')]
+    try:
+        with requests.post(
+            f"{BACKEND_URL}/batch",
+            json={"video_ids": video_ids, "codec": codec, "bitrate": bitrate, "passthrough": True, "name": name},
+            stream=True,
+            timeout=BACKEND_REQUEST_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"Error del backend: {response.text}")
+                return None
+            progress_bar = st.progress(0.0, text="Recibiendo zip...")
+            deadline = time.time() + DOWNLOAD_TIMEOUT * max(1, len(video_ids) // 10)
+            received = 0
+            zip_file = tempfile.TemporaryFile()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                zip_file.write(chunk)
+                received += len(chunk)
+                # ~4 MB por canción, sólo para la barra de progreso
+                progress_bar.progress(min(received / (len(video_ids) * 4_000_000), 1.0), text=f"Recibiendo zip... {received / 1_000_000:.1f} MB")
+                if time.time() > deadline:
+                    zip_file.close()
+                    st.error("El backend tardó demasiado en exportar la lista")
+                    return None
+            progress_bar.progress(1.0, text="Listo")
+            zip_file.seek(0)
+            return zip_file
     except Exception as e:
-        st.error(f"Error al descargar mp3 desde backend: {str(e)}")
+        if zip_file:
+            zip_file.close()
+        st.error(f"Error al exportar la lista: {str(e)}")
         return None
 
+# Componente del reproductor (player_component/index.html)
+_audio_player = components.declare_component(
+    "audio_player",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "player_component")
+)
+
+def player_source(src, prefix=""):
+    """Argumentos del componente para una fuente: URL, o bytes y tipo MIME si es un archivo local"""
+    path = local_audio_path(src)
+    if path:
+        # Archivo local: los bytes viajan en binario y el navegador los reproduce desde un Blob
+        data = read_local_audio(path, os.path.getmtime(path))
+        return {f"{prefix}src": None, f"{prefix}data": data, f"{prefix}mime": mime_type(path)}
+    return {f"{prefix}src": src}
+
+def audio_player(src, track_key, autoplay=True, next_src=None, next_key=None, crossfade=0,
+                 gain=0, next_gain=0, peaks=None, next_peaks=None,
+                 report_interval=PLAYER_REPORT_INTERVAL, key=None):
+    """Reproductor HTML con la siguiente canción (`next_src`) precargada en un segundo elemento
+
+    `gain`/`next_gain` (dB) igualan el volumen de cada canción y `peaks` dibuja su forma de onda.
+
+    Devuelve el último aviso del navegador: {'event', 'event_id', 'track_key', 'position',
+    'duration', 'paused'}, donde `track_key` es la canción que suena de verdad; con
+    'advanced' ya pasó por su cuenta a `next_key`.
+    """
+    args = player_source(src)
+    if next_src and next_key:
+        args.update(player_source(next_src, "next_"), next_key=next_key, next_gain=next_gain, next_peaks=next_peaks)
+    return _audio_player(track_key=track_key, autoplay=autoplay, crossfade=crossfade, gain=gain, peaks=peaks,
+                         report_interval=report_interval, key=key, default=None, **args)
+
 # Título de la aplicación
 st.title("🎵 Buscador y Reproductor de Música")
 
@@ -216,17 +761,21 @@ if st.session_state.saved_playlists:
     col_quick1, col_quick2 = st.columns([3, 1])
     with col_quick1:
         playlist_options = ["Lista Temporal"] + list(st.session_state.saved_playlists.keys())
+        sync_playlist_selector("quick_playlist_selector")
         quick_select = st.selectbox(
             "🎼 Acceso Rápido a Listas:",
             playlist_options,
-            index=playlist_options.index(st.session_state.current_playlist_name) if st.session_state.current_playlist_name in playlist_options else 0,
             key="quick_playlist_selector"
         )
         
         if quick_select != st.session_state.current_playlist_name:
+            cancel_prefetch()
             st.session_state.current_playlist_name = quick_select
             if quick_select != "Lista Temporal":
-                st.session_state.playlist = st.session_state.saved_playlists.get(quick_select, []).copy()
+                st.session_state.playlist = st.session_state.saved_playlists.setdefault(quick_select, Playlist())
+            else:
+                # La lista temporal parte de la cola actual, pero sus cambios no tocan la lista guardada
+                st.session_state.playlist = st.session_state.playlist.copy()
             st.session_state.current_index = 0
             st.rerun()
     
@@ -235,11 +784,11 @@ if st.session_state.saved_playlists:
             if st.button("▶️ Reproducir Primera", use_container_width=True):
                 st.session_state.current_index = 0
                 song = st.session_state.playlist[0]
-                audio_url = get_audio_url(song['id'])
+                audio_url = get_audio_url(song.id)
                 if audio_url:
                     st.session_state.current_audio_url = audio_url
-                    st.session_state.current_title = song['title']
-                    st.session_state.song_duration = song.get('duration', 0)
+                    st.session_state.current_title = song.title
+                    st.session_state.song_duration = song.duration
                     st.session_state.start_time = None
                     st.rerun()
 
@@ -249,12 +798,39 @@ st.markdown("---")
 with st.sidebar:
     st.header("🔍 Buscar Música")
     search_query = st.text_input("Ingresa el nombre de la canción o artista:", "")
-    num_results = st.slider("Número de resultados:", 5, 50, 50)
+    
+    # Al escribir: coincidencias de las listas guardadas y búsquedas anteriores, sin ir a YouTube
+    if search_query and LOCAL_SEARCH_FIRST:
+        suggestions = get_metadata_store().songs(local_search(search_query, LOCAL_SUGGESTIONS))
+        if suggestions:
+            st.caption("📚 En tus listas e historial:")
+            for song in suggestions:
+                if st.button(f"▶️ {song.title[:35]}", key=f"suggest_{song.id}", use_container_width=True):
+                    add_to_playlist(song)
+                    st.session_state.current_index = st.session_state.playlist.index_of(song.id)
+                    audio_url = get_audio_url(song.id)
+                    if audio_url:
+                        st.session_state.current_audio_url = audio_url
+                        st.session_state.current_title = song.title
+                        st.session_state.song_duration = song.duration
+                        st.session_state.start_time = None
+                        st.rerun()
+    
+    num_results = st.slider("Resultados por página:", 5, 50, 10)
     
     if st.button("Buscar", type="primary", use_container_width=True):
         if search_query:
-            with st.spinner("Buscando música..."):
-                st.session_state.search_results = search_music(search_query, num_results)
+            st.session_state.search_query = search_query
+            # Sólo las búsquedas que el índice local no resuelve van a YouTube
+            local = local_search(search_query, num_results) if LOCAL_SEARCH_FIRST else []
+            if local:
+                st.session_state.search_results = local
+                st.session_state.search_source = 'local'
+            else:
+                with st.spinner("Buscando música..."):
+                    st.session_state.search_results = search_music(search_query, num_results)
+                st.session_state.search_source = 'youtube'
+            count_search_source(st.session_state.search_source)
             if st.session_state.search_results:
                 st.success(f"✅ {len(st.session_state.search_results)} resultados encontrados")
                 # NO hacer rerun para no interrumpir la reproducción
@@ -279,8 +855,8 @@ with st.sidebar:
         new_playlist_name = st.text_input("Nombre de la lista:", key="new_playlist_input")
         if st.button("Crear Lista", use_container_width=True):
             if new_playlist_name and new_playlist_name not in st.session_state.saved_playlists:
-                st.session_state.saved_playlists[new_playlist_name] = []
-                save_playlists(st.session_state.saved_playlists)
+                st.session_state.saved_playlists[new_playlist_name] = Playlist()
+                get_playlist_store().create_playlist(new_playlist_name)
                 st.success(f"✅ Lista '{new_playlist_name}' creada")
                 st.rerun()
             elif new_playlist_name in st.session_state.saved_playlists:
@@ -288,24 +864,45 @@ with st.sidebar:
             else:
                 st.warning("Ingresa un nombre para la lista")
     
+    # Importar una lista o canal de YouTube
+    with st.expander("📥 Importar de YouTube"):
+        import_url = st.text_input("URL de la lista o canal:", key="import_url_input")
+        import_target = st.selectbox(
+            "Guardar en:",
+            ["Nueva lista (título de YouTube)"] + list(st.session_state.saved_playlists.keys()),
+            key="import_target"
+        )
+        if st.button("Importar", use_container_width=True):
+            if import_url:
+                target = None if import_target not in st.session_state.saved_playlists else import_target
+                imported = import_playlist(import_url, target)
+                if imported:
+                    name, result = imported
+                    st.success(f"✅ {len(result.songs)} canciones importadas a '{name}'")
+                    if result.skipped:
+                        st.caption(f"⚠️ {result.skipped} videos no disponibles omitidos")
+            else:
+                st.warning("Ingresa la URL de una lista o canal")
+    
     # Seleccionar lista activa
     playlist_names = ["Lista Temporal"] + list(st.session_state.saved_playlists.keys())
+    sync_playlist_selector("playlist_selector")
     selected_playlist = st.selectbox(
         "Lista Activa:",
         playlist_names,
-        index=playlist_names.index(st.session_state.current_playlist_name) if st.session_state.current_playlist_name in playlist_names else 0,
         key="playlist_selector"
     )
     
     # Cambiar de lista
     if selected_playlist != st.session_state.current_playlist_name:
+        cancel_prefetch()
         st.session_state.current_playlist_name = selected_playlist
         if selected_playlist == "Lista Temporal":
-            # Mantener la lista temporal actual
-            pass
+            # Mantener la cola actual como lista temporal, copiada para no tocar la lista guardada
+            st.session_state.playlist = st.session_state.playlist.copy()
         else:
-            # Cargar la lista guardada
-            st.session_state.playlist = st.session_state.saved_playlists.get(selected_playlist, [])
+            # Cargar la lista guardada (la misma Playlist, sin copiarla)
+            st.session_state.playlist = st.session_state.saved_playlists.setdefault(selected_playlist, Playlist())
             st.session_state.current_index = 0
             st.session_state.current_audio_url = None
             st.session_state.current_title = None
@@ -318,15 +915,16 @@ with st.sidebar:
         with col1:
             if st.button("💾 Guardar", use_container_width=True):
                 st.session_state.saved_playlists[st.session_state.current_playlist_name] = st.session_state.playlist
-                save_playlists(st.session_state.saved_playlists)
+                get_playlist_store().replace_tracks(st.session_state.current_playlist_name, st.session_state.playlist)
                 st.success("✅ Guardada")
         with col2:
             if st.button("🗑️ Borrar Lista", use_container_width=True):
                 if st.session_state.current_playlist_name in st.session_state.saved_playlists:
+                    cancel_prefetch()
                     del st.session_state.saved_playlists[st.session_state.current_playlist_name]
-                    save_playlists(st.session_state.saved_playlists)
+                    get_playlist_store().delete_playlist(st.session_state.current_playlist_name)
                     st.session_state.current_playlist_name = "Lista Temporal"
-                    st.session_state.playlist = []
+                    st.session_state.playlist = Playlist()
                     st.success("✅ Lista eliminada")
                     st.rerun()
     
@@ -335,6 +933,19 @@ with st.sidebar:
     # Controles de reproducción
     st.header("🎮 Controles")
     st.session_state.autoplay = st.checkbox("🔁 Reproducción continua", value=st.session_state.autoplay)
+    st.session_state.prefetch_depth = st.slider(
+        "⚡ Canciones a precargar:", 0, 10, st.session_state.prefetch_depth,
+        help="Resuelve por adelantado las siguientes canciones para que el cambio sea instantáneo"
+    )
+    st.session_state.normalize = st.checkbox(
+        "🔊 Igualar volumen", value=st.session_state.normalize, disabled=not LOUDNESS_URL,
+        help=f"Baja las canciones más fuertes hasta {LOUDNESS_TARGET:g} LUFS según el análisis del backend"
+        if LOUDNESS_URL else "Requiere LOUDNESS_URL o AUDIO_PROXY_URL"
+    )
+    st.session_state.crossfade = st.slider(
+        "🎚️ Fundido entre canciones (s):", 0.0, 12.0, float(st.session_state.crossfade), step=0.5,
+        help="0 = sin pausa ni fundido: la siguiente canción, ya cargada, empieza justo al terminar la actual"
+    )
     
     col1, col2 = st.columns(2)
     with col1:
@@ -349,23 +960,95 @@ with st.sidebar:
             st.rerun()
     
     if st.button("🗑️ Limpiar lista", use_container_width=True, disabled=len(st.session_state.playlist) == 0):
-        st.session_state.playlist = []
+        cancel_prefetch()
+        st.session_state.playlist = Playlist()
         st.session_state.current_index = 0
         st.session_state.current_audio_url = None
         st.session_state.current_title = None
         # Si es una lista guardada, también limpiarla allí
         if st.session_state.current_playlist_name != "Lista Temporal":
-            st.session_state.saved_playlists[st.session_state.current_playlist_name] = []
-            save_playlists(st.session_state.saved_playlists)
+            st.session_state.saved_playlists[st.session_state.current_playlist_name] = st.session_state.playlist
+            get_playlist_store().replace_tracks(st.session_state.current_playlist_name, [])
         st.rerun()
     
     # Mostrar lista de reproducción
     if st.session_state.playlist:
         st.markdown("---")
         st.header(f"📜 {st.session_state.current_playlist_name} ({len(st.session_state.playlist)})")
-        for idx, song in enumerate(st.session_state.playlist):
+        # Sólo una ventana alrededor de la canción actual
+        first = max(0, st.session_state.current_index - SIDEBAR_WINDOW // 2)
+        last = min(len(st.session_state.playlist), first + SIDEBAR_WINDOW)
+        if first > 0:
+            st.caption(f"… {first} canciones antes")
+        for idx in range(first, last):
+            song = st.session_state.playlist[idx]
             icon = "🔊" if idx == st.session_state.current_index else "🎵"
-            st.caption(f"{icon} {idx + 1}. {song['title'][:40]}...")
+            st.caption(f"{icon} {idx + 1}. {song.title[:40]}...")
+        if last < len(st.session_state.playlist):
+            st.caption(f"… {len(st.session_state.playlist) - last} canciones más")
+    
+    # Audios ya descargados: se reproducen desde disco, sin conexión
+    with st.expander("💾 Biblioteca local"):
+        library = get_offline_library()
+        library_stats = library.stats()
+        st.caption(f"{library_stats['tracks']} canciones | {library_stats['youtube']} de YouTube | {library_stats['bytes'] / 1_000_000:.0f} MB")
+        if st.button("🔄 Volver a escanear", use_container_width=True):
+            scan = library.scan()
+            st.caption(f"{scan['probed']} nuevos o modificados | {scan['removed']} eliminados")
+        local_tracks = library.tracks()
+        if local_tracks:
+            start, end = page_window(len(local_tracks), "library_local_page")
+            for entry in local_tracks[start:end]:
+                if st.button(f"▶️ {entry['title'][:35]}", key=f"play_local_{entry['id']}", use_container_width=True):
+                    song = local_song(entry)
+                    add_to_playlist(song)
+                    st.session_state.current_index = st.session_state.playlist.index_of(song.id)
+                    st.session_state.current_audio_url = LOCAL_AUDIO_PREFIX + entry['path']
+                    st.session_state.current_title = song.title
+                    st.session_state.song_duration = song.duration
+                    st.session_state.start_time = None
+                    st.rerun()
+    
+    # Estadísticas de la caché de URLs (para dimensionarla)
+    with st.expander("📈 Caché de audio"):
+        cache_stats = get_url_cache().stats()
+        st.caption(f"Entradas: {cache_stats['size']}/{cache_stats['max_entries']}")
+        st.caption(f"Aciertos: {cache_stats['hits']} | Fallos: {cache_stats['misses']} ({cache_stats['hit_ratio']:.0%} aciertos)")
+        st.caption(f"Expulsadas: {cache_stats['evictions']} | Caducadas: {cache_stats['expirations']}")
+        prefetch_stats = get_prefetcher().stats()
+        st.caption(f"Precarga: {prefetch_stats['inflight']} en curso | {prefetch_stats['completed']} listas | {prefetch_stats['cancelled']} canceladas")
+        search_stats = get_search_cache().stats()
+        st.caption(f"Búsquedas: {search_stats['size']} en caché | {search_stats['hits']} reutilizadas | {search_stats['misses']} a YouTube")
+        metadata_stats = get_metadata_store().stats()
+        st.caption(f"Metadatos: {metadata_stats['size']}/{metadata_stats['max_entries']} videos | {metadata_stats['extractions']} consultas a yt-dlp | {metadata_stats['shared']} compartidas entre sesiones")
+        resolver_stats = get_resolver().stats()
+        circuit = {'closed': "🟢 normal", 'half_open': "🟡 probando", 'open': "🔴 en pausa"}[resolver_stats['state']]
+        st.caption(f"YouTube: {circuit} | {resolver_stats['in_flight']}/{resolver_stats['max_concurrency']} llamadas en curso | {resolver_stats['retries']} reintentos | {search_stats['stale']} búsquedas de reserva")
+    
+    if PERF_PANEL:
+        with st.expander("🐞 Rendimiento"):
+            histogram = operation_histogram()
+            st.caption("Proceso (todas las sesiones), en ms")
+            st.table([
+                {
+                    'operación': dict(labels)['operation'],
+                    'n': row['count'],
+                    'p50': round(row['p50'] * 1000),
+                    'p95': round(row['p95'] * 1000),
+                    'máx': round(row['max'] * 1000),
+                }
+                for labels, row in sorted(histogram.summary().items())
+            ])
+            sources = get_metrics().counter('audio_url_total').samples()
+            if sources:
+                st.caption("URLs de audio: " + " | ".join(f"{dict(labels)['source']}: {count}" for _, labels, count in sources))
+            searches = get_metrics().counter('search_total').samples()
+            if searches:
+                st.caption("Búsquedas: " + " | ".join(f"{dict(labels)['source']}: {count}" for _, labels, count in searches))
+            st.caption("Esta sesión (más recientes primero)")
+            for when, operation, elapsed in reversed(st.session_state.perf_log):
+                st.caption(f"{when} · {operation} · {elapsed * 1000:.0f} ms")
+            st.download_button("⬇️ Métricas (Prometheus)", get_metrics().render(), file_name="metrics.txt", mime="text/plain", use_container_width=True)
     
     st.markdown("---")
     st.markdown("""
@@ -384,22 +1067,65 @@ with st.sidebar:
     """)
 
 # Área principal - Reproductor actual
-if st.session_state.current_audio_url and st.session_state.current_title:
-    # Iniciar temporizador si no existe
+def current_track_key():
+    """Identifica la reproducción en curso para descartar eventos de canciones anteriores"""
+    return f"{st.session_state.current_index}:{st.session_state.start_time}"
+
+def next_index():
+    """Índice de la canción que el reproductor encadena sola, o None (sin reproducción continua)"""
+    if not st.session_state.autoplay or len(st.session_state.playlist) <= 1:
+        return None
+    return (st.session_state.current_index + 1) % len(st.session_state.playlist)
+
+def next_track_key():
+    """Clave de la siguiente canción: misma marca de inicio, así el cambio no recarga el reproductor"""
+    index = next_index()
+    return None if index is None else f"{index}:{st.session_state.start_time}"
+
+def follow_player(index):
+    """El navegador ya pasó solo a la canción `index`: se actualiza el estado sin tocar el audio"""
+    song = st.session_state.playlist[index]
+    st.session_state.current_index = index
+    st.session_state.current_audio_url = peek_audio_url(song.id) or get_audio_url(song.id)
+    st.session_state.current_title = song.title
+    st.session_state.song_duration = song.duration
+
+def sync_player(event):
+    """Aplica el último aviso del reproductor: canción que suena, posición real o fin de la canción"""
+    if not event or event.get('event_id') == st.session_state.get('player_event_id'):
+        return
+    st.session_state.player_event_id = event.get('event_id')
+    if event.get('track_key') == next_track_key():
+        follow_player(next_index())
+    if event.get('track_key') != current_track_key():
+        return
+    st.session_state.playback_position = {
+        'position': event.get('position', 0),
+        'duration': event.get('duration') or st.session_state.song_duration,
+        'paused': event.get('paused', False),
+    }
+    if event.get('event') == 'ended' and next_index() is not None:
+        # La siguiente no estaba precargada a tiempo: se carga ahora
+        st.session_state.start_time = None
+        play_next()
+
+@st.fragment
+@timed("player_section")
+def player_section():
+    """Reproductor: al terminar una canción sólo se vuelve a ejecutar esta sección"""
+    if not (st.session_state.current_audio_url and st.session_state.current_title):
+        return
+    
+    # Si el navegador ya pasó a la siguiente canción (o terminó sin tenerla), ponerse al día antes de dibujar
+    sync_player(st.session_state.get("audio_player"))
+    
+    # Marca de inicio: identifica cada reproducción (cambia con la canción y al recargar)
     if st.session_state.start_time is None:
         st.session_state.start_time = time.time()
+        st.session_state.playback_position = None
     
-    # Calcular tiempo transcurrido
-    elapsed_time = time.time() - st.session_state.start_time
-    
-    # Si está activado el autoplay y hay más canciones en la lista
-    if st.session_state.autoplay and len(st.session_state.playlist) > 1:
-        # Si la canción ha terminado (con 5 segundos de margen)
-        if st.session_state.song_duration > 0 and elapsed_time >= (st.session_state.song_duration + 5):
-            # Avanzar a la siguiente canción
-            st.session_state.start_time = None
-            play_next()
-            st.rerun()
+    # Precargar las siguientes canciones mientras suena la actual
+    schedule_prefetch()
     
     st.header("🎧 Reproduciendo Ahora")
     
@@ -413,23 +1139,50 @@ if st.session_state.current_audio_url and st.session_state.current_title:
         if st.session_state.playlist:
             st.info(f"🎵 {st.session_state.current_index + 1}/{len(st.session_state.playlist)}")
     
-    # Usar reproductor nativo de Streamlit (compatible con iOS, Android y Windows)
-    st.audio(st.session_state.current_audio_url, format='audio/mp4', start_time=0)
+    # Reproductor con la siguiente canción ya cargada: el navegador la encadena sin esperar al servidor
+    # (compatible con iOS, Android y Windows). Si su URL aún no está resuelta se pasa en un rerun posterior
+    index = next_index()
+    next_id = None if index is None else st.session_state.playlist[index].id
+    # Sonoridad ya analizada por el backend: ganancia al estilo ReplayGain, sin análisis al reproducir
+    queue = st.session_state.playlist
+    current_id = queue[st.session_state.current_index].id if st.session_state.current_index < len(queue) else None
+    analysis = get_loudness(current_id) if st.session_state.normalize and current_id else None
+    next_analysis = get_loudness(next_id) if st.session_state.normalize and next_id else None
+    audio_player(
+        st.session_state.current_audio_url,
+        current_track_key(),
+        next_src=None if next_id is None else peek_audio_url(next_id),
+        next_key=next_track_key(),
+        crossfade=st.session_state.crossfade,
+        gain=replay_gain(analysis, LOUDNESS_TARGET),
+        next_gain=replay_gain(next_analysis, LOUDNESS_TARGET),
+        peaks=(analysis or {}).get('peaks'),
+        next_peaks=(next_analysis or {}).get('peaks'),
+        key="audio_player"
+    )
+    if analysis and analysis.get('integrated') is not None:
+        st.caption(
+            f"🔊 {analysis['integrated']:.1f} LUFS · pico real {analysis.get('true_peak') or 0:.1f} dBTP · "
+            f"ganancia {replay_gain(analysis, LOUDNESS_TARGET):+.1f} dB"
+        )
     
     # Información de compatibilidad multiplataforma
     st.caption("✅ **Compatible con**: 💻 Windows | 🍎 iOS/macOS | 🤖 Android | 🌐 Todos los navegadores")
     
     # Información sobre autoplay y controles
     if st.session_state.autoplay and len(st.session_state.playlist) > 1:
-        if st.session_state.song_duration > 0:
-            time_remaining = max(0, st.session_state.song_duration - elapsed_time)
-            st.success(f"🔁 **Reproducción automática activa** - Siguiente canción en: {format_duration(int(time_remaining))}")
+        if st.session_state.crossfade:
+            st.success(f"🔁 **Reproducción automática activa** - Fundido de {st.session_state.crossfade:g} s con la siguiente canción")
         else:
-            st.info("🔁 **Reproducción continua activada**: Usa los botones ⏭️ **Siguiente** para cambiar de canción")
-        
-        # Mostrar duración total
-        if st.session_state.song_duration > 0:
-            st.caption(f"⏱️ Duración total: {format_duration(st.session_state.song_duration)}")
+            st.success("🔁 **Reproducción automática activa** - La siguiente canción empieza en cuanto termine esta")
+    
+    # Posición real del navegador (se actualiza al pausar, saltar, cambiar de canción y cada pocos segundos)
+    playback = st.session_state.playback_position
+    if playback:
+        state = "⏸️ En pausa" if playback['paused'] else "▶️ Sonando"
+        st.caption(f"{state} - ⏱️ {format_duration(playback['position']) if playback['position'] >= 1 else '0:00'} / {format_duration(playback['duration'])}")
+    elif st.session_state.song_duration > 0:
+        st.caption(f"⏱️ Duración total: {format_duration(st.session_state.song_duration)}")
     
     # Controles rápidos principales
     st.markdown("### 🎮 Controles de Reproducción")
@@ -459,24 +1212,50 @@ if st.session_state.current_audio_url and st.session_state.current_title:
         if st.session_state.current_audio_url and st.session_state.current_title:
             st.markdown("---")
             st.subheader("Descargar esta canción en MP3")
-            if st.button("⬇️ Descargar MP3", key="download_mp3_btn"):
-                with st.spinner("Solicitando mp3 al servidor..."):
-                    mp3_bytes = download_mp3(
-                        st.session_state.playlist[st.session_state.current_index]['id'],
-                        st.session_state.current_title.replace(' ', '_')[:40]
+            local_path = local_audio_path(st.session_state.current_audio_url)
+            if local_path:
+                # Ya está en disco: se entrega tal cual, sin pasar por el backend
+                with open(local_path, 'rb') as local_file:
+                    st.download_button(
+                        label="💾 Descargar archivo local",
+                        data=local_file,
+                        file_name=f"{st.session_state.current_title[:40]}{os.path.splitext(local_path)[1]}",
+                        mime=mime_type(local_path)
                     )
-                    if mp3_bytes:
-                        st.download_button(
-                            label="Descargar archivo MP3",
-                            data=mp3_bytes,
-                            file_name=f"{st.session_state.current_title[:40]}.mp3",
-                            mime="audio/mpeg"
+            else:
+                col_mp3, col_original = st.columns(2)
+                with col_mp3:
+                    download_codec = "mp3" if st.button("⬇️ Descargar MP3", key="download_mp3_btn", use_container_width=True) else None
+                with col_original:
+                    # Sin recodificar: más rápido y sin pérdida de calidad adicional
+                    if st.button("⚡ Descargar original", key="download_original_btn", use_container_width=True):
+                        download_codec = "original"
+                if download_codec and current_id:
+                    with st.spinner("Solicitando audio al servidor..."):
+                        downloaded = download_audio(
+                            current_id,
+                            st.session_state.current_title.replace(' ', '_')[:40],
+                            st.session_state.song_duration,
+                            download_codec
                         )
+                        if downloaded:
+                            audio_file, ext, mimetype = downloaded
+                            # download_button copia el contenido al llamarse: el temporal se cierra después
+                            with audio_file:
+                                st.download_button(
+                                    label=f"Descargar archivo {ext.lstrip('.').upper()}",
+                                    data=audio_file,
+                                    file_name=f"{st.session_state.current_title[:40]}{ext}",
+                                    mime=mimetype
+                                )
     
-    # Mostrar cola de reproducción actual
+    # Mostrar cola de reproducción actual (forma parte del fragmento del reproductor)
     if st.session_state.playlist and len(st.session_state.playlist) > 0:
         with st.expander(f"📜 Cola Actual - {st.session_state.current_playlist_name} ({len(st.session_state.playlist)} canciones)", expanded=False):
-            for idx, song in enumerate(st.session_state.playlist):
+            queue = st.session_state.playlist
+            start, end = page_window(len(queue), "queue_page", focus_index=st.session_state.current_index)
+            for idx in range(start, end):
+                song = queue[idx]
                 is_current = idx == st.session_state.current_index
                 
                 col_a, col_b, col_c = st.columns([0.5, 3, 1])
@@ -484,124 +1263,158 @@ if st.session_state.current_audio_url and st.session_state.current_title:
                     icon = "🔊" if is_current else f"{idx + 1}."
                     st.markdown(f"**{icon}**")
                 with col_b:
-                    st.markdown(f"{'**' if is_current else ''}{song['title']}{'**' if is_current else ''}")
-                    st.caption(f"⏱️ {format_duration(song.get('duration', 0))}")
+                    st.markdown(f"{'**' if is_current else ''}{song.title}{'**' if is_current else ''}")
+                    st.caption(f"⏱️ {format_duration(song.duration)}")
                 with col_c:
                     if not is_current:
-                        if st.button("▶️", key=f"play_from_queue_{idx}", use_container_width=True):
-                            st.session_state.current_index = idx
-                            st.session_state.start_time = None
-                            audio_url = get_audio_url(song['id'])
-                            if audio_url:
-                                st.session_state.current_audio_url = audio_url
-                                st.session_state.current_title = song['title']
-                                st.session_state.song_duration = song.get('duration', 0)
-                                st.rerun()
+                        st.button("▶️", key=f"play_from_queue_{song.id}", use_container_width=True,
+                                  on_click=play_from_queue, args=(idx,))
                     else:
                         st.markdown("**▶️**")
     
-    # Auto-refresh para actualizar el contador y cambiar de canción
-    if st.session_state.autoplay and st.session_state.song_duration > 0:
-        time.sleep(2)  # Esperar 2 segundos antes de refrescar
-        st.rerun()
-    
     st.markdown("---")
 
+if st.session_state.current_audio_url and st.session_state.current_title:
+    player_section()
+
 # Mostrar todas las listas guardadas con opción de reproducir canciones individuales
-if st.session_state.saved_playlists:
+def remove_song(playlist_name, idx):
+    songs = st.session_state.saved_playlists[playlist_name]
+    queue = st.session_state.playlist
+    current_id = queue[st.session_state.current_index].id if st.session_state.current_index < len(queue) else None
+    removed = songs.pop(idx)
+    get_playlist_store().remove_track(playlist_name, removed.id)
+    # Si es la lista que se está usando, la cola es la misma Playlist: sólo hay que
+    # recolocar el índice para no perder la canción que suena
+    if st.session_state.current_playlist_name == playlist_name:
+        st.session_state.playlist = songs
+        current_index = songs.index_of(current_id)
+        if current_index is None:
+            # Se quitó la que suena: el índice no puede quedar fuera de la lista
+            current_index = max(min(st.session_state.current_index, len(songs) - 1), 0)
+        st.session_state.current_index = current_index
+
+@st.fragment
+@timed("library_section")
+def library_section():
+    """Listas guardadas: sólo se dibuja la lista seleccionada y la página visible"""
     st.header(f"📚 Mis Listas de Reproducción ({len(st.session_state.saved_playlists)})")
     
-    # Crear tabs para cada lista
+    # Selector de lista en lugar de st.tabs, que dibujaba todas las listas en cada rerun
     tab_names = list(st.session_state.saved_playlists.keys())
-    if tab_names:
-        tabs = st.tabs(tab_names)
-        
-        for tab_idx, (tab, playlist_name) in enumerate(zip(tabs, tab_names)):
-            with tab:
-                songs = st.session_state.saved_playlists[playlist_name]
+    if st.session_state.get("library_tab") not in tab_names:
+        st.session_state.library_tab = tab_names[0]
+    playlist_name = st.radio("Lista:", tab_names, key="library_tab", horizontal=True, label_visibility="collapsed")
+    songs = st.session_state.saved_playlists[playlist_name]
+    
+    # Encabezado de la lista
+    col_header1, col_header2, col_header3 = st.columns([2, 1, 1])
+    with col_header1:
+        st.markdown(f"### 🎵 {playlist_name}")
+        st.caption(f"📊 {len(songs)} canciones")
+    with col_header2:
+        if st.button("▶️ Reproducir Todo", key=f"play_all_{playlist_name}", use_container_width=True):
+            cancel_prefetch()
+            st.session_state.current_playlist_name = playlist_name
+            st.session_state.playlist = songs
+            st.session_state.current_index = 0
+            if songs:
+                audio_url = get_audio_url(songs[0].id)
+                if audio_url:
+                    st.session_state.current_audio_url = audio_url
+                    st.session_state.current_title = songs[0].title
+                    st.session_state.song_duration = songs[0].duration
+                    st.session_state.start_time = None
+                    st.rerun()
+    with col_header3:
+        if st.button("📥 Cargar Lista", key=f"load_list_{playlist_name}", use_container_width=True):
+            cancel_prefetch()
+            st.session_state.current_playlist_name = playlist_name
+            st.session_state.playlist = songs
+            st.session_state.current_index = 0
+            st.success("Lista cargada")
+            st.rerun()
+    
+    # Exportar la lista completa en un zip (el backend convierte varias canciones en paralelo)
+    with st.expander("📦 Exportar lista"):
+        export_codec = st.selectbox(
+            "Formato:",
+            ["m4a", "opus", "mp3"],
+            format_func=lambda codec: {"m4a": "m4a (sin recodificar si es posible)", "opus": "opus (sin recodificar si es posible)", "mp3": "mp3 192k"}[codec],
+            key=f"export_codec_{playlist_name}"
+        )
+        if st.button("📦 Preparar zip", key=f"export_{playlist_name}", disabled=not songs):
+            zip_file = export_playlist_zip(songs, playlist_name, export_codec)
+            if zip_file:
+                with zip_file:
+                    st.download_button(
+                        label="Descargar zip",
+                        data=zip_file,
+                        file_name=f"{playlist_name}.zip",
+                        mime="application/zip",
+                        key=f"export_download_{playlist_name}"
+                    )
+    
+    st.markdown("---")
+    
+    # Mostrar canciones de la lista (sólo la página visible)
+    if songs:
+        start, end = page_window(len(songs), f"library_page_{playlist_name}")
+        for idx in range(start, end):
+            song = songs[idx]
+            is_playing = (
+                st.session_state.current_playlist_name == playlist_name and 
+                st.session_state.current_index == idx and
+                st.session_state.current_audio_url is not None
+            )
+            
+            # Crear contenedor para cada canción
+            with st.container():
+                col1, col2, col3, col4, col5 = st.columns([0.5, 3, 1.5, 1, 1])
+                
+                with col1:
+                    icon = "🔊" if is_playing else "🎵"
+                    st.markdown(f"### {icon}")
+                
+                with col2:
+                    st.markdown(f"**{idx + 1}. {song.title}**")
+                    st.caption(f"👤 {song.uploader}")
+                
+                with col3:
+                    st.caption(f"⏱️ {format_duration(song.duration)}")
+                    st.caption(f"👁️ {format_views(song.view_count)}")
                 
-                # Encabezado de la lista
-                col_header1, col_header2, col_header3 = st.columns([2, 1, 1])
-                with col_header1:
-                    st.markdown(f"### 🎵 {playlist_name}")
-                    st.caption(f"📊 {len(songs)} canciones")
-                with col_header2:
-                    if st.button("▶️ Reproducir Todo", key=f"play_all_{playlist_name}", use_container_width=True):
+                with col4:
+                    if st.button("▶️ Reproducir", key=f"play_song_{playlist_name}_{song.id}", use_container_width=True):
+                        if st.session_state.current_playlist_name != playlist_name:
+                            cancel_prefetch()
                         st.session_state.current_playlist_name = playlist_name
-                        st.session_state.playlist = songs.copy()
-                        st.session_state.current_index = 0
-                        if songs:
-                            audio_url = get_audio_url(songs[0]['id'])
+                        st.session_state.playlist = songs
+                        st.session_state.current_index = idx
+                        with st.spinner("Cargando..."):
+                            audio_url = get_audio_url(song.id)
                             if audio_url:
                                 st.session_state.current_audio_url = audio_url
-                                st.session_state.current_title = songs[0]['title']
-                                st.session_state.song_duration = songs[0].get('duration', 0)
+                                st.session_state.current_title = song.title
+                                st.session_state.song_duration = song.duration
                                 st.session_state.start_time = None
+                                # El reproductor está fuera de este fragmento: rerun completo
                                 st.rerun()
-                with col_header3:
-                    if st.button("📥 Cargar Lista", key=f"load_list_{playlist_name}", use_container_width=True):
-                        st.session_state.current_playlist_name = playlist_name
-                        st.session_state.playlist = songs.copy()
-                        st.session_state.current_index = 0
-                        st.success("Lista cargada")
-                        st.rerun()
                 
-                st.markdown("---")
+                with col5:
+                    # Como callback: se aplica antes del rerun del fragmento, sin redibujar la app
+                    st.button("🗑️", key=f"remove_song_{playlist_name}_{song.id}", use_container_width=True, help="Eliminar de la lista",
+                              on_click=remove_song, args=(playlist_name, idx))
                 
-                # Mostrar canciones de la lista
-                if songs:
-                    for idx, song in enumerate(songs):
-                        is_playing = (
-                            st.session_state.current_playlist_name == playlist_name and 
-                            st.session_state.current_index == idx and
-                            st.session_state.current_audio_url is not None
-                        )
-                        
-                        # Crear contenedor para cada canción
-                        with st.container():
-                            col1, col2, col3, col4, col5 = st.columns([0.5, 3, 1.5, 1, 1])
-                            
-                            with col1:
-                                icon = "🔊" if is_playing else "🎵"
-                                st.markdown(f"### {icon}")
-                            
-                            with col2:
-                                st.markdown(f"**{idx + 1}. {song['title']}**")
-                                st.caption(f"👤 {song.get('uploader', 'Desconocido')}")
-                            
-                            with col3:
-                                st.caption(f"⏱️ {format_duration(song.get('duration', 0))}")
-                                st.caption(f"👁️ {format_views(song.get('view_count', 0))}")
-                            
-                            with col4:
-                                if st.button("▶️ Reproducir", key=f"play_song_{playlist_name}_{idx}", use_container_width=True):
-                                    st.session_state.current_playlist_name = playlist_name
-                                    st.session_state.playlist = songs.copy()
-                                    st.session_state.current_index = idx
-                                    with st.spinner("Cargando..."):
-                                        audio_url = get_audio_url(song['id'])
-                                        if audio_url:
-                                            st.session_state.current_audio_url = audio_url
-                                            st.session_state.current_title = song['title']
-                                            st.session_state.song_duration = song.get('duration', 0)
-                                            st.session_state.start_time = None
-                                            st.rerun()
-                            
-                            with col5:
-                                if st.button("🗑️", key=f"remove_song_{playlist_name}_{idx}", use_container_width=True, help="Eliminar de la lista"):
-                                    st.session_state.saved_playlists[playlist_name].pop(idx)
-                                    save_playlists(st.session_state.saved_playlists)
-                                    # Actualizar la lista actual si es la que se está usando
-                                    if st.session_state.current_playlist_name == playlist_name:
-                                        st.session_state.playlist = st.session_state.saved_playlists[playlist_name].copy()
-                                    st.rerun()
-                            
-                            st.markdown("---")
-                else:
-                    st.info("📭 Esta lista está vacía. Agrega canciones desde los resultados de búsqueda.")
+                st.markdown("---")
+    else:
+        st.info("📭 Esta lista está vacía. Agrega canciones desde los resultados de búsqueda.")
     
     st.markdown("---")
 
+if st.session_state.saved_playlists:
+    library_section()
+
 
 # Mostrar resultados de búsqueda
 if st.session_state.search_results:
@@ -611,11 +1424,27 @@ if st.session_state.search_results:
     if st.session_state.current_audio_url:
         st.info("🎵 **La música sigue sonando** - Puedes agregar canciones a la lista sin interrumpir la reproducción actual")
     
-    st.caption(f"📊 {len(st.session_state.search_results)} resultados encontrados")
+    # La sesión sólo guarda los ids; los datos son los compartidos por todas las sesiones
+    results = search_songs(st.session_state.search_results, st.session_state.search_query, st.session_state.search_source)
+    # Los contadores y "Cargar más" se basan en lo que de verdad se muestra
+    st.session_state.search_results = [result.id for result in results]
+    
+    st.caption(f"📊 {len(results)} resultados encontrados")
+    if st.session_state.search_source == 'local':
+        # Resultados de las listas guardadas y búsquedas anteriores: YouTube sólo si se pide
+        col_source, col_youtube = st.columns([3, 1])
+        with col_source:
+            st.caption("📚 De tus listas e historial de búsquedas")
+        with col_youtube:
+            if st.button("🔎 Buscar en YouTube", key="search_youtube", use_container_width=True):
+                with st.spinner("Buscando música..."):
+                    st.session_state.search_results = search_music(st.session_state.search_query, num_results)
+                st.session_state.search_source = 'youtube'
+                count_search_source('youtube')
+                st.rerun()
     
     # Crear columnas para mostrar resultados en grid
     cols_per_row = 2
-    results = st.session_state.search_results
     
     for i in range(0, len(results), cols_per_row):
         cols = st.columns(cols_per_row)
@@ -627,41 +1456,38 @@ if st.session_state.search_results:
                 with cols[j]:
                     with st.container():
                         # Mostrar miniatura si está disponible
-                        if result.get('thumbnail'):
-                            st.image(result['thumbnail'], use_container_width=True)
+                        if result.thumbnail:
+                            st.image(thumbnail_url(result), use_container_width=True)
                         
                         # Información del video
-                        st.markdown(f"**{result['title']}**")
-                        st.caption(f"👤 {result['uploader']}")
+                        st.markdown(f"**{result.title}**")
+                        st.caption(f"👤 {result.uploader}")
                         
                         col1, col2 = st.columns(2)
                         with col1:
-                            st.caption(f"⏱️ {format_duration(result['duration'])}")
+                            st.caption(f"⏱️ {format_duration(result.duration)}")
                         with col2:
-                            st.caption(f"👁️ {format_views(result['view_count'])}")
+                            st.caption(f"👁️ {format_views(result.view_count)}")
                         
                         # Botones para reproducir y agregar a lista
                         col_play, col_add = st.columns(2)
                         with col_play:
-                            if st.button(f"▶️ Reproducir", key=f"play_{result['id']}", use_container_width=True):
+                            if st.button(f"▶️ Reproducir", key=f"play_{result.id}", use_container_width=True):
                                 # Agregar a la lista si no está
                                 add_to_playlist(result)
                                 # Encontrar el índice de esta canción
-                                st.session_state.current_index = next(
-                                    (i for i, song in enumerate(st.session_state.playlist) if song['id'] == result['id']), 
-                                    0
-                                )
+                                st.session_state.current_index = st.session_state.playlist.index_of(result.id)
                                 with st.spinner("Cargando audio..."):
-                                    audio_url = get_audio_url(result['id'])
+                                    audio_url = get_audio_url(result.id)
                                     if audio_url:
                                         st.session_state.current_audio_url = audio_url
-                                        st.session_state.current_title = result['title']
-                                        st.session_state.song_duration = result.get('duration', 0)
+                                        st.session_state.current_title = result.title
+                                        st.session_state.song_duration = result.duration
                                         st.session_state.start_time = None
                                         st.rerun()
                         
                         with col_add:
-                            if st.button(f"➕ Agregar", key=f"add_{result['id']}", use_container_width=True):
+                            if st.button(f"➕ Agregar", key=f"add_{result.id}", use_container_width=True):
                                 if add_to_playlist(result):
                                     st.success("✅ Agregada a la lista")
                                     # NO hacer rerun para no interrumpir la reproducción
@@ -669,6 +1495,17 @@ if st.session_state.search_results:
                                     st.info("⚠️ Ya está en la lista")
                         
                         st.markdown("---")
+    
+    # Cargar la siguiente página reutilizando los resultados ya obtenidos
+    loaded = len(results)
+    if st.session_state.search_source == 'youtube' and has_more_results(st.session_state.search_query, loaded):
+        if st.button("⬇️ Cargar más resultados", key="load_more_results", use_container_width=True):
+            with st.spinner("Cargando más resultados..."):
+                st.session_state.search_results = search_music(
+                    st.session_state.search_query,
+                    loaded + num_results
+                )
+            st.rerun()
 else:
     # Mensaje cuando no hay resultados de búsqueda
     if st.session_state.current_audio_url:
@@ -702,3 +1539,6 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# Los reruns que terminan con st.rerun() no llegan hasta aquí; se mide el que los sigue
+record_timing('rerun', time.perf_counter() - RERUN_STARTED)
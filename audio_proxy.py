@@ -0,0 +1,307 @@
+"""Proxy de audio con soporte de Range y caché de bloques en disco
+
+El reproductor pide `/audio/<video_id>` al backend en lugar de la URL firmada de
+googlevideo. El proxy resuelve (y vuelve a resolver cuando caduca) la URL de
+origen, pide al CDN sólo los bloques que le faltan con una sesión HTTP
+reutilizable y guarda cada bloque en disco para servir los saltos y las
+repeticiones localmente.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_MAX_BYTES = 1024 ** 3
+# Bloques consecutivos que se piden al CDN en una sola petición
+DEFAULT_MAX_RUN = 8
+
+VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)')
+
+
+def parse_range(header, size):
+    """(inicio, fin) inclusivos de una cabecera Range, o None si no es satisfacible"""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: los últimos N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+class UpstreamError(Exception):
+    """El CDN respondió con un error que no se resolvió al renovar la URL"""
+
+
+class RangeCache:
+    """Bloques de tamaño fijo por video en `<raíz>/<video_id>/<n>`, con expulsión LRU por video"""
+
+    def __init__(self, root, block_size=DEFAULT_BLOCK_SIZE, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._videos = OrderedDict()  # video_id -> bytes en disco, de menos a más reciente
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for video_id in os.listdir(self.root):
+            video_dir = os.path.join(self.root, video_id)
+            if not os.path.isdir(video_dir):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(video_dir, name))
+                for name in os.listdir(video_dir) if name.isdigit()
+            )
+            found.append((os.path.getmtime(video_dir), video_id, size))
+        for _, video_id, size in sorted(found):
+            self._videos[video_id] = size
+            self.total_bytes += size
+
+    def _video_dir(self, video_id):
+        return os.path.join(self.root, video_id)
+
+    def meta(self, video_id):
+        try:
+            with open(os.path.join(self._video_dir(video_id), 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set_meta(self, video_id, size, content_type):
+        video_dir = self._video_dir(video_id)
+        os.makedirs(video_dir, exist_ok=True)
+        tmp = os.path.join(video_dir, f".meta-{uuid.uuid4().hex}")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'content_type': content_type, 'block_size': self.block_size}, f)
+        os.replace(tmp, os.path.join(video_dir, 'meta.json'))
+
+    def has_block(self, video_id, index):
+        return os.path.exists(os.path.join(self._video_dir(video_id), str(index)))
+
+    def read_block(self, video_id, index):
+        try:
+            with open(os.path.join(self._video_dir(video_id), str(index)), 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if video_id in self._videos:
+                self._videos.move_to_end(video_id)
+        return data
+
+    def write_block(self, video_id, index, data):
+        video_dir = self._video_dir(video_id)
+        os.makedirs(video_dir, exist_ok=True)
+        tmp = os.path.join(video_dir, f".{index}-{uuid.uuid4().hex}")
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(video_dir, str(index)))
+        with self._lock:
+            self._videos[video_id] = self._videos.get(video_id, 0) + len(data)
+            self._videos.move_to_end(video_id)
+            self.total_bytes += len(data)
+            self._evict(keep=video_id)
+
+    def drop(self, video_id):
+        """Descarta los bloques de un video (p.ej. si cambió el tamaño en el origen)"""
+        with self._lock:
+            self.total_bytes -= self._videos.pop(video_id, 0)
+        shutil.rmtree(self._video_dir(video_id), ignore_errors=True)
+
+    def _evict(self, keep):
+        # Llamar con self._lock tomado
+        while self.total_bytes > self.max_bytes and len(self._videos) > 1:
+            video_id = next(iter(self._videos))
+            if video_id == keep:
+                self._videos.move_to_end(video_id)
+                continue
+            self.total_bytes -= self._videos.pop(video_id)
+            shutil.rmtree(self._video_dir(video_id), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'videos': len(self._videos),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'block_hits': self.hits,
+                'block_misses': self.misses,
+            }
+
+
+def total_size(response):
+    """Tamaño total del archivo según Content-Range (206) o Content-Length (200), o None"""
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+        return int(content_range.rsplit('/', 1)[1])
+    if response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+        return int(response.headers['Content-Length'])
+    return None
+
+
+class AudioProxy:
+    """Sirve rangos de bytes de un video desde la caché de bloques o desde el CDN
+
+    `resolve(video_id)` devuelve (url, cabeceras_http) de la fuente de audio;
+    las URLs se guardan en `url_cache` y se renuevan solas si el CDN responde 403/404/410.
+    """
+
+    def __init__(self, resolve, cache, url_cache, max_run=DEFAULT_MAX_RUN, pool_size=16, timeout=15):
+        self._resolve = resolve
+        self.cache = cache
+        self.url_cache = url_cache
+        self.max_run = max_run
+        self.timeout = timeout
+        self._headers = {}  # video_id -> cabeceras HTTP para el CDN
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self.resolves = 0
+        self.stale = 0
+
+    def _source(self, video_id, refresh=False):
+        url = None if refresh else self.url_cache.get(video_id)
+        if url is None:
+            try:
+                url, headers = self._resolve(video_id)
+            except Exception:
+                # Si no se puede resolver (p.ej. YouTube limita), la URL anterior sirve mientras no caduque
+                stale = None if refresh else self.url_cache.stale(video_id)
+                if stale is None:
+                    raise
+                self.stale += 1
+                return stale, self._headers.get(video_id, {})
+            self.resolves += 1
+            self.url_cache.put(video_id, url)
+            self._headers[video_id] = headers or {}
+        return url, self._headers.get(video_id, {})
+
+    def source(self, video_id):
+        """(URL, cabeceras HTTP) vigentes del audio; sólo se resuelve si no está en la caché"""
+        return self._source(video_id)
+
+    def _upstream(self, video_id, start, end):
+        """GET con Range al CDN; si la URL caducó se resuelve de nuevo una vez
+
+        Un 200 (el CDN ignoró el Range y manda el archivo entero) sólo vale si se pidió desde
+        el byte 0; a partir de ahí los bytes no corresponderían a los bloques pedidos.
+        """
+        for refresh in (False, True):
+            url, headers = self._source(video_id, refresh)
+            response = self._session.get(
+                url,
+                headers=dict(headers, Range=f"bytes={start}-{end}"),
+                stream=True,
+                timeout=self.timeout
+            )
+            if response.status_code in (403, 404, 410) and not refresh:
+                response.close()
+                self.url_cache.invalidate(video_id)
+                continue
+            if response.status_code != 206 and not (response.status_code == 200 and start == 0):
+                response.close()
+                raise UpstreamError(f"El CDN respondió {response.status_code}")
+            # Una URL nueva puede apuntar a otro archivo: si el tamaño cambió, los bloques guardados no valen
+            meta = self.cache.meta(video_id)
+            if meta and total_size(response) not in (None, meta['size']):
+                response.close()
+                self.cache.drop(video_id)
+                raise UpstreamError("El tamaño del audio cambió en el origen")
+            return response
+        raise UpstreamError("No se pudo obtener una URL válida")
+
+    def content_info(self, video_id):
+        """(tamaño total, tipo MIME) del audio; la primera vez también guarda el bloque 0"""
+        meta = self.cache.meta(video_id)
+        if meta and meta.get('block_size') == self.cache.block_size:
+            return meta['size'], meta['content_type']
+        if meta:
+            self.cache.drop(video_id)
+        response = self._upstream(video_id, 0, self.cache.block_size - 1)
+        with response:
+            size = total_size(response) or 0
+            content_type = response.headers.get('Content-Type', 'audio/mp4')
+            data = response.raw.read(self.cache.block_size, decode_content=True)
+        self.cache.set_meta(video_id, size, content_type)
+        if len(data) == min(self.cache.block_size, size):
+            self.cache.write_block(video_id, 0, data)
+        return size, content_type
+
+    def warm(self, video_id):
+        """Resuelve la URL y descarga el primer bloque para que el arranque sea inmediato"""
+        return self.content_info(video_id)
+
+    def _fetch_blocks(self, video_id, first, last, size):
+        """Pide al CDN los bloques first..last en una sola petición y los va guardando"""
+        block_size = self.cache.block_size
+        response = self._upstream(video_id, first * block_size, min((last + 1) * block_size, size) - 1)
+        with response:
+            index = first
+            buffer = b''
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                buffer += chunk
+                while len(buffer) >= block_size and index <= last:
+                    block, buffer = buffer[:block_size], buffer[block_size:]
+                    self.cache.write_block(video_id, index, block)
+                    yield index, block
+                    index += 1
+                if index > last:
+                    # Con un 200 llega el archivo entero: lo que sigue no se pidió
+                    break
+            if buffer and index <= last:
+                # Un bloque corto sólo es válido si es el último del archivo; si no, la lectura se cortó
+                if index * block_size + len(buffer) != size:
+                    raise UpstreamError(f"El CDN cortó el bloque {index}")
+                self.cache.write_block(video_id, index, buffer)
+                yield index, buffer
+
+    def iter_range(self, video_id, start, end, size):
+        """Generador de los bytes start..end (inclusivos) del audio"""
+        block_size = self.cache.block_size
+        first, last = start // block_size, end // block_size
+        index = first
+        while index <= last:
+            data = self.cache.read_block(video_id, index)
+            if data is not None:
+                blocks = [(index, data)]
+            else:
+                run_end = index
+                while (run_end < last and run_end - index + 1 < self.max_run
+                       and not self.cache.has_block(video_id, run_end + 1)):
+                    run_end += 1
+                blocks = self._fetch_blocks(video_id, index, run_end, size)
+            previous = index
+            for block_index, data in blocks:
+                lo = start - block_index * block_size if block_index == first else 0
+                hi = end - block_index * block_size + 1 if block_index == last else len(data)
+                yield data[lo:hi]
+                index = block_index + 1
+            if index == previous:
+                raise UpstreamError(f"El CDN no devolvió el bloque {index}")
+
+    def stats(self):
+        return dict(self.cache.stats(), resolves=self.resolves)
@@ -1,44 +1,537 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Response, request, send_file, jsonify, url_for, g
 import os
+import time
+import glob
+import shutil
+import threading
+import multiprocessing
+import mimetypes
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+from jobs import JobQueue, QueueFullError, DONE, ERROR
+from transcode_cache import TranscodeCache
+from transcode import (
+    NATIVE_FORMATS, ORIGINAL, STREAM_FORMATS, can_passthrough, ffmpeg_binary, ffprobe_binary,
+    prepare_audio, prepend, probe, source_codec, stream_transcode
+)
+from audio_proxy import AudioProxy, RangeCache, VIDEO_ID_RE, parse_range
+from url_cache import UrlCache
+from extractors import ExtractorPool
+from batch_transcode import PASSTHROUGH_BITRATE, BatchExporter, init_worker
+from metrics import CONTENT_TYPE, Registry, cache_rows, resolver_rows
+from resolver import CircuitBreaker, Resolver
+from thumbnails import DEFAULT_WIDTH, ThumbnailProxy, pick_format
+from loudness import PEAK_COUNT, LoudnessAnalyzer
 
 app = Flask(__name__)
 
+# Descargas/conversiones simultáneas y trabajos que pueden esperar en cola
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 2))
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", 50))
+# Segundos que /download espera al trabajo antes de responder con 202
+DOWNLOAD_WAIT_TIMEOUT = int(os.environ.get("DOWNLOAD_WAIT_TIMEOUT", 25))
+# Caché de audios convertidos
+TRANSCODE_CACHE_DIR = os.environ.get("TRANSCODE_CACHE_DIR", "downloads")
+TRANSCODE_CACHE_MAX_MB = int(os.environ.get("TRANSCODE_CACHE_MAX_MB", 2048))
+# Caché de bloques del proxy de audio (/audio/<video_id>)
+AUDIO_PROXY_DIR = os.environ.get("AUDIO_PROXY_DIR", "audio_cache")
+AUDIO_PROXY_MAX_MB = int(os.environ.get("AUDIO_PROXY_MAX_MB", 1024))
+# Mismo formato que prefiere el reproductor: m4a es compatible con iOS
+PLAYBACK_FORMAT = 'bestaudio[ext=m4a]/bestaudio/best'
+
+# Formatos de salida y su tipo MIME
+AUDIO_CODECS = {codec: mimetype for codec, (_, _, _, mimetype) in STREAM_FORMATS.items()}
+# Sin codec se entrega el audio de origen sin recodificar; mp3 (con pérdida) sólo si se pide
+DEFAULT_CODEC = ORIGINAL
+DEFAULT_BITRATE = '192'
+FFMPEG_LOCATION = 'ffmpeg'
+FFMPEG_BINARY = ffmpeg_binary(FFMPEG_LOCATION)
+FFPROBE_BINARY = ffprobe_binary(FFMPEG_LOCATION)
+COOKIES_PATH = os.path.join(os.path.dirname(__file__), 'cookies.txt')
+# Instancias de YoutubeDL reutilizables por perfil de opciones
+EXTRACTOR_POOL_SIZE = int(os.environ.get("EXTRACTOR_POOL_SIZE", 4))
+# Resoluciones de URLs con yt-dlp: simultáneas, segundos por intento, reintentos y circuito (como en la app)
+EXTRACT_CONCURRENCY = int(os.environ.get("EXTRACT_CONCURRENCY", 4))
+EXTRACT_TIMEOUT = float(os.environ.get("EXTRACT_TIMEOUT", 20))
+EXTRACT_RETRIES = int(os.environ.get("EXTRACT_RETRIES", 2))
+BREAKER_THRESHOLD = int(os.environ.get("BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", 30))
+# Procesos para exportar listas (/batch) y canciones por exportación
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", os.cpu_count() or 2))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 200))
+# Miniaturas reducidas (/thumbnail/<video_id>) y cuánto pueden guardarlas navegadores y CDNs
+THUMBNAIL_CACHE_DIR = os.environ.get("THUMBNAIL_CACHE_DIR", "thumbnail_cache")
+THUMBNAIL_CACHE_MAX_MB = int(os.environ.get("THUMBNAIL_CACHE_MAX_MB", 256))
+THUMBNAIL_MAX_AGE = 30 * 24 * 3600
+# Análisis de sonoridad por video (/loudness/<video_id>) y valores de la forma de onda (0 = sin forma de onda)
+LOUDNESS_STORE = os.environ.get("LOUDNESS_STORE", os.path.join(TRANSCODE_CACHE_DIR, "loudness.json"))
+LOUDNESS_PEAKS = int(os.environ.get("LOUDNESS_PEAKS", PEAK_COUNT))
+LOUDNESS_WORKERS = int(os.environ.get("LOUDNESS_WORKERS", 1))
+
+metrics = Registry('mymusic_backend_')
+request_seconds = metrics.histogram('http_request_duration_seconds', 'Tiempo hasta la respuesta (en streaming, hasta el primer byte)')
+phase_seconds = metrics.histogram('phase_duration_seconds', 'Duración de cada fase de descargas y conversiones')
+
+transcode_cache = TranscodeCache(TRANSCODE_CACHE_DIR, max_bytes=TRANSCODE_CACHE_MAX_MB * 1024 * 1024)
+extractor_pool = ExtractorPool(size=EXTRACTOR_POOL_SIZE)
+resolver = Resolver(
+    max_concurrency=EXTRACT_CONCURRENCY, timeout=EXTRACT_TIMEOUT, retries=EXTRACT_RETRIES,
+    breaker=CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET)
+)
+thumbnail_proxy = ThumbnailProxy(TranscodeCache(THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_MB * 1024 * 1024))
+loudness = LoudnessAnalyzer(LOUDNESS_STORE, peaks=LOUDNESS_PEAKS, ffmpeg=FFMPEG_BINARY, max_workers=LOUDNESS_WORKERS)
+
+def extractor_options(options):
+    """Opciones comunes de YoutubeDL: silencioso, sin listas y con cookies.txt si existe"""
+    options = dict(options, quiet=True, noplaylist=True, socket_timeout=EXTRACT_TIMEOUT)
+    if os.path.exists(COOKIES_PATH):
+        options['cookiefile'] = COOKIES_PATH
+    return options
+
+def extractor_profile(name, options):
+    """Registra (una vez) un perfil de YoutubeDL con las cookies si existen y devuelve su nombre"""
+    if not extractor_pool.has_profile(name):
+        extractor_pool.register(name, extractor_options(options))
+    return name
+
+def audio_params(source):
+    """Lee codec y bitrate de la petición; lanza ValueError si no son válidos"""
+    codec = (source.get('codec') or DEFAULT_CODEC).lower()
+    if codec == ORIGINAL:
+        return codec, PASSTHROUGH_BITRATE
+    bitrate = str(source.get('bitrate') or DEFAULT_BITRATE).lower().rstrip('k')
+    if codec not in AUDIO_CODECS:
+        raise ValueError(f"Codec no soportado: {codec}")
+    if not bitrate.isdigit() or not 32 <= int(bitrate) <= 320:
+        raise ValueError(f"Bitrate no válido: {bitrate}")
+    return codec, bitrate
+
+def source_format(codec):
+    """Formato de yt-dlp a descargar: el que permita copiar el audio sin recodificar"""
+    if codec in (ORIGINAL, 'm4a', 'aac'):
+        return PLAYBACK_FORMAT
+    if codec in ('opus', 'vorbis'):
+        return f'bestaudio[acodec={codec}]/bestaudio/best'
+    return 'bestaudio/best'
+
+def cached_audio(video_id, codec, bitrate):
+    """Archivo en caché para la petición; una copia sin recodificar sirve para cualquier bitrate"""
+    return transcode_cache.get(video_id, codec, PASSTHROUGH_BITRATE) or (
+        transcode_cache.get(video_id, codec, bitrate) if bitrate != PASSTHROUGH_BITRATE else None
+    )
+
+def download_audio(job):
+    """Descarga el audio del video y lo deja en el formato pedido; devuelve la ruta en caché
+
+    Sólo se recodifica si el codec de origen (según ffprobe) no es el pedido;
+    si no, se copia el audio y a lo sumo se cambia el contenedor.
+    """
+    codec, bitrate = job.params['codec'], job.params['bitrate']
+    cached = cached_audio(job.video_id, codec, bitrate)
+    if cached:
+        return cached
+    audio_format = source_format(codec)
+    profile = extractor_profile(f'download:{audio_format}', {
+        'format': audio_format,
+        # Nombrar por id: los títulos con caracteres especiales se sanean y no se encontraban
+        'outtmpl': '%(id)s.%(ext)s',
+    })
+    work_dir = transcode_cache.temp_dir()
+    url = f'https://www.youtube.com/watch?v={job.video_id}'
+    try:
+        with phase_seconds.time(operation='download', phase='download'), extractor_pool.borrow(
+            profile,
+            progress_hook=job.progress_hook,
+            postprocessor_hook=job.postprocessor_hook,
+            params={'paths': {'home': work_dir}}
+        ) as ydl:
+            info = ydl.extract_info(url, download=True)
+        outputs = [d.get('filepath') for d in info.get('requested_downloads') or []]
+        outputs = [path for path in outputs if path and os.path.exists(path)]
+        if not outputs:
+            outputs = [path for path in glob.glob(os.path.join(work_dir, '*')) if not path.endswith('.part')]
+        if not outputs:
+            raise FileNotFoundError(f'No se pudo encontrar el archivo {codec}')
+        with phase_seconds.time(operation='download', phase='transcode'):
+            path, audio_format, copied = prepare_audio(
+                outputs[0], os.path.join(work_dir, f'{job.video_id}-{codec}'), codec, bitrate,
+                info.get('acodec'), True, FFMPEG_BINARY, FFPROBE_BINARY
+            )
+        path = transcode_cache.put(
+            job.video_id, codec, PASSTHROUGH_BITRATE if copied else bitrate, path,
+            {'title': info.get('title', job.video_id), 'format': audio_format}
+        )
+        analyze_later(job.video_id, path)
+        return path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def resolve_source(video_id, audio_format='bestaudio/best'):
+    """URL directa del mejor audio, cabeceras HTTP para pedirlo e info del video"""
+    profile = extractor_profile(f'source:{audio_format}', {'format': audio_format})
+    info = resolver.call(
+        'resolve',
+        lambda: extractor_pool.extract_info(profile, f'https://www.youtube.com/watch?v={video_id}', download=False)
+    )
+    return info['url'], info.get('http_headers') or {}, info
+
+def analyze_later(video_id, path=None):
+    """Programa (una vez por video) el análisis de sonoridad, sin retrasar la respuesta
+
+    Se analiza `path` si se indica, si no el audio original en caché o, en último
+    caso, el de YouTube a través del proxy de audio.
+    """
+    def source():
+        cached = path if path and os.path.exists(path) else cached_audio(video_id, ORIGINAL, PASSTHROUGH_BITRATE)
+        return (cached, None) if cached else audio_proxy.source(video_id)
+    return loudness.submit(video_id, source, retry=path is not None)
+
+download_queue = JobQueue(download_audio, max_workers=DOWNLOAD_WORKERS, max_pending=MAX_PENDING_JOBS)
+audio_proxy = AudioProxy(
+    lambda video_id: resolve_source(video_id, PLAYBACK_FORMAT)[:2],
+    RangeCache(AUDIO_PROXY_DIR, max_bytes=AUDIO_PROXY_MAX_MB * 1024 * 1024),
+    UrlCache()
+)
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """Pool de procesos de /batch, creado con la primera exportación"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            # spawn: hacer fork de un servidor con hilos puede heredar locks tomados
+            _batch_executor = ProcessPoolExecutor(
+                max_workers=BATCH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(extractor_options({'ffmpeg_location': FFMPEG_LOCATION}), FFMPEG_BINARY, FFPROBE_BINARY)
+            )
+        return _batch_executor
+
+batch_exporter = BatchExporter(get_batch_executor, transcode_cache, on_store=analyze_later)
+
+@metrics.collector
+def component_stats():
+    """Contadores que ya llevan las cachés, colas y pools, leídos al exportar"""
+    rows = cache_rows('transcode', transcode_cache.stats())
+    blocks = audio_proxy.cache.stats()
+    rows += cache_rows('audio_blocks', dict(blocks, hits=blocks['block_hits'], misses=blocks['block_misses'], entries=blocks['videos']))
+    rows += cache_rows('audio_url', audio_proxy.url_cache.stats())
+    thumbnail_stats = thumbnail_proxy.stats()
+    rows += cache_rows('thumbnails', thumbnail_stats)
+    rows.append(('thumbnail_original_bytes_total', 'counter', 'Bytes de miniaturas descargados de YouTube', thumbnail_stats['original_bytes'], {}))
+    rows.append(('thumbnail_resized_bytes_total', 'counter', 'Bytes de las miniaturas reducidas', thumbnail_stats['resized_bytes'], {}))
+    rows.append(('audio_url_resolves_total', 'counter', 'URLs de audio resueltas con yt-dlp', audio_proxy.resolves, {}))
+    rows.append(('audio_url_stale_total', 'counter', 'URLs de audio anteriores servidas porque no se pudo resolver una nueva', audio_proxy.stale, {}))
+    for status, count in download_queue.stats().items():
+        rows.append(('jobs', 'gauge', 'Trabajos de descarga por estado', count, {'status': status}))
+    pool = extractor_pool.stats()
+    rows += resolver_rows(resolver.stats())
+    rows.append(('extractor_instances', 'gauge', 'Instancias de YoutubeDL creadas', pool['instances'], {}))
+    rows.append(('extractor_borrows_total', 'counter', 'Préstamos de instancias de YoutubeDL', pool['borrows'], {}))
+    loudness_stats = loudness.stats()
+    rows.append(('loudness_entries', 'gauge', 'Videos con sonoridad analizada', loudness_stats['entries'], {}))
+    rows.append(('loudness_pending', 'gauge', 'Análisis de sonoridad en curso o en cola', loudness_stats['pending'], {}))
+    rows.append(('loudness_analyses_total', 'counter', 'Análisis de sonoridad terminados', loudness_stats['analyzed'], {'result': 'ok'}))
+    rows.append(('loudness_analyses_total', 'counter', 'Análisis de sonoridad terminados', loudness_stats['failed'], {'result': 'error'}))
+    rows.append(('loudness_analysis_seconds_total', 'counter', 'Tiempo de ffmpeg dedicado a analizar sonoridad', loudness_stats['seconds'], {}))
+    for name, value in batch_exporter.stats().items():
+        rows.append((f'batch_{name}_total', 'counter', f'Exportaciones de listas: {name}', value, {}))
+    return rows
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # La regla (/jobs/<job_id>) y no la ruta concreta, para no crear una serie por trabajo
+        endpoint = request.url_rule.rule if request.url_rule else 'desconocido'
+        request_seconds.observe(
+            time.perf_counter() - started,
+            endpoint=endpoint, method=request.method, status=str(response.status_code)
+        )
+    return response
+
+def job_response(job, status_code=200):
+    """Estado del trabajo en JSON con los enlaces para consultarlo y descargarlo"""
+    data = job.to_dict()
+    data['status_url'] = url_for('job_status', job_id=job.id)
+    data['result_url'] = url_for('job_result', job_id=job.id)
+    response = jsonify(data)
+    response.status_code = status_code
+    if status_code == 202:
+        response.headers['Location'] = data['status_url']
+    return response
+
+def submit_download(video_id, codec, bitrate):
+    """Encola (o reutiliza) el trabajo de descarga de un video en un formato"""
+    return download_queue.submit((video_id, codec, bitrate), video_id, {'codec': codec, 'bitrate': bitrate})
+
+def send_audio(path):
+    """Envía un archivo de la caché con un nombre legible"""
+    meta = transcode_cache.metadata(path)
+    audio_format = meta.get('format') or meta.get('codec')
+    ext = os.path.splitext(path)[1]
+    return send_file(
+        path,
+        mimetype=AUDIO_CODECS.get(audio_format) or mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        as_attachment=True,
+        download_name=f"{meta.get('title') or meta.get('video_id', 'audio')}{ext}"
+    )
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    payload = request.get_json(silent=True) or request.form
+    video_id = payload.get('video_id') or request.args.get('video_id')
+    if not video_id:
+        return jsonify({'error': 'Missing video_id'}), 400
+    if not isinstance(video_id, str) or not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    try:
+        codec, bitrate = audio_params(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        job = submit_download(video_id, codec, bitrate)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    return job_response(job, 202)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = download_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return job_response(job)
+
+@app.route('/jobs/<job_id>/file', methods=['GET'])
+def job_result(job_id):
+    job = download_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if job.status == ERROR:
+        return jsonify({'error': job.error}), 500
+    if job.status != DONE:
+        return job_response(job, 409)
+    return send_audio(job.filename)
+
 @app.route('/download', methods=['GET'])
 def download():
-    import yt_dlp
+    """Compatibilidad: espera un tiempo acotado al trabajo y devuelve el audio o su estado
+
+    Sin `codec` se entrega el audio original (sólo remux); `codec=mp3` recodifica.
+    """
     video_id = request.args.get('video_id')
     if not video_id:
         return jsonify({'error': 'Missing video_id'}), 400
-    output_dir = 'downloads'
-    os.makedirs(output_dir, exist_ok=True)
-    output_template = os.path.join(output_dir, '%(title)s.%(ext)s')
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': output_template,
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        'ffmpeg_location': 'ffmpeg',
-        'quiet': True,
-        'noplaylist': True,
-    }
-    # Usar cookies.txt si existe
-    cookies_path = os.path.join(os.path.dirname(__file__), 'cookies.txt')
-    if os.path.exists(cookies_path):
-        ydl_opts['cookiefile'] = cookies_path
-    url = f'https://www.youtube.com/watch?v={video_id}'
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', video_id)
-            mp3_filename = os.path.join(output_dir, f"{title}.mp3")
-            if not os.path.exists(mp3_filename):
-                return jsonify({'error': 'No se pudo encontrar el archivo mp3'}), 500
-            return send_file(mp3_filename, as_attachment=True)
+    if not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    try:
+        codec, bitrate = audio_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Si ya se convirtió antes, se sirve directamente desde disco
+    cached = cached_audio(video_id, codec, bitrate)
+    if cached:
+        return send_audio(cached)
+    try:
+        job = submit_download(video_id, codec, bitrate)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    job.done_event.wait(DOWNLOAD_WAIT_TIMEOUT)
+    if job.status == ERROR:
+        return jsonify({'error': job.error}), 500
+    if job.status != DONE:
+        return job_response(job, 202)
+    return send_audio(job.filename)
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """Convierte al vuelo: la salida de ffmpeg se envía en bloques mientras se produce"""
+    video_id = request.args.get('video_id')
+    if not video_id:
+        return jsonify({'error': 'Missing video_id'}), 400
+    if not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    try:
+        codec, bitrate = audio_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cached = cached_audio(video_id, codec, bitrate)
+    if cached:
+        return send_audio(cached)
+    try:
+        with phase_seconds.time(operation='stream', phase='extract'):
+            source_url, headers, info = resolve_source(video_id, source_format(codec))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    # yt-dlp ya informa el codec; si no, se consulta a ffprobe sobre la propia URL
+    detected = source_codec(info.get('acodec'))
+    if detected is None:
+        with phase_seconds.time(operation='stream', phase='probe'):
+            detected = (probe(source_url, FFPROBE_BINARY, headers) or {}).get('codec')
+    target = NATIVE_FORMATS.get(detected) if codec == ORIGINAL else codec
+    if target is None:
+        return jsonify({'error': f'No se puede copiar el codec de origen ({detected}); pide un codec concreto'}), 415
+    copy = codec == ORIGINAL or can_passthrough(codec, detected)
+    _, _, ext, mimetype = STREAM_FORMATS[target]
+    title = info.get('title', video_id)
+    # Lo que se envía también se guarda; si la conversión termina bien queda en la caché
+    work_dir = transcode_cache.temp_dir()
+    tee_path = os.path.join(work_dir, video_id + ext)
+
+    started = time.perf_counter()
+
+    def finish(ok):
+        phase_seconds.observe(time.perf_counter() - started, operation='stream', phase='transcode')
+        if ok:
+            path = transcode_cache.put(
+                video_id, codec, PASSTHROUGH_BITRATE if copy else bitrate, tee_path,
+                {'title': title, 'format': target}
+            )
+            analyze_later(video_id, path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    body = stream_transcode(source_url, target, bitrate, headers, FFMPEG_BINARY, tee_path, finish, copy)
+    # Se espera al primer bloque antes de responder: si ffmpeg falla sin producir nada,
+    # el cliente recibe un error en vez de un 200 con el cuerpo vacío
+    try:
+        first = next(body, b'')
+    except OSError as e:
+        # ffmpeg no arrancó: `finish` no llega a ejecutarse
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 502
+    if not first:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': 'ffmpeg no produjo audio'}), 502
+    response = Response(prepend(first, body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(title + ext)}"
+    # Evitar que un proxy intermedio acumule la respuesta completa
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Exporta una lista completa como zip; cada canción se convierte en un proceso del pool
+
+    JSON: {"video_ids": [...], "codec": "m4a", "bitrate": "192", "passthrough": true, "name": "Mi lista"}
+    Con passthrough, si el audio de YouTube ya está en el codec pedido sólo se cambia el contenedor.
+    """
+    payload = request.get_json(silent=True) or {}
+    video_ids = payload.get('video_ids')
+    if not isinstance(video_ids, list) or not video_ids:
+        return jsonify({'error': 'Missing video_ids'}), 400
+    if len(video_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Máximo {MAX_BATCH_SIZE} canciones por exportación'}), 400
+    if not all(isinstance(video_id, str) and VIDEO_ID_RE.match(video_id) for video_id in video_ids):
+        return jsonify({'error': 'video_id no válido'}), 400
+    try:
+        codec, bitrate = audio_params(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    passthrough = bool(payload.get('passthrough', True))
+    name = str(payload.get('name') or 'playlist')
+    body = batch_exporter.export(video_ids, codec, bitrate, passthrough)
+    response = Response(body, mimetype='application/zip')
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(name + '.zip')}"
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas en el formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/audio/<video_id>', methods=['GET', 'HEAD'])
+def audio(video_id):
+    """Proxy de reproducción con soporte de Range: los saltos se sirven desde la caché local"""
+    if not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    try:
+        size, content_type = audio_proxy.content_info(video_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+    range_header = request.headers.get('Range')
+    byte_range = parse_range(range_header, size)
+    if range_header and byte_range is None:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f"bytes */{size}"
+        return response
+    start, end = byte_range or (0, size - 1)
+    body = audio_proxy.iter_range(video_id, start, end, size) if request.method == 'GET' else b''
+    response = Response(body, status=206 if byte_range else 200, mimetype=content_type)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(end - start + 1)
+    if byte_range:
+        response.headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+@app.route('/thumbnail/<video_id>', methods=['GET'])
+def thumbnail(video_id):
+    """Miniatura reducida a `w` píxeles de ancho, en WebP si el navegador lo acepta"""
+    if not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    fmt = pick_format(request.args.get('format'), request.headers.get('Accept'))
+    try:
+        path, mimetype = thumbnail_proxy.get(video_id, request.args.get('w', DEFAULT_WIDTH), fmt)
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+    # El mtime cambia con cada acierto (orden LRU): ETag y fecha salen de la clave y de la creación
+    response = send_file(
+        os.path.abspath(path), mimetype=mimetype, max_age=THUMBNAIL_MAX_AGE, conditional=True,
+        etag=os.path.splitext(os.path.basename(path))[0],
+        last_modified=thumbnail_proxy.cache.metadata(path).get('created')
+    )
+    response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_MAX_AGE}, immutable'
+    # El formato depende de Accept salvo que se pida explícitamente
+    if 'format' not in request.args:
+        response.headers['Vary'] = 'Accept'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+@app.route('/loudness/<video_id>', methods=['GET'])
+def loudness_info(video_id):
+    """Sonoridad EBU R128 (LUFS, pico real, rango) y forma de onda del video
+
+    Si aún no se analizó responde 202 y lo programa (salvo con `analyze=0`).
+    """
+    if not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    analysis = loudness.get(video_id)
+    if analysis is None:
+        if request.args.get('analyze', '1') != '0':
+            analyze_later(video_id)
+        status = 'pending' if loudness.pending(video_id) else 'missing'
+        return jsonify({'video_id': video_id, 'status': status}), 202 if status == 'pending' else 404
+    response = jsonify(dict(analysis, video_id=video_id, status='done'))
+    # El análisis de un video no cambia
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+@app.route('/audio/<video_id>/warm', methods=['POST'])
+def warm_audio(video_id):
+    """Resuelve la URL y guarda el primer bloque antes de que el reproductor lo pida
+
+    También programa el análisis de sonoridad, que así suele estar listo antes de que suene.
+    """
+    if not VIDEO_ID_RE.match(video_id):
+        return jsonify({'error': 'video_id no válido'}), 400
+    try:
+        size, content_type = audio_proxy.warm(video_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 502
+    analyze_later(video_id)
+    return jsonify({'video_id': video_id, 'size': size, 'content_type': content_type})
 
 if __name__ == '__main__':
     try:
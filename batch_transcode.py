@@ -0,0 +1,219 @@
+"""Exportación de listas completas: descargas y conversiones en un pool de procesos
+
+Cada canción se descarga y convierte en un proceso aparte (yt-dlp y la
+preparación de ffmpeg usan CPU de Python, que en hilos se serializa con el
+GIL). El proceso principal sólo guarda los resultados en la caché de
+conversiones y los va escribiendo en un zip que se envía mientras se genera:
+la primera canción lista empieza a bajar sin esperar a las demás.
+"""
+import os
+import queue
+import re
+import shutil
+import threading
+import zipfile
+from concurrent.futures import CancelledError
+
+from extractors import ExtractorPool
+from transcode import STREAM_FORMATS, prepare_audio
+
+CHUNK_SIZE = 64 * 1024
+# "bitrate" con el que se guardan en la caché los audios copiados sin recodificar
+PASSTHROUGH_BITRATE = 'copy'
+
+# Estado de cada proceso del pool (lo crea init_worker)
+_pool = None
+_ffmpeg = 'ffmpeg'
+_ffprobe = 'ffprobe'
+
+
+def init_worker(options, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+    """Inicializador del pool: un YoutubeDL por proceso, reutilizado entre canciones"""
+    global _pool, _ffmpeg, _ffprobe
+    _ffmpeg, _ffprobe = ffmpeg, ffprobe
+    _pool = ExtractorPool(size=1)
+    _pool.register('batch', dict(options, format='bestaudio/best', outtmpl='%(id)s.%(ext)s'))
+
+
+def convert(video_id, codec, bitrate, work_dir, passthrough=True):
+    """Descarga el mejor audio de `video_id` en `work_dir` y lo deja en `codec`
+
+    Si `passthrough` y el audio de origen ya está en ese codec sólo se cambia el
+    contenedor. Se ejecuta dentro de un proceso del pool.
+    """
+    try:
+        return _convert(video_id, codec, bitrate, work_dir, passthrough)
+    except Exception as e:
+        # Las excepciones de yt-dlp llevan objetos que no se pueden enviar al proceso principal
+        raise RuntimeError(str(e)) from None
+
+
+def _convert(video_id, codec, bitrate, work_dir, passthrough):
+    with _pool.borrow('batch', params={'paths': {'home': work_dir}}) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+    sources = [d.get('filepath') for d in info.get('requested_downloads') or []]
+    sources = [path for path in sources if path and os.path.exists(path)]
+    if not sources:
+        raise FileNotFoundError(f"No se descargó el audio de {video_id}")
+    output, _, copy = prepare_audio(
+        sources[0], os.path.join(work_dir, f"{video_id}-{codec}"), codec, bitrate,
+        info.get('acodec'), passthrough, _ffmpeg, _ffprobe
+    )
+    return {'path': output, 'title': info.get('title') or video_id, 'passthrough': copy}
+
+
+def archive_name(position, title, ext, width):
+    """Nombre dentro del zip: posición en la lista y título sin caracteres problemáticos"""
+    title = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', title).strip(' .') or 'audio'
+    return f"{position + 1:0{width}d} - {title[:80]}{ext}"
+
+
+class _ChunkWriter:
+    """Archivo de sólo escritura y sin seek: zipfile escribe y el generador se lleva los bytes"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+class BatchExporter:
+    """Convierte varias canciones con un pool de procesos y las entrega como un zip en streaming
+
+    `get_executor()` devuelve el ProcessPoolExecutor (inicializado con
+    init_worker); `cache` es la TranscodeCache compartida con /download.
+    `on_store(video_id, ruta)` se llama con cada audio que entra en la caché.
+    """
+
+    def __init__(self, get_executor, cache, on_store=None):
+        self._get_executor = get_executor
+        self.cache = cache
+        self._on_store = on_store
+        self._lock = threading.Lock()
+        self.exports = 0
+        self.converted = 0
+        self.passthrough = 0
+        self.cache_hits = 0
+        self.failed = 0
+
+    def _cached(self, video_id, codec, bitrate, passthrough):
+        if passthrough:
+            path = self.cache.get(video_id, codec, PASSTHROUGH_BITRATE)
+            if path:
+                return path
+        return self.cache.get(video_id, codec, bitrate)
+
+    def _store(self, video_id, codec, bitrate, work_dir, future, done):
+        """Callback de cada conversión: pasa el resultado a la caché aunque el cliente ya no esté"""
+        path, error = None, None
+        try:
+            result = future.result()
+            key_bitrate = PASSTHROUGH_BITRATE if result['passthrough'] else bitrate
+            path = self.cache.put(video_id, codec, key_bitrate, result['path'], {'title': result['title']})
+            if self._on_store:
+                self._on_store(video_id, path)
+            with self._lock:
+                self.converted += 1
+                self.passthrough += result['passthrough']
+        except CancelledError as e:
+            error = e
+        except BaseException as e:
+            error = e
+            with self._lock:
+                self.failed += 1
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            done.put((video_id, path, error))
+
+    def _results(self, video_ids, codec, bitrate, passthrough):
+        """(posición, ruta, título, error) en el orden en que van quedando listas"""
+        pending = {}
+        for position, video_id in enumerate(video_ids):
+            path = self._cached(video_id, codec, bitrate, passthrough)
+            if path:
+                with self._lock:
+                    self.cache_hits += 1
+                yield position, path, self.cache.metadata(path).get('title') or video_id, None
+            else:
+                pending.setdefault(video_id, []).append(position)
+        if not pending:
+            return
+        executor = self._get_executor()
+        done = queue.Queue()
+        futures = []
+        for video_id in pending:
+            work_dir = self.cache.temp_dir()
+            future = executor.submit(convert, video_id, codec, bitrate, work_dir, passthrough)
+            # El callback corre en un hilo del pool (o aquí mismo si ya terminó)
+            future.add_done_callback(
+                lambda f, v=video_id, w=work_dir: self._store(v, codec, bitrate, w, f, done)
+            )
+            futures.append(future)
+        try:
+            for _ in futures:
+                video_id, path, error = done.get()
+                title = self.cache.metadata(path).get('title') if path else None
+                for position in pending[video_id]:
+                    yield position, path, title or video_id, error
+        finally:
+            # Cliente desconectado: lo que no empezó no se convierte
+            for future in futures:
+                future.cancel()
+
+    def export(self, video_ids, codec, bitrate, passthrough=True):
+        """Generador con los bytes del zip; las canciones que fallan se listan en errores.txt"""
+        with self._lock:
+            self.exports += 1
+        # Con ORIGINAL la extensión depende de cada canción
+        ext = STREAM_FORMATS[codec][2] if codec in STREAM_FORMATS else ''
+        width = len(str(len(video_ids)))
+        errors = []
+        out = _ChunkWriter()
+        # Audio ya comprimido: ZIP_STORED evita gastar CPU en deflate sin ganar espacio
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for position, path, title, error in self._results(video_ids, codec, bitrate, passthrough):
+                if error is not None:
+                    errors.append(f"{video_ids[position]}: {error}")
+                    continue
+                try:
+                    source = open(path, 'rb')
+                except OSError as e:
+                    # Expulsado de la caché entre la conversión y el envío
+                    errors.append(f"{video_ids[position]}: {e}")
+                    continue
+                with source, archive.open(archive_name(position, title, os.path.splitext(path)[1] or ext, width), 'w', force_zip64=True) as entry:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        yield out.take()
+                yield out.take()
+            if errors:
+                archive.writestr('errores.txt', '\n'.join(errors) + '\n')
+        yield out.take()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'exports': self.exports,
+                'converted': self.converted,
+                'passthrough': self.passthrough,
+                'cache_hits': self.cache_hits,
+                'failed': self.failed,
+            }
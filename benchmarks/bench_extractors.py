@@ -0,0 +1,56 @@
+"""Compara el costo por llamada de crear un YoutubeDL contra pedirlo prestado al pool
+
+No usa la red: mide la construcción de la instancia (registro de extractores,
+opciones, sesión HTTP) y la carga de los extractores de YouTube, que es lo que
+cada clic pagaba antes de la llamada a extract_info.
+
+    python benchmarks/bench_extractors.py [iteraciones]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from extractors import ExtractorPool
+
+OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': True,
+}
+
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def fresh_instance():
+    with yt_dlp.YoutubeDL(OPTIONS) as ydl:
+        ydl.get_info_extractor('Youtube')
+        ydl.get_info_extractor('YoutubeSearch')
+
+
+def main(iterations=50):
+    pool = ExtractorPool(size=1)
+    pool.register('search', OPTIONS)
+
+    def pooled_instance():
+        with pool.borrow('search') as ydl:
+            ydl.get_info_extractor('Youtube')
+            ydl.get_info_extractor('YoutubeSearch')
+
+    pooled_instance()  # la primera vez se construye, igual que en el primer rerun
+    fresh_ms = per_call(fresh_instance, iterations)
+    pooled_ms = per_call(pooled_instance, iterations)
+    print(f"YoutubeDL nuevo por llamada: {fresh_ms:8.3f} ms")
+    print(f"Instancia del pool:          {pooled_ms:8.3f} ms")
+    print(f"Ahorro por llamada:          {fresh_ms - pooled_ms:8.3f} ms ({fresh_ms / max(pooled_ms, 1e-9):.0f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
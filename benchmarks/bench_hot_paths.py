@@ -0,0 +1,152 @@
+"""Carga concurrente sobre los caminos calientes de la app y del backend, sin red
+
+Sustituye yt-dlp por `fakes.FakeYoutubeDL` (JSON fijo con latencia
+configurable) y el CDN de audio por `fakes.FakeCDN` en 127.0.0.1, e importa
+Mymusic.py en modo "bare" de Streamlit para llamar a sus funciones desde varios
+hilos. Cada escenario se mide en frío (ids o consultas nuevas) y, si tiene
+caché, en caliente. Informa p50/p95/p99 y peticiones por segundo.
+
+    python benchmarks/bench_hot_paths.py [--requests 200] [--concurrency 8] [--latency 0.05]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fakes
+from track import Track
+
+
+def percentile(sorted_values, q):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run(name, fn, items, concurrency):
+    """Llama a `fn(item)` para cada item con `concurrency` hilos e imprime la distribución"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def call(item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, items))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{name:<32} {len(latencies):5d} ok {len(errors):4d} err "
+        f"p50 {percentile(latencies, 50) * 1000:8.1f} ms  p95 {percentile(latencies, 95) * 1000:8.1f} ms  "
+        f"p99 {percentile(latencies, 99) * 1000:8.1f} ms  {len(latencies) / wall:8.1f} req/s"
+    )
+    if errors:
+        print(f"{'':<32} primer error: {errors[0]!r}")
+    return latencies, errors
+
+
+def load_app(tmp):
+    """Importa Mymusic y backend con sus datos en `tmp` (llamar después de fakes.install)"""
+    os.environ.update({
+        'PLAYLISTS_DB': os.path.join(tmp, 'playlists.db'),
+        'OFFLINE_LIBRARY_DIRS': os.path.join(tmp, 'library'),
+        'OFFLINE_INDEX': os.path.join(tmp, 'offline_library.json'),
+        'TRANSCODE_CACHE_DIR': os.path.join(tmp, 'downloads'),
+        'AUDIO_PROXY_DIR': os.path.join(tmp, 'audio_cache'),
+        'AUDIO_PROXY_URL': '',
+    })
+    os.chdir(tmp)
+    # Fuera de `streamlit run` cada llamada a Streamlit avisa que no hay ScriptRunContext;
+    # durante la importación Streamlit lee su configuración y restablece el nivel de sus loggers
+    logging.disable(logging.WARNING)
+    try:
+        import Mymusic
+        import backend
+    finally:
+        logging.disable(logging.NOTSET)
+    import streamlit.logger
+    streamlit.logger.set_log_level('error')
+    return Mymusic, backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='llamadas por escenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='hilos simultáneos')
+    parser.add_argument('--latency', type=float, default=fakes.EXTRACT_LATENCY, help='segundos por extract_info')
+    parser.add_argument('--cdn-latency', type=float, default=0.0, help='segundos antes de cada respuesta del CDN')
+    parser.add_argument('--audio-kb', type=int, default=fakes.AUDIO_SIZE // 1024, help='tamaño de cada audio')
+    args = parser.parse_args()
+
+    cdn = fakes.FakeCDN(size=args.audio_kb * 1024, latency=args.cdn_latency).start()
+    fake = fakes.install(cdn, latency=args.latency)
+    n, concurrency = args.requests, args.concurrency
+    with tempfile.TemporaryDirectory() as tmp:
+        app, backend = load_app(tmp)
+        print(f"{n} llamadas por escenario, {concurrency} hilos, extract_info {args.latency * 1000:.0f} ms, audio {args.audio_kb} KB")
+
+        # Búsquedas: consultas nuevas van a "YouTube"; repetidas salen de SearchCache
+        queries = [f"consulta {i}" for i in range(n)]
+        run("search_music (frío)", lambda q: app.search_music(q, 10), queries, concurrency)
+        run("search_music (caché)", lambda q: app.search_music(q, 10), queries, concurrency)
+
+        # Resolución de la URL de audio: ids nuevos llaman a extract_info; repetidos salen de UrlCache
+        video_ids = [fakes.fake_video_id(f"audio {i}") for i in range(n)]
+        run("get_audio_url (frío)", app.get_audio_url, video_ids, concurrency)
+        run("get_audio_url (caché)", app.get_audio_url, video_ids, concurrency)
+        # Varias sesiones piden a la vez los mismos videos: una sola llamada a extract_info por video
+        popular = [fakes.fake_video_id(f"popular {i % concurrency}") for i in range(n)]
+        calls = fake.calls
+        run("get_audio_url (mismo video)", app.get_audio_url, popular, concurrency)
+        print(f"{'':<32} {fake.calls - calls} llamadas a extract_info para {len(set(popular))} videos")
+
+        # Listas: escrituras concurrentes en SQLite y lectura completa
+        store = app.get_playlist_store()
+        songs = [Track(video_ids[i], title=f"Canción {i}", duration=180, uploader='Canal de prueba') for i in range(n)]
+        run("PlaylistStore.add_track", lambda i: store.add_track(f"Lista {i % 10}", songs[i]), range(n), concurrency)
+        run("load_playlists", lambda _: app.load_playlists(), range(n), concurrency)
+        # Índice local (FTS5) sobre las listas y las búsquedas anteriores: lo que se consulta al escribir
+        run("PlaylistStore.search", lambda i: store.search(f"canci {i}", 10), range(n), concurrency)
+
+        # Backend: /download en frío descarga del CDN falso; repetido se sirve desde TranscodeCache
+        clients = threading.local()
+
+        def download(video_id):
+            if not hasattr(clients, 'client'):
+                clients.client = backend.app.test_client()
+            response = clients.client.get('/download', query_string={'video_id': video_id, 'codec': 'original'})
+            body = response.get_data()
+            response.close()
+            if response.status_code != 200:
+                raise RuntimeError(f"{response.status_code}: {body[:200]!r}")
+
+        downloads = video_ids[:max(n // 4, 1)]
+        run("backend /download (frío)", download, downloads, concurrency)
+        run("backend /download (caché)", download, downloads, concurrency)
+
+        print(f"extract_info: {fake.calls} llamadas | CDN: {cdn.requests} peticiones")
+        cdn.stop()
+
+
+if __name__ == '__main__':
+    main()
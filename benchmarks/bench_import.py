@@ -0,0 +1,107 @@
+"""Importación de una lista de 500 videos: uno por uno contra PlaylistImporter
+
+No usa la red: un YoutubeDL falso devuelve la lista plana al instante y tarda
+`LATENCY` segundos en abrir cada video. Un tercio de las entradas llega sin
+autor, como pasa con algunas listas, y hay que completarlas.
+
+    python benchmarks/bench_import.py [canciones]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractors import ExtractorPool
+from playlist_import import PlaylistImporter
+from playlist_store import PlaylistStore
+from track import Track
+
+LATENCY = 0.02
+WORKERS = 8
+
+
+class FakeYoutubeDL:
+    """Imita extract_info de yt-dlp para una lista plana y para videos sueltos"""
+
+    def __init__(self, params):
+        self.params = params
+        self.count = 0
+
+    def extract_info(self, url, download=False, process=True):
+        if 'list=' in url:
+            return {
+                'title': 'Lista de prueba',
+                'entries': [
+                    {'id': f"video{i:05d}", 'title': f"Canción {i}", 'duration': 200 + i,
+                     'uploader': None if i % 3 == 0 else 'Autor', 'url': f"https://youtu.be/video{i:05d}"}
+                    for i in range(self.count)
+                ],
+            }
+        time.sleep(LATENCY)
+        return {'id': url.rsplit('=', 1)[1], 'uploader': 'Autor completado', 'view_count': 1000}
+
+
+def to_song(entry):
+    return Track(
+        entry['id'], title=entry.get('title'), url=entry.get('url'), duration=entry.get('duration'),
+        uploader=entry.get('uploader'), view_count=entry.get('view_count'),
+    )
+
+
+class CountingStore(PlaylistStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.writes = 0
+
+    def _transaction(self):
+        self.writes += 1
+        return super()._transaction()
+
+
+def make_pool(count):
+    def factory(params):
+        ydl = FakeYoutubeDL(params)
+        ydl.count = count
+        return ydl
+    pool = ExtractorPool(size=WORKERS, factory=factory)
+    pool.register('import', {'extract_flat': 'in_playlist'})
+    pool.register('metadata', {})
+    return pool
+
+
+def one_by_one(pool, store, url):
+    """Lo que costaba antes: abrir cada video incompleto y guardar canción por canción"""
+    importer = PlaylistImporter(pool, to_song)
+    _, entries = importer._flat_entries(url)
+    for entry in entries:
+        if entry.get('uploader') is None:
+            entry = importer._complete(entry)
+        store.add_track('uno por uno', to_song(entry))
+
+
+def main(count=500):
+    url = 'https://www.youtube.com/playlist?list=PLprueba'
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = make_pool(count)
+
+        store = CountingStore(os.path.join(tmp, 'serial.db'))
+        start = time.perf_counter()
+        one_by_one(pool, store, url)
+        serial_s, serial_writes = time.perf_counter() - start, store.writes
+
+        store = CountingStore(os.path.join(tmp, 'batch.db'))
+        start = time.perf_counter()
+        result = PlaylistImporter(pool, to_song, workers=WORKERS).run(url)
+        store.add_tracks(result.title, result.songs)
+        batch_s, batch_writes = time.perf_counter() - start, store.writes
+        assert len(store.get_tracks(result.title)) == count
+
+    print(f"{count} canciones, {count // 3 + 1} sin autor, {LATENCY * 1000:.0f} ms por video")
+    print(f"Uno por uno:      {serial_s:7.2f} s, {serial_writes} escrituras")
+    print(f"PlaylistImporter: {batch_s:7.2f} s, {batch_writes} escritura(s), {WORKERS} hilos")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,99 @@
+"""Comportamiento del resolver con YouTube sano, degradado y caído, sin red
+
+Usa `fakes.inject` para que una parte de las llamadas a extract_info falle con
+un 429 o se cuelgue, y mide con bench_hot_paths cuánto tardan get_audio_url y
+search_music en cada fase: la cola de latencia debe quedar acotada por
+EXTRACT_TIMEOUT y, con el circuito abierto, las llamadas deben fallar (o servir
+la URL o búsqueda de reserva) al instante en vez de acumularse.
+
+    python benchmarks/bench_resolver.py [--requests 100] [--concurrency 16] [--failure-rate 0.3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fakes
+from bench_hot_paths import load_app, run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='llamadas por fase')
+    parser.add_argument('--concurrency', type=int, default=16, help='hilos simultáneos')
+    parser.add_argument('--latency', type=float, default=fakes.EXTRACT_LATENCY, help='segundos por extract_info')
+    parser.add_argument('--failure-rate', type=float, default=0.3, help='fracción de llamadas con 429 en la fase degradada')
+    parser.add_argument('--hang-rate', type=float, default=0.1, help='fracción de llamadas colgadas en la fase degradada')
+    parser.add_argument('--timeout', type=float, default=1.0, help='EXTRACT_TIMEOUT del resolver')
+    parser.add_argument('--reset', type=float, default=2.0, help='BREAKER_RESET del resolver')
+    args = parser.parse_args()
+
+    # La configuración se lee al importar Mymusic
+    os.environ.update({
+        'EXTRACT_TIMEOUT': str(args.timeout),
+        'BREAKER_RESET': str(args.reset),
+        'SEARCH_CACHE_TTL': '1',
+    })
+    cdn = fakes.FakeCDN().start()
+    fake = fakes.install(cdn, latency=args.latency)
+    n, concurrency = args.requests, args.concurrency
+    with tempfile.TemporaryDirectory() as tmp:
+        app, _ = load_app(tmp)
+        resolver = app.get_resolver()
+        cache = app.get_url_cache()
+        print(
+            f"{n} llamadas por fase, {concurrency} hilos, extract_info {args.latency * 1000:.0f} ms, "
+            f"timeout {args.timeout:.1f} s, {app.EXTRACT_CONCURRENCY} llamadas a la vez"
+        )
+
+        def resolve(video_id):
+            if app.get_audio_url(video_id) is None:
+                raise RuntimeError(f"sin URL para {video_id}")
+
+        def search(query):
+            if not app.search_music(query, 10):
+                raise RuntimeError(f"sin resultados para {query!r}")
+
+        def ids(phase):
+            return [fakes.fake_video_id(f"{phase} {i}") for i in range(n)]
+
+        queries = [f"consulta {i}" for i in range(min(n, 20))]
+        run("get_audio_url (sano)", resolve, ids('sano'), concurrency)
+        run("search_music (sano)", search, queries, concurrency)
+
+        # Una parte falla con 429 y otra se cuelga más que EXTRACT_TIMEOUT
+        fakes.inject(args.failure_rate, args.hang_rate, hang_seconds=args.timeout * 5)
+        run("get_audio_url (degradado)", resolve, ids('degradado'), concurrency)
+        print(f"{'':<32} circuito {resolver.breaker.state}, {resolver.retried} reintentos")
+
+        # Caída total: URLs en caché a punto de caducar y búsquedas caducadas se sirven de reserva
+        fakes.inject(1.0)
+        fresh = resolver.breaker.opens
+        expiring = ids('reserva')
+        for video_id in expiring:
+            cache.put(video_id, cdn.url(video_id).split('?')[0] + f"?expire={int(time.time()) + 60}")
+        time.sleep(1.1)  # caducan las búsquedas de la fase sana (SEARCH_CACHE_TTL=1)
+        run("get_audio_url (caído)", resolve, ids('caido'), concurrency)
+        run("get_audio_url (caído, reserva)", resolve, expiring, concurrency)
+        run("search_music (caído, reserva)", search, queries, concurrency)
+        print(f"{'':<32} circuito {resolver.breaker.state}, abierto {resolver.breaker.opens - fresh} veces")
+
+        # Recuperación: pasado BREAKER_RESET una llamada de prueba cierra el circuito
+        fakes.inject()
+        time.sleep(args.reset)
+        run("get_audio_url (recuperado)", resolve, ids('recuperado'), concurrency)
+        print(f"{'':<32} circuito {resolver.breaker.state}")
+
+        stats = resolver.stats()
+        outcomes = ', '.join(f"{op}/{outcome} {count}" for (op, outcome), count in sorted(stats['outcomes'].items()))
+        print(f"extract_info: {fake.calls} llamadas, {fake.failures} fallos y {fake.hangs} cuelgues inyectados")
+        print(f"resolver: {outcomes}")
+        cdn.stop()
+
+
+if __name__ == '__main__':
+    main()
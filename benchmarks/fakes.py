@@ -0,0 +1,235 @@
+"""Dobles locales de yt-dlp y del CDN de audio para medir sin red
+
+`FakeYoutubeDL` responde búsquedas e info de videos con JSON fijo tras una
+latencia configurable, como haría YouTube; las URLs de audio apuntan a
+`FakeCDN`, un servidor HTTP en 127.0.0.1 que sirve bytes sintéticos con Range.
+`install()` reemplaza `yt_dlp.YoutubeDL`, así que ExtractorPool (y todo lo que
+lo usa) crea instancias falsas sin cambiar el código de la app. `inject()` hace
+que una parte de las llamadas falle (como un 429 de YouTube) o se cuelgue.
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from audio_proxy import parse_range
+
+# Segundos que tarda cada extract_info (búsqueda o info de un video)
+EXTRACT_LATENCY = 0.05
+# Tamaño del audio sintético: ~3 minutos a 128 kbps
+AUDIO_SIZE = 3 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+SEARCH_RE = re.compile(r'^ytsearch(\d*):(.*)$', re.S)
+WATCH_RE = re.compile(r'[?&]v=([A-Za-z0-9_-]+)')
+
+
+class FakeDownloadError(Exception):
+    """Error inyectado, con el texto que da yt-dlp cuando YouTube limita las peticiones"""
+
+
+def fake_video_id(seed):
+    """Id de 11 caracteres estable para una semilla (consulta + posición)"""
+    digest = hashlib.sha1(seed.encode('utf-8')).hexdigest()
+    return 'f' + digest[:10]
+
+
+class FakeCDN:
+    """Servidor HTTP local con un audio sintético por video; admite Range y HEAD"""
+
+    def __init__(self, size=AUDIO_SIZE, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.payload = bytes(range(256)) * (size // 256) + bytes(size % 256)
+        self.requests = 0
+        self._lock = threading.Lock()
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._send(body=False)
+
+            def do_GET(self):
+                self._send(body=True)
+
+            def _send(self, body):
+                with cdn._lock:
+                    cdn.requests += 1
+                if cdn.latency:
+                    time.sleep(cdn.latency)
+                byte_range = parse_range(self.headers.get('Range'), cdn.size)
+                start, end = byte_range or (0, cdn.size - 1)
+                self.send_response(206 if byte_range else 200)
+                self.send_header('Content-Type', 'audio/mp4')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                if byte_range:
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{cdn.size}")
+                self.end_headers()
+                if body:
+                    try:
+                        for offset in range(start, end + 1, CHUNK_SIZE):
+                            self.wfile.write(cdn.payload[offset:min(offset + CHUNK_SIZE, end + 1)])
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self, video_id):
+        # Con expire=, como las URLs firmadas de googlevideo que guarda UrlCache
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/videoplayback/{video_id}.m4a?expire={int(time.time()) + 6 * 3600}"
+
+
+class FakeYoutubeDL:
+    """Imita la parte de YoutubeDL que usa la app: extract_info con y sin descarga"""
+
+    latency = EXTRACT_LATENCY
+    cdn = None
+    calls = 0
+    # Fallos inyectados: fracción de llamadas que fallan y que se cuelgan `hang_seconds`
+    failure_rate = 0.0
+    hang_rate = 0.0
+    hang_seconds = 30.0
+    error_message = "ERROR: [youtube] HTTP Error 429: Too Many Requests"
+    failures = 0
+    hangs = 0
+    rng = random.Random(0)
+    _lock = threading.Lock()
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def extract_info(self, url, download=False, process=True):
+        with FakeYoutubeDL._lock:
+            FakeYoutubeDL.calls += 1
+        search = SEARCH_RE.match(url)
+        if search:
+            return self._search(int(search.group(1) or 1), search.group(2), process)
+        self._fault()
+        time.sleep(self.latency)
+        match = WATCH_RE.search(url)
+        if not match:
+            raise ValueError(f"URL no soportada por el doble de yt-dlp: {url}")
+        info = self._video(match.group(1))
+        if download:
+            info['requested_downloads'] = [{'filepath': self._download(info)}]
+        return info
+
+    def _fault(self):
+        """Aplica los fallos inyectados: lanza el error o espera `hang_seconds` antes de seguir"""
+        with FakeYoutubeDL._lock:
+            roll = FakeYoutubeDL.rng.random()
+            fail = roll < self.failure_rate
+            hang = not fail and roll < self.failure_rate + self.hang_rate
+            FakeYoutubeDL.failures += fail
+            FakeYoutubeDL.hangs += hang
+        if fail:
+            time.sleep(self.latency)
+            raise FakeDownloadError(self.error_message)
+        if hang:
+            time.sleep(self.hang_seconds)
+
+    def _search(self, count, query, process):
+        def entries():
+            # Como yt-dlp: la primera página (y sus fallos) llega al empezar a iterar
+            self._fault()
+            time.sleep(self.latency)
+            for position in range(count):
+                video_id = fake_video_id(f"{query}\0{position}")
+                yield {
+                    'id': video_id,
+                    'title': f"{query} ({position + 1})",
+                    'url': f"https://www.youtube.com/watch?v={video_id}",
+                    'duration': 180 + position,
+                    'uploader': 'Canal de prueba',
+                    'view_count': 1000 * (position + 1),
+                    'thumbnails': [{'url': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}],
+                }
+        # Con process=False yt-dlp devuelve un generador que pide las páginas al iterar
+        return {'title': query, 'entries': entries() if not process else list(entries())}
+
+    def _video(self, video_id):
+        audio_url = self.cdn.url(video_id)
+        return {
+            'id': video_id,
+            'title': f"Video {video_id}",
+            'duration': 180,
+            'uploader': 'Canal de prueba',
+            'view_count': 1000,
+            'ext': 'm4a',
+            'acodec': 'mp4a.40.2',
+            'url': audio_url,
+            'http_headers': {'User-Agent': 'fake'},
+            'formats': [
+                {'format_id': '251', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 160, 'url': audio_url},
+                {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 128, 'url': audio_url},
+            ],
+        }
+
+    def _download(self, info):
+        import requests
+
+        home = (self.params.get('paths') or {}).get('home') or '.'
+        filename = self.params.get('outtmpl', '%(id)s.%(ext)s') % {'id': info['id'], 'ext': info['ext']}
+        path = os.path.join(home, filename)
+        with requests.get(info['url'], stream=True, timeout=30) as response:
+            response.raise_for_status()
+            total = int(response.headers.get('Content-Length') or 0)
+            downloaded = 0
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    self._progress({'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': total})
+        self._progress({'status': 'finished', 'filename': path})
+        return path
+
+    def _progress(self, d):
+        for hook in self.params.get('progress_hooks') or []:
+            hook(d)
+
+
+def install(cdn, latency=EXTRACT_LATENCY):
+    """Sustituye yt_dlp.YoutubeDL por el doble; llamar antes de crear los ExtractorPool"""
+    import yt_dlp
+
+    FakeYoutubeDL.cdn = cdn
+    FakeYoutubeDL.latency = latency
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    return FakeYoutubeDL
+
+
+def inject(failure_rate=0.0, hang_rate=0.0, hang_seconds=30.0, seed=0):
+    """Cambia los fallos inyectados en las siguientes llamadas (0, 0 = sin fallos)"""
+    with FakeYoutubeDL._lock:
+        FakeYoutubeDL.failure_rate = failure_rate
+        FakeYoutubeDL.hang_rate = hang_rate
+        FakeYoutubeDL.hang_seconds = hang_seconds
+        FakeYoutubeDL.rng = random.Random(seed)
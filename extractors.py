@@ -0,0 +1,137 @@
+"""Pool de instancias de YoutubeDL reutilizables, una familia por perfil de opciones
+
+Construir un YoutubeDL (registro de extractores, opciones, sesión HTTP) cuesta
+decenas de milisegundos; aquí se crean una sola vez y se prestan en exclusiva
+a quien las use, así que cada instancia la usa un único hilo a la vez.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+
+DEFAULT_POOL_SIZE = 4
+
+_MISSING = object()
+
+
+class _Hooks:
+    """Hooks fijos de una instancia que reenvían a los del préstamo actual"""
+
+    def __init__(self):
+        self.progress = None
+        self.postprocessor = None
+
+    def on_progress(self, d):
+        if self.progress:
+            self.progress(d)
+
+    def on_postprocessor(self, d):
+        if self.postprocessor:
+            self.postprocessor(d)
+
+
+class ExtractorPool:
+    """Hasta `size` instancias de YoutubeDL por perfil, creadas bajo demanda"""
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, factory=None):
+        self.size = size
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._profiles = {}  # nombre -> opciones
+        self._idle = {}  # nombre -> LifoQueue de (ydl, hooks)
+        self._created = {}  # nombre -> instancias creadas
+        self.borrows = 0
+
+    def register(self, name, options):
+        """Declara un perfil; registrar dos veces el mismo nombre no hace nada"""
+        with self._lock:
+            if name not in self._profiles:
+                self._profiles[name] = dict(options)
+                self._idle[name] = queue.LifoQueue()
+                self._created[name] = 0
+
+    def has_profile(self, name):
+        with self._lock:
+            return name in self._profiles
+
+    def _create(self, name):
+        factory = self._factory
+        if factory is None:
+            import yt_dlp
+            factory = yt_dlp.YoutubeDL
+        hooks = _Hooks()
+        options = dict(self._profiles[name])
+        options['progress_hooks'] = [hooks.on_progress]
+        options['postprocessor_hooks'] = [hooks.on_postprocessor]
+        return factory(options), hooks
+
+    def _acquire(self, name, timeout):
+        idle = self._idle[name]
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created[name] < self.size
+            if can_create:
+                self._created[name] += 1
+        if can_create:
+            try:
+                return self._create(name)
+            except Exception:
+                with self._lock:
+                    self._created[name] -= 1
+                raise
+        # Todas ocupadas: esperar a que se devuelva una
+        return idle.get(timeout=timeout)
+
+    @contextmanager
+    def borrow(self, name, progress_hook=None, postprocessor_hook=None, params=None, timeout=None):
+        """Presta una instancia del perfil `name` en exclusiva
+
+        `params` sobrescribe opciones sólo durante el préstamo (p.ej. 'paths').
+        """
+        if not self.has_profile(name):
+            raise KeyError(f"Perfil de extractor desconocido: {name}")
+        ydl, hooks = self._acquire(name, timeout)
+        with self._lock:
+            self.borrows += 1
+        params = params or {}
+        saved = {key: ydl.params.get(key, _MISSING) for key in params}
+        ydl.params.update(params)
+        hooks.progress = progress_hook
+        hooks.postprocessor = postprocessor_hook
+        try:
+            yield ydl
+        finally:
+            hooks.progress = None
+            hooks.postprocessor = None
+            for key, value in saved.items():
+                if value is _MISSING:
+                    ydl.params.pop(key, None)
+                else:
+                    ydl.params[key] = value
+            self._idle[name].put((ydl, hooks))
+
+    def detached(self, name):
+        """Instancia nueva del perfil `name` que no vuelve al pool
+
+        Para quien necesita una instancia más allá de un préstamo, p.ej. el generador
+        perezoso de entradas de extract_info(process=False), que sigue usándola al iterar.
+        """
+        if not self.has_profile(name):
+            raise KeyError(f"Perfil de extractor desconocido: {name}")
+        return self._create(name)[0]
+
+    def extract_info(self, name, url, **kwargs):
+        """extract_info con una instancia prestada del perfil `name`"""
+        with self.borrow(name) as ydl:
+            return ydl.extract_info(url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'profiles': len(self._profiles),
+                'instances': sum(self._created.values()),
+                'idle': sum(q.qsize() for q in self._idle.values()),
+                'borrows': self.borrows,
+            }
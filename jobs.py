@@ -0,0 +1,143 @@
+"""Cola de trabajos de descarga para el backend
+
+Los trabajos se ejecutan en un pool de hilos acotado; las peticiones repetidas
+del mismo video mientras su trabajo sigue en curso se agrupan en uno solo.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+PROCESSING = 'processing'
+DONE = 'done'
+ERROR = 'error'
+
+ACTIVE_STATES = (QUEUED, DOWNLOADING, PROCESSING)
+
+
+class QueueFullError(Exception):
+    """La cola ya tiene el máximo de trabajos pendientes"""
+
+
+class Job:
+    """Estado de un trabajo; sólo lo modifica el hilo que lo ejecuta"""
+
+    def __init__(self, key, video_id, params=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.video_id = video_id
+        self.params = params or {}
+        self.status = QUEUED
+        self.progress = 0.0
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.filename = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.done_event = threading.Event()
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated = time.time()
+
+    def progress_hook(self, d):
+        """Hook de progreso de yt-dlp: bytes descargados y porcentaje"""
+        if d.get('status') == 'downloading':
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            downloaded = d.get('downloaded_bytes') or 0
+            self.update(
+                status=DOWNLOADING,
+                downloaded_bytes=downloaded,
+                total_bytes=total,
+                progress=min(downloaded / total, 1.0) if total else self.progress
+            )
+        elif d.get('status') == 'finished':
+            self.update(status=PROCESSING, progress=1.0)
+
+    def postprocessor_hook(self, d):
+        """Hook de los postprocesadores (conversión con ffmpeg)"""
+        if d.get('status') == 'started':
+            self.update(status=PROCESSING)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'video_id': self.video_id,
+            'params': self.params,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+            'error': self.error,
+            'created': self.created,
+            'updated': self.updated,
+        }
+
+
+class JobQueue:
+    """Pool de trabajadores con cola acotada y agrupación de trabajos idénticos
+
+    `run(job)` hace el trabajo real y devuelve la ruta del archivo resultante.
+    """
+
+    def __init__(self, run, max_workers=2, max_pending=50, ttl=60 * 60):
+        self._run = run
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> Job
+        self._by_key = {}  # clave -> Job en curso o terminado con éxito
+
+    def _execute(self, job):
+        try:
+            filename = self._run(job)
+            job.update(status=DONE, progress=1.0, filename=filename)
+        except Exception as e:
+            job.update(status=ERROR, error=str(e))
+            with self._lock:
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+        finally:
+            job.done_event.set()
+
+    def submit(self, key, video_id, params=None):
+        """Crea un trabajo o devuelve el que ya existe para la misma clave"""
+        with self._lock:
+            self._expire()
+            job = self._by_key.get(key)
+            if job is not None and (job.status != DONE or os.path.exists(job.filename)):
+                return job
+            pending = sum(1 for j in self._jobs.values() if j.status in ACTIVE_STATES)
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Hay {pending} trabajos pendientes")
+            job = Job(key, video_id, params)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        self._executor.submit(self._execute, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        # Llamar con self._lock tomado
+        limit = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.status not in ACTIVE_STATES and job.updated < limit:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
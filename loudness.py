@@ -0,0 +1,229 @@
+"""Análisis de sonoridad (EBU R128) y forma de onda de cada video, una sola vez
+
+Tras descargar o convertir un audio, ffmpeg lo vuelve a leer con el filtro
+`loudnorm` (que mide según EBU R128 la sonoridad integrada, el rango y el pico
+real) y, si se piden, calcula los picos de la forma de onda reducidos a unos
+pocos cientos de valores. El resultado se guarda por video_id en un JSON junto
+a la caché de conversiones, así el reproductor puede igualar el volumen de las
+canciones (al estilo ReplayGain) sin analizar nada al reproducir.
+"""
+import array
+import atexit
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Sonoridad de referencia (la que usa YouTube) y pico real máximo tras aplicar la ganancia
+TARGET_LUFS = -14.0
+MAX_TRUE_PEAK = -1.0
+# Valores de la forma de onda y muestras por segundo con que se calculan
+PEAK_COUNT = 200
+PEAK_SAMPLE_RATE = 2000
+ANALYSIS_TIMEOUT = 5 * 60
+SAVE_INTERVAL = 60
+# Segundos antes de reintentar un video cuyo análisis falló (p.ej. sin ffmpeg o con la URL caducada)
+RETRY_AFTER = 10 * 60
+STORE_VERSION = 1
+LOUDNORM_RE = re.compile(r'\{[^{}]*"input_i"[^{}]*\}')
+
+
+def analysis_command(source, peaks=PEAK_COUNT, headers=None, ffmpeg='ffmpeg'):
+    """Línea de comandos de ffmpeg que mide la sonoridad (en stderr) y, con `peaks`, emite PCM mono en stdout"""
+    cmd = [ffmpeg, '-hide_banner', '-nostats', '-nostdin', '-loglevel', 'info']
+    if headers:
+        cmd += ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in headers.items())]
+    cmd += ['-i', source, '-vn']
+    if not peaks:
+        return cmd + ['-af', 'loudnorm=print_format=json', '-f', 'null', '-']
+    # Una sola lectura: una rama mide y la otra se reduce a mono a baja frecuencia para la forma de onda
+    graph = (
+        '[0:a]asplit=2[measure][wave];'
+        '[measure]loudnorm=print_format=json,anullsink;'
+        f'[wave]aformat=channel_layouts=mono,aresample={PEAK_SAMPLE_RATE}[peaks]'
+    )
+    return cmd + ['-filter_complex', graph, '-map', '[peaks]', '-f', 's16le', '-c:a', 'pcm_s16le', 'pipe:1']
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    # El silencio da -inf, que no se puede enviar en JSON
+    return round(value, 2) if math.isfinite(value) else None
+
+
+def parse_loudnorm(stderr):
+    """{'integrated', 'true_peak', 'lra', 'threshold'} del informe JSON que escribe loudnorm"""
+    match = LOUDNORM_RE.search(stderr)
+    if not match:
+        raise ValueError("ffmpeg no devolvió el informe de loudnorm")
+    report = json.loads(match.group(0))
+    return {
+        'integrated': _number(report.get('input_i')),
+        'true_peak': _number(report.get('input_tp')),
+        'lra': _number(report.get('input_lra')),
+        'threshold': _number(report.get('input_thresh')),
+    }
+
+
+def waveform_peaks(pcm, count=PEAK_COUNT):
+    """Pico absoluto (0-1) de cada uno de `count` tramos del PCM s16le mono"""
+    samples = array.array('h')
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    if not samples:
+        return []
+    count = min(count, len(samples))
+    step = len(samples) / count
+    peaks = []
+    for i in range(count):
+        chunk = samples[int(i * step):int((i + 1) * step)] or samples[int(i * step):int(i * step) + 1]
+        peaks.append(round(max(max(chunk), -min(chunk)) / 32768, 3))
+    return peaks
+
+
+def analyze(source, peaks=PEAK_COUNT, headers=None, ffmpeg='ffmpeg', timeout=ANALYSIS_TIMEOUT):
+    """Sonoridad de un archivo o URL; con `peaks` incluye 'peaks', la forma de onda reducida"""
+    result = subprocess.run(
+        analysis_command(source, peaks, headers, ffmpeg),
+        capture_output=True, timeout=timeout, stdin=subprocess.DEVNULL
+    )
+    stderr = result.stderr.decode('utf-8', 'replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg terminó con código {result.returncode}: {stderr[-300:]}")
+    analysis = parse_loudnorm(stderr)
+    if peaks:
+        analysis['peaks'] = waveform_peaks(result.stdout, peaks)
+    return analysis
+
+
+def replay_gain(analysis, target=TARGET_LUFS, max_peak=MAX_TRUE_PEAK):
+    """Ganancia en dB que lleva la canción a `target` sin que su pico real pase de `max_peak`"""
+    if not analysis or analysis.get('integrated') is None:
+        return 0.0
+    gain = target - analysis['integrated']
+    if analysis.get('true_peak') is not None:
+        gain = min(gain, max_peak - analysis['true_peak'])
+    return round(gain, 2)
+
+
+class LoudnessAnalyzer:
+    """Resultados por video_id en un JSON y análisis en segundo plano, uno por video
+
+    `submit(video_id, source)` programa el análisis si aún no existe ni está en
+    curso; `source()` se llama ya en el hilo de trabajo y devuelve (ruta o URL,
+    cabeceras HTTP o None).
+    """
+
+    def __init__(self, path=None, peaks=PEAK_COUNT, ffmpeg='ffmpeg', max_workers=1, save_interval=SAVE_INTERVAL):
+        self.path = path
+        self.peaks = peaks
+        self.ffmpeg = ffmpeg
+        self.save_interval = save_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loudness")
+        self._lock = threading.Lock()
+        self._results = {}  # video_id -> análisis
+        self._inflight = set()
+        self._failed = {}  # video_id -> momento del último fallo
+        self._dirty = False
+        self._saved_at = time.time()
+        self.analyzed = 0
+        self.failed = 0
+        self.seconds = 0.0
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == STORE_VERSION:
+            self._results.update(data.get('results') or {})
+
+    def save(self):
+        """Escribe el JSON si hubo cambios (no hace nada sin `path`)"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            results = dict(self._results)
+            self._dirty = False
+            self._saved_at = time.time()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, f".{os.path.basename(self.path)}-{uuid.uuid4().hex}")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'results': results}, f)
+        os.replace(tmp, self.path)
+
+    def get(self, video_id):
+        """Análisis guardado de `video_id` o None"""
+        with self._lock:
+            return self._results.get(video_id)
+
+    def pending(self, video_id):
+        with self._lock:
+            return video_id in self._inflight
+
+    def submit(self, video_id, source, retry=False):
+        """Programa el análisis de `video_id`; devuelve False si ya estaba hecho o en curso
+
+        Tras un fallo no se reintenta hasta pasado RETRY_AFTER, salvo con `retry`
+        (p.ej. cuando acaba de llegar el archivo completo a la caché).
+        """
+        with self._lock:
+            if video_id in self._results or video_id in self._inflight:
+                return False
+            if not retry and time.time() - self._failed.get(video_id, 0) < RETRY_AFTER:
+                return False
+            self._inflight.add(video_id)
+        self._executor.submit(self._run, video_id, source)
+        return True
+
+    def _run(self, video_id, source):
+        started = time.perf_counter()
+        analysis = None
+        try:
+            location, headers = source()
+            analysis = analyze(location, self.peaks, headers, self.ffmpeg)
+            analysis['analyzed'] = time.time()
+        except Exception:
+            # Sin resultado se reintenta con una descarga o consulta posterior (pasado RETRY_AFTER)
+            pass
+        finally:
+            with self._lock:
+                self._inflight.discard(video_id)
+                self.seconds += time.perf_counter() - started
+                if analysis is None:
+                    self.failed += 1
+                    self._failed[video_id] = time.time()
+                else:
+                    self._failed.pop(video_id, None)
+                    self._results[video_id] = analysis
+                    self.analyzed += 1
+                    self._dirty = True
+        if analysis is not None and time.time() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._results),
+                'pending': len(self._inflight),
+                'analyzed': self.analyzed,
+                'failed': self.failed,
+                'seconds': self.seconds,
+            }
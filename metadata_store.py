@@ -0,0 +1,231 @@
+"""Metadatos de videos compartidos por todas las sesiones
+
+Cada video tiene un único `Track` (título, duración, autor, miniatura...) más la lista de formatos de audio que ofrece YouTube y, si el
+backend ya la analizó, su sonoridad (para igualar el volumen al reproducir). Las
+sesiones guardan ids o referencias a ese Track en lugar de una copia por
+búsqueda o por lista, y `extract()` agrupa las llamadas simultáneas a yt-dlp
+por el mismo video: la primera consulta y las demás esperan su resultado.
+
+Opcionalmente se guarda en un JSON para no empezar en frío tras reiniciar.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from track import Track, as_track
+
+DEFAULT_MAX_ENTRIES = 5000
+# Segundos mínimos entre escrituras del JSON (se escribe también al salir)
+SAVE_INTERVAL = 60
+STORE_VERSION = 1
+FORMAT_FIELDS = ('format_id', 'ext', 'acodec', 'abr', 'asr', 'filesize')
+
+
+def audio_formats(info):
+    """Formatos sólo de audio de un info de yt-dlp, sin las URLs firmadas (caducan)"""
+    return [
+        {field: f[field] for field in FORMAT_FIELDS if f.get(field) is not None}
+        for f in info.get('formats') or []
+        if f.get('acodec') not in (None, 'none') and f.get('vcodec') in (None, 'none')
+    ]
+
+
+def song_from_info(video_id, info):
+    """Track a partir del info completo de un video"""
+    thumbnail = info.get('thumbnail')
+    if not thumbnail and info.get('thumbnails'):
+        thumbnail = info['thumbnails'][-1].get('url', '')
+    return Track(
+        video_id,
+        title=info.get('title'),
+        # En el info completo 'url' es la del audio; la canción guarda la del video
+        url=info.get('webpage_url') or f"https://www.youtube.com/watch?v={video_id}",
+        duration=info.get('duration'),
+        thumbnail=thumbnail,
+        uploader=info.get('uploader') or info.get('channel'),
+        view_count=info.get('view_count'),
+    )
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MetadataStore:
+    """LRU de video_id -> canción canónica y formatos de audio, segura entre hilos"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path=None, save_interval=SAVE_INTERVAL):
+        self.max_entries = max_entries
+        self.path = path
+        self.save_interval = save_interval
+        self._entries = OrderedDict()  # video_id -> {'song': Track, 'formats': list | None, 'loudness': dict | None}
+        self._inflight = {}  # video_id -> _Call
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.extractions = 0
+        self.shared = 0
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != STORE_VERSION:
+            return
+        for entry in data.get('entries') or []:
+            song = entry.get('song') or {}
+            if song.get('id'):
+                self._entries[song['id']] = {'song': Track.from_dict(song), 'formats': entry.get('formats'), 'loudness': entry.get('loudness')}
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """Escribe el JSON si hubo cambios (no hace nada sin `path`)"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [dict(entry, song=entry['song'].to_dict()) for entry in self._entries.values()]
+            self._dirty = False
+            self._saved_at = time.time()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp = os.path.join(directory, f".{os.path.basename(self.path)}-{uuid.uuid4().hex}")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'entries': entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _maybe_save(self):
+        if self.path and self._dirty and time.time() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def _put(self, song, formats=None):
+        # Llamar con self._lock tomado
+        song = as_track(song)
+        video_id = song.id
+        entry = self._entries.get(video_id)
+        if entry is None:
+            entry = self._entries[video_id] = {'song': song, 'formats': None, 'loudness': None}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            # Se actualiza en el sitio: las sesiones que ya lo referencian ven los datos nuevos
+            entry['song'].merge(song)
+            self._entries.move_to_end(video_id)
+        if formats is not None:
+            entry['formats'] = formats
+        self._dirty = True
+        return entry['song']
+
+    def put(self, song):
+        """Registra (o completa) una canción (Track o diccionario antiguo) y devuelve el Track compartido del video"""
+        with self._lock:
+            canonical = self._put(song)
+        self._maybe_save()
+        return canonical
+
+    def intern(self, songs):
+        """put() de varias canciones; devuelve la lista de Track compartidos"""
+        with self._lock:
+            canonical = [self._put(song) for song in songs]
+        self._maybe_save()
+        return canonical
+
+    def get(self, video_id):
+        """Canción compartida de `video_id` o None"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(video_id)
+            return entry['song']
+
+    def songs(self, video_ids):
+        """Canciones de varios ids en orden; se omiten las que ya no están en memoria"""
+        return [song for song in map(self.get, video_ids) if song is not None]
+
+    def formats(self, video_id):
+        """Formatos de audio conocidos del video (None si nunca se consultó a yt-dlp)"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return entry['formats'] if entry else None
+
+    def loudness(self, video_id):
+        """Análisis de sonoridad del video (de /loudness del backend) o None"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return entry.get('loudness') if entry else None
+
+    def set_loudness(self, video_id, analysis):
+        """Guarda la sonoridad junto a los metadatos; se ignora si el video ya no está en memoria"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                return
+            entry['loudness'] = analysis
+            self._dirty = True
+        self._maybe_save()
+
+    def extract(self, video_id, fetch):
+        """Llama a `fetch()` (extract_info del video) una sola vez aunque lo pidan varios hilos
+
+        Guarda los metadatos y formatos del resultado y lo devuelve a todos los
+        que esperaban; si falla, todos reciben la misma excepción.
+        """
+        with self._lock:
+            call = self._inflight.get(video_id)
+            leader = call is None
+            if leader:
+                call = self._inflight[video_id] = _Call()
+                self.extractions += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            info = fetch()
+            with self._lock:
+                self._put(song_from_info(video_id, info), audio_formats(info))
+            call.result = info
+            return info
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[video_id]
+            call.done.set()
+            self._maybe_save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'extractions': self.extractions,
+                'shared': self.shared,
+            }
@@ -0,0 +1,245 @@
+"""Métricas de rendimiento en memoria con exportación en formato de texto de Prometheus
+
+Contadores e histogramas con etiquetas, sin dependencias. Los componentes que
+ya llevan sus propias estadísticas (cachés, pools) se exponen con
+`Registry.collector`, que se consulta sólo al exportar.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Segundos: de 5 ms a 2 minutos, suficiente para una búsqueda o una conversión completa
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Valor que sólo crece, uno por combinación de etiquetas"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class _Series:
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class Histogram:
+    """Distribución de duraciones (u otros valores) en cubetas acumulativas"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.buckets)
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+            series.max = max(series.max, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide el bloque `with`; también registra el tiempo si el bloque lanza una excepción"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q, **labels):
+        """Estimación del cuantil q interpolando dentro de la cubeta (como histogram_quantile)"""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if series is None or series.count == 0:
+                return None
+            counts = list(series.counts)
+            total, largest = series.count, series.max
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else largest
+                return min(lower + (upper - lower) * (rank - cumulative) / count, largest)
+            cumulative += count
+        return largest
+
+    def summary(self):
+        """{etiquetas: {'count', 'mean', 'p50', 'p95', 'max'}} para mostrar en pantalla"""
+        with self._lock:
+            keys = list(self._series)
+        result = {}
+        for key in keys:
+            labels = dict(key)
+            with self._lock:
+                series = self._series[key]
+                count, total, largest = series.count, series.sum, series.max
+            result[key] = {
+                'count': count,
+                'mean': total / count if count else 0.0,
+                'p50': self.quantile(0.5, **labels),
+                'p95': self.quantile(0.95, **labels),
+                'max': largest,
+            }
+        return result
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            items = [(key, list(series.counts), series.sum, series.count) for key, series in sorted(self._series.items())]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                rows.append((self.name + '_bucket', key + (('le', _format_value(bound)),), cumulative))
+            rows.append((self.name + '_sum', key, total))
+            rows.append((self.name + '_count', key, count))
+        return rows
+
+
+class Registry:
+    """Conjunto de métricas de un proceso"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get(self, cls, name, help_text, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def collector(self, fn):
+        """Registra `fn() -> [(nombre, tipo, ayuda, valor, etiquetas)]`, evaluada al exportar"""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def render(self):
+        """Texto en el formato de exposición de Prometheus (versión 0.0.4)"""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        collected = {}
+        for fn in collectors:
+            try:
+                rows = fn()
+            except Exception:
+                # Una estadística rota no debe tumbar la exportación completa
+                continue
+            for name, kind, help_text, value, labels in rows:
+                collected.setdefault((self.prefix + name, kind, help_text), []).append((_label_key(labels or {}), value))
+        for (name, kind, help_text), values in sorted(collected.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in values:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def cache_rows(cache, stats):
+    """Filas de collector para el `stats()` de una caché (hits, misses y, si los hay, tamaño y expulsiones)"""
+    labels = {'cache': cache}
+    rows = [
+        ('cache_hits_total', 'counter', 'Aciertos de caché', stats.get('hits', 0), labels),
+        ('cache_misses_total', 'counter', 'Fallos de caché', stats.get('misses', 0), labels),
+    ]
+    if 'evictions' in stats:
+        rows.append(('cache_evictions_total', 'counter', 'Entradas expulsadas de la caché', stats['evictions'], labels))
+    size = stats.get('entries', stats.get('size'))
+    if size is not None:
+        rows.append(('cache_entries', 'gauge', 'Entradas en la caché', size, labels))
+    if 'bytes' in stats:
+        rows.append(('cache_bytes', 'gauge', 'Bytes ocupados por la caché', stats['bytes'], labels))
+    return rows
+
+
+def resolver_rows(stats):
+    """Filas de collector para el `stats()` de un Resolver (circuito, llamadas en curso y resultados)"""
+    state = {'closed': 0, 'half_open': 1, 'open': 2}.get(stats['state'], 0)
+    rows = [
+        ('resolver_circuit_state', 'gauge', 'Circuito hacia YouTube (0 cerrado, 1 medio abierto, 2 abierto)', state, {}),
+        ('resolver_circuit_opens_total', 'counter', 'Veces que se abrió el circuito', stats['opens'], {}),
+        ('resolver_in_flight', 'gauge', 'Llamadas al extractor en curso', stats['in_flight'], {}),
+        ('resolver_retries_total', 'counter', 'Reintentos de llamadas al extractor', stats['retries'], {}),
+    ]
+    for (operation, outcome), count in sorted(stats['outcomes'].items()):
+        rows.append(('resolver_calls_total', 'counter', 'Llamadas al extractor por resultado', count,
+                     {'operation': operation, 'outcome': outcome}))
+    return rows
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,198 @@
+"""Biblioteca local: índice persistente de los audios ya descargados
+
+Recorre las carpetas configuradas (p.ej. `Download/` y la caché del backend),
+lee duración y etiquetas con ffprobe y guarda el resultado en un índice JSON.
+Al volver a escanear sólo se abren los archivos cuyo mtime o tamaño cambió, así
+que el arranque con la biblioteca ya indexada es casi instantáneo.
+
+Cada archivo se identifica por su video_id de YouTube cuando se puede deducir
+(metadatos de la caché del backend, etiquetas de yt-dlp o `[id]` en el nombre);
+si no, por un id `local:<hash>` de su ruta.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from transcode import probe
+from track import Track
+
+AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.aac', '.opus', '.ogg', '.oga', '.webm', '.flac', '.wav'}
+MIME_TYPES = {'.m4a': 'audio/mp4', '.opus': 'audio/ogg', '.oga': 'audio/ogg', '.webm': 'audio/webm', '.aac': 'audio/aac'}
+INDEX_VERSION = 1
+PROBE_WORKERS = 4
+
+# URLs de YouTube que yt-dlp escribe en las etiquetas (purl, comment, description)
+YOUTUBE_URL_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/)([A-Za-z0-9_-]{11})')
+# Plantilla por defecto de yt-dlp: "Título [id].ext"
+BRACKET_ID_RE = re.compile(r'\[([A-Za-z0-9_-]{11})\]$')
+# Plantilla del backend: "id.ext"
+BARE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+ID_TAGS = ('purl', 'comment', 'description', 'synopsis', 'url')
+
+
+def local_id(path):
+    return 'local:' + hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+
+
+def mime_type(path):
+    ext = os.path.splitext(path)[1].lower()
+    return MIME_TYPES.get(ext) or mimetypes.guess_type(path)[0] or 'audio/mpeg'
+
+
+def sidecar_metadata(path):
+    """Metadatos que la caché de conversiones guarda junto al archivo (`<hash>.json`)"""
+    try:
+        with open(os.path.splitext(path)[0] + '.json', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def find_video_id(path, tags, sidecar):
+    if sidecar.get('video_id'):
+        return sidecar['video_id']
+    for key in ID_TAGS:
+        match = YOUTUBE_URL_RE.search(tags.get(key) or '')
+        if match:
+            return match.group(1)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = BRACKET_ID_RE.search(stem)
+    if match:
+        return match.group(1)
+    return stem if BARE_ID_RE.match(stem) else None
+
+
+def describe(path, stat, ffprobe='ffprobe'):
+    """Entrada del índice para un archivo (abre el archivo con ffprobe)"""
+    info = probe(path, ffprobe) or {}
+    tags = info.get('tags') or {}
+    sidecar = sidecar_metadata(path)
+    video_id = find_video_id(path, tags, sidecar)
+    stem = BRACKET_ID_RE.sub('', os.path.splitext(os.path.basename(path))[0]).strip()
+    return {
+        'id': video_id or local_id(path),
+        'video_id': video_id,
+        'path': path,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'title': tags.get('title') or sidecar.get('title') or stem.replace('_', ' '),
+        'uploader': tags.get('artist') or tags.get('album_artist') or sidecar.get('uploader') or 'Desconocido',
+        'duration': int(info['duration']) if info.get('duration') else 0,
+        'codec': info.get('codec'),
+        'mime': mime_type(path),
+    }
+
+
+def to_song(entry):
+    """Entrada del índice como canción (Track) de la app"""
+    return Track(entry['id'], title=entry['title'], duration=entry['duration'], uploader=entry['uploader'])
+
+
+class OfflineLibrary:
+    """Índice de audios locales por id, persistido en `index_path`"""
+
+    def __init__(self, roots, index_path, ffprobe='ffprobe', workers=PROBE_WORKERS):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.index_path = index_path
+        self.ffprobe = ffprobe
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._files = {}  # ruta -> entrada
+        self._by_id = {}  # id -> entrada
+        self.last_scan = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        self._set_files(data.get('files') or {})
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        tmp = os.path.join(directory, f".{os.path.basename(self.index_path)}-{uuid.uuid4().hex}")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self._files}, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def _set_files(self, files):
+        # Llamar con self._lock tomado (o desde __init__)
+        self._files = files
+        self._by_id = {}
+        for path in sorted(files):
+            self._by_id.setdefault(files[path]['id'], files[path])
+
+    def _walk(self):
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                # Ocultos y trabajos a medio escribir de la caché de conversiones
+                dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != 'tmp']
+                for filename in filenames:
+                    if filename.startswith('.') or os.path.splitext(filename)[1].lower() not in AUDIO_EXTENSIONS:
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        yield path, os.stat(path)
+                    except OSError:
+                        continue
+
+    def scan(self):
+        """Actualiza el índice: sólo se vuelven a leer los archivos nuevos o modificados"""
+        with self._lock:
+            known = dict(self._files)
+        files = {}
+        changed = []
+        for path, stat in self._walk():
+            entry = known.get(path)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                files[path] = entry
+            else:
+                changed.append((path, stat))
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='library-scan') as executor:
+                for entry in executor.map(lambda item: describe(item[0], item[1], self.ffprobe), changed):
+                    files[entry['path']] = entry
+        removed = len(set(known) - set(files))
+        with self._lock:
+            self._set_files(files)
+            if changed or removed:
+                self._save()
+            self.last_scan = {
+                'files': len(files),
+                'probed': len(changed),
+                'removed': removed,
+            }
+            return dict(self.last_scan)
+
+    def get(self, song_id):
+        """Entrada del archivo local de `song_id` (video_id o id local), o None"""
+        with self._lock:
+            entry = self._by_id.get(song_id)
+        if entry is None or not os.path.exists(entry['path']):
+            return None
+        return entry
+
+    def tracks(self):
+        """Una entrada por id, ordenadas por título"""
+        with self._lock:
+            return sorted(self._by_id.values(), key=lambda entry: entry['title'].lower())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'tracks': len(self._by_id),
+                'youtube': sum(1 for entry in self._by_id.values() if entry['video_id']),
+                'bytes': sum(entry['size'] for entry in self._files.values()),
+                'last_scan': dict(self.last_scan),
+            }
@@ -0,0 +1,108 @@
+"""Importación masiva de listas y canales de YouTube
+
+La lista se extrae en modo plano (una sola petición por página de la lista, sin
+abrir cada video). Sólo las entradas a las que les falta la duración o el autor
+se completan abriendo el video, en paralelo con un número acotado de hilos.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WORKERS = 4
+# Niveles de sublistas que se expanden (un canal sin pestaña devuelve una lista por pestaña)
+MAX_DEPTH = 1
+
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def needs_metadata(entry):
+    """Si a la entrada plana le falta algo que la app muestra"""
+    return entry.get('duration') is None or not (entry.get('uploader') or entry.get('channel'))
+
+
+class ImportResult:
+    """Título de la lista de origen, canciones importadas y entradas descartadas"""
+
+    def __init__(self, title, songs, skipped):
+        self.title = title
+        self.songs = songs
+        self.skipped = skipped
+
+
+class PlaylistImporter:
+    """Extrae una lista de YouTube con el pool de extractores y la convierte en canciones
+
+    `flat_profile` debe tener extract_flat='in_playlist'; `metadata_profile` se usa
+    para abrir los videos incompletos. `to_song` convierte una entrada de yt-dlp en
+    la `Track` de la app.
+    """
+
+    def __init__(self, pool, to_song, flat_profile='import', metadata_profile='metadata', workers=DEFAULT_WORKERS):
+        self.pool = pool
+        self.to_song = to_song
+        self.flat_profile = flat_profile
+        self.metadata_profile = metadata_profile
+        self.workers = workers
+
+    def _flat_entries(self, url, depth=0):
+        info = self.pool.extract_info(self.flat_profile, url, download=False)
+        entries = []
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            is_list = entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab'
+            if is_list and depth < MAX_DEPTH:
+                if entry.get('entries') is not None:
+                    entries.extend(e for e in entry['entries'] if e)
+                elif entry.get('url'):
+                    entries.extend(self._flat_entries(entry['url'], depth + 1)[1])
+            elif not is_list and entry.get('id'):
+                entries.append(entry)
+        return info.get('title') or '', entries
+
+    def _complete(self, entry):
+        # process=False: sólo la página del video, sin ordenar ni elegir formatos
+        info = self.pool.extract_info(self.metadata_profile, watch_url(entry['id']), download=False, process=False)
+        merged = dict(entry)
+        for key, value in info.items():
+            if merged.get(key) is None:
+                merged[key] = value
+        return merged
+
+    def run(self, url, exclude_ids=(), progress=None):
+        """Importa `url` y devuelve un ImportResult
+
+        Se omiten los ids de `exclude_ids` y los repetidos dentro de la lista;
+        `progress(hechas, total)` se llama desde el hilo que invoca run().
+        """
+        title, entries = self._flat_entries(url)
+        seen = set(exclude_ids)
+        unique = []
+        for entry in entries:
+            if entry['id'] not in seen:
+                seen.add(entry['id'])
+                unique.append(entry)
+
+        pending = [i for i, entry in enumerate(unique) if needs_metadata(entry)]
+        skipped = 0
+        if progress:
+            progress(len(unique) - len(pending), len(unique))
+        if pending:
+            done = len(unique) - len(pending)
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='playlist-import') as executor:
+                futures = {executor.submit(self._complete, unique[i]): i for i in pending}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        unique[i] = future.result()
+                    except Exception:
+                        # Videos privados o borrados no tienen duración: no se pueden reproducir
+                        if unique[i].get('duration') is None:
+                            unique[i] = None
+                            skipped += 1
+                    done += 1
+                    if progress:
+                        progress(done, len(unique))
+
+        songs = [self.to_song(entry) for entry in unique if entry is not None]
+        return ImportResult(title, songs, skipped)
@@ -0,0 +1,89 @@
+"""Lista de reproducción en memoria con índice video_id -> posición
+
+Las canciones son objetos `Track` y se identifican por su video_id: una canción cuyo título o número
+de vistas cambió sigue siendo la misma y no se agrega dos veces. Buscar y
+agregar son O(1); quitar y mover reindexan sólo el tramo desplazado, que es lo
+mismo que ya cuesta mover los elementos de la lista.
+"""
+from track import Track
+
+
+class Playlist:
+    """Secuencia de canciones (Track) sin ids repetidos"""
+
+    def __init__(self, songs=()):
+        self._songs = []
+        self._index = {}  # video_id -> posición
+        self.extend(songs)
+
+    def __len__(self):
+        return len(self._songs)
+
+    def __iter__(self):
+        return iter(self._songs)
+
+    def __getitem__(self, index):
+        return self._songs[index]
+
+    def __contains__(self, item):
+        video_id = item.id if isinstance(item, Track) else item
+        return video_id in self._index
+
+    def __eq__(self, other):
+        if isinstance(other, Playlist):
+            return self._songs == other._songs
+        return self._songs == other
+
+    def __repr__(self):
+        return f"Playlist({self._songs!r})"
+
+    def _reindex(self, start, stop=None):
+        stop = len(self._songs) if stop is None else stop
+        for position in range(start, stop):
+            self._index[self._songs[position].id] = position
+
+    def index_of(self, video_id):
+        """Posición de `video_id` o None si no está"""
+        return self._index.get(video_id)
+
+    def append(self, song):
+        """Agrega al final; devuelve False si el video ya estaba"""
+        if song.id in self._index:
+            return False
+        self._index[song.id] = len(self._songs)
+        self._songs.append(song)
+        return True
+
+    def extend(self, songs):
+        """Agrega varias canciones omitiendo las repetidas; devuelve cuántas se agregaron"""
+        return sum(self.append(song) for song in songs)
+
+    def pop(self, index=-1):
+        """Quita y devuelve la canción en `index`"""
+        if index < 0:
+            index += len(self._songs)
+        song = self._songs.pop(index)
+        del self._index[song.id]
+        self._reindex(index)
+        return song
+
+    def remove(self, video_id):
+        """Quita `video_id`; devuelve la canción o None si no estaba"""
+        position = self._index.get(video_id)
+        return None if position is None else self.pop(position)
+
+    def move(self, video_id, new_index):
+        """Mueve `video_id` a `new_index`; devuelve False si no estaba"""
+        old_index = self._index.get(video_id)
+        if old_index is None:
+            return False
+        new_index = max(0, min(new_index, len(self._songs) - 1))
+        self._songs.insert(new_index, self._songs.pop(old_index))
+        self._reindex(min(old_index, new_index), max(old_index, new_index) + 1)
+        return True
+
+    def copy(self):
+        return Playlist(self._songs)
+
+    def to_list(self):
+        return list(self._songs)
@@ -0,0 +1,467 @@
+"""Almacenamiento de listas de reproducción en SQLite (modo WAL)
+
+Cada edición toca sólo las filas afectadas, así que agregar, quitar o mover
+una canción no reescribe la biblioteca completa y varias sesiones de
+Streamlit pueden escribir a la vez sin pisarse.
+
+Además guarda las canciones vistas en búsquedas anteriores (`history`) y un
+índice de texto completo (FTS5) sobre el título y el autor de todas las
+canciones conocidas, que unos disparadores mantienen al día con cada cambio en
+`tracks`. `search()` lo consulta en pocos milisegundos, sin ir a YouTube.
+"""
+import math
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+from track import Track, as_track
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id TEXT PRIMARY KEY,
+    title TEXT,
+    url TEXT,
+    duration REAL,
+    thumbnail TEXT,
+    uploader TEXT,
+    view_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    position REAL NOT NULL,
+    video_id TEXT NOT NULL REFERENCES tracks(video_id),
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_video ON playlist_tracks(playlist_id, video_id);
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_video_id ON playlist_tracks(video_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS history (
+    video_id TEXT PRIMARY KEY REFERENCES tracks(video_id),
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_seen ON history(seen_at);
+"""
+
+# Índice de texto completo sobre tracks (sin acentos; prefijos de 2 y 3 letras para buscar mientras se escribe).
+# Se borra por video_id sólo cuando cambia el título o el autor, no en cada upsert
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    video_id UNINDEXED, title, uploader,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts (video_id, title, uploader) VALUES (new.video_id, new.title, new.uploader);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+    DELETE FROM tracks_fts WHERE video_id = old.video_id;
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF title, uploader ON tracks
+WHEN old.title IS NOT new.title OR old.uploader IS NOT new.uploader BEGIN
+    DELETE FROM tracks_fts WHERE video_id = old.video_id;
+    INSERT INTO tracks_fts (video_id, title, uploader) VALUES (new.video_id, new.title, new.uploader);
+END;
+"""
+
+TRACK_FIELDS = ('title', 'url', 'duration', 'thumbnail', 'uploader', 'view_count')
+
+# Separación mínima entre posiciones antes de renumerar una lista
+MIN_POSITION_GAP = 1e-6
+# Canciones vistas en búsquedas que se recuerdan (las más antiguas que no están en ninguna lista se olvidan)
+DEFAULT_HISTORY_SIZE = 5000
+WORD_RE = re.compile(r'\w+')
+# Coincidencias a partir de las cuales una búsqueda es demasiado general para ordenarla por relevancia
+# (bm25 puntúa todas, unos 10 ms por cada mil): se devuelven las más recientes
+RANK_LIMIT = 500
+
+
+def match_query(text):
+    """Consulta FTS5 con cada palabra de `text` como prefijo (todas deben aparecer), o None si no hay palabras"""
+    words = WORD_RE.findall(text.lower())
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+def _row_to_song(row):
+    return Track(
+        row['video_id'],
+        title=row['title'] or None,
+        url=row['url'],
+        duration=row['duration'] or 0,
+        thumbnail=row['thumbnail'],
+        uploader=row['uploader'] or None,
+        view_count=row['view_count'] or 0,
+    )
+
+
+class PlaylistStore:
+    """Repositorio de listas: playlists, tracks y la pertenencia ordenada entre ambos"""
+
+    def __init__(self, path, history_size=DEFAULT_HISTORY_SIZE):
+        self.path = path
+        self.history_size = history_size
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self.full_text = self._create_search_index(conn)
+
+    def _create_search_index(self, conn):
+        """Crea el índice FTS5 (y lo llena con las canciones ya guardadas); False si SQLite no trae FTS5"""
+        try:
+            conn.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            # Sin FTS5 search() recurre a LIKE, más lento pero suficiente para una biblioteca personal
+            return False
+        # Una base anterior al índice ya tiene canciones: se indexan una sola vez
+        with self._transaction() as conn:
+            if conn.execute("SELECT value FROM meta WHERE key = 'fts_built'").fetchone() is None:
+                conn.execute("DELETE FROM tracks_fts")
+                conn.execute("INSERT INTO tracks_fts (video_id, title, uploader) SELECT video_id, title, uploader FROM tracks")
+                conn.execute("INSERT INTO meta (key, value) VALUES ('fts_built', ?)", (str(time.time()),))
+        return True
+
+    def _connect(self):
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo de Streamlit
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def _playlist_id(self, conn, name, create=False):
+        row = conn.execute("SELECT id FROM playlists WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            return row['id']
+        if not create:
+            return None
+        cur = conn.execute("INSERT INTO playlists (name, created_at) VALUES (?, ?)", (name, time.time()))
+        return cur.lastrowid
+
+    @staticmethod
+    def _upsert_track(conn, song):
+        conn.execute(
+            """INSERT INTO tracks (video_id, title, url, duration, thumbnail, uploader, view_count)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(video_id) DO UPDATE SET
+                   title=excluded.title, url=excluded.url, duration=excluded.duration,
+                   thumbnail=excluded.thumbnail, uploader=excluded.uploader,
+                   view_count=excluded.view_count""",
+            (song.id,) + tuple(getattr(song, field) for field in TRACK_FIELDS)
+        )
+
+    @staticmethod
+    def _next_position(conn, playlist_id):
+        row = conn.execute(
+            "SELECT MAX(position) AS last FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,)
+        ).fetchone()
+        return (row['last'] or 0) + 1
+
+    @staticmethod
+    def _drop_orphans(conn, video_ids):
+        """Borra (y saca del índice) las canciones que ya no están en ninguna lista ni en el historial"""
+        for video_id in set(video_ids):
+            conn.execute(
+                """DELETE FROM tracks WHERE video_id = ?
+                   AND NOT EXISTS (SELECT 1 FROM playlist_tracks WHERE video_id = ?)
+                   AND NOT EXISTS (SELECT 1 FROM history WHERE video_id = ?)""",
+                (video_id, video_id, video_id)
+            )
+
+    def _playlist_video_ids(self, conn, playlist_id):
+        rows = conn.execute("SELECT video_id FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,)).fetchall()
+        return [row['video_id'] for row in rows]
+
+    # Lectura
+
+    def list_playlists(self):
+        """Nombres de las listas en orden de creación"""
+        rows = self._connect().execute("SELECT name FROM playlists ORDER BY created_at, id").fetchall()
+        return [row['name'] for row in rows]
+
+    def get_tracks(self, name):
+        """Canciones (Track) de una lista en orden"""
+        rows = self._connect().execute(
+            """SELECT t.* FROM playlist_tracks pt
+               JOIN playlists p ON p.id = pt.playlist_id
+               JOIN tracks t ON t.video_id = pt.video_id
+               WHERE p.name = ? ORDER BY pt.position""",
+            (name,)
+        ).fetchall()
+        return [_row_to_song(row) for row in rows]
+
+    def load_all(self):
+        """Todas las listas como {nombre: [canciones]} en una sola consulta"""
+        conn = self._connect()
+        playlists = {name: [] for name in self.list_playlists()}
+        rows = conn.execute(
+            """SELECT p.name AS playlist_name, t.* FROM playlist_tracks pt
+               JOIN playlists p ON p.id = pt.playlist_id
+               JOIN tracks t ON t.video_id = pt.video_id
+               ORDER BY p.created_at, p.id, pt.position"""
+        ).fetchall()
+        for row in rows:
+            playlists[row['playlist_name']].append(_row_to_song(row))
+        return playlists
+
+    def search(self, text, limit=10):
+        """Canciones guardadas o vistas en búsquedas cuyo título o autor contiene las palabras de `text`
+
+        Cada palabra cuenta como prefijo ("que bohem" encuentra "Queen - Bohemian
+        Rhapsody"); primero las que están en alguna lista y después por relevancia,
+        salvo con más de RANK_LIMIT coincidencias (p.ej. las primeras letras).
+        """
+        query = match_query(text)
+        if query is None:
+            return []
+        conn = self._connect()
+        saved = "EXISTS (SELECT 1 FROM playlist_tracks pt WHERE pt.video_id = t.video_id)"
+        if self.full_text:
+            matches = conn.execute("SELECT count(*) FROM tracks_fts WHERE tracks_fts MATCH ?", (query,)).fetchone()[0]
+            order = f"{saved} DESC, f.rank" if matches <= RANK_LIMIT else "f.rowid DESC"
+            rows = conn.execute(
+                f"""SELECT t.* FROM tracks_fts f JOIN tracks t ON t.video_id = f.video_id
+                    WHERE tracks_fts MATCH ? ORDER BY {order} LIMIT ?""",
+                (query, limit)
+            ).fetchall()
+        else:
+            words = WORD_RE.findall(text.lower())
+            where = ' AND '.join("(t.title LIKE ? OR t.uploader LIKE ?)" for _ in words)
+            params = [pattern for word in words for pattern in (f"%{word}%",) * 2]
+            rows = conn.execute(
+                f"SELECT t.* FROM tracks t WHERE {where} ORDER BY {saved} DESC, t.title LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [_row_to_song(row) for row in rows]
+
+    # Escritura
+
+    def create_playlist(self, name):
+        """Crea una lista vacía; devuelve False si ya existía"""
+        with self._transaction() as conn:
+            if self._playlist_id(conn, name) is not None:
+                return False
+            self._playlist_id(conn, name, create=True)
+            return True
+
+    def delete_playlist(self, name):
+        with self._transaction() as conn:
+            playlist_id = self._playlist_id(conn, name)
+            if playlist_id is None:
+                return
+            video_ids = self._playlist_video_ids(conn, playlist_id)
+            conn.execute("DELETE FROM playlists WHERE id = ?", (playlist_id,))
+            self._drop_orphans(conn, video_ids)
+
+    def add_track(self, name, song):
+        """Agrega una canción al final de la lista (una fila en tracks y otra en la membresía)"""
+        self.add_tracks(name, [song])
+
+    def add_tracks(self, name, songs):
+        """Agrega varias canciones al final de la lista en una única transacción
+
+        Las que ya están en la lista se omiten, igual que en Playlist.
+        """
+        with self._transaction() as conn:
+            playlist_id = self._playlist_id(conn, name, create=True)
+            position = self._next_position(conn, playlist_id)
+            present = set(self._playlist_video_ids(conn, playlist_id))
+            for song in songs:
+                if song.id in present:
+                    continue
+                present.add(song.id)
+                self._upsert_track(conn, song)
+                conn.execute(
+                    "INSERT INTO playlist_tracks (playlist_id, position, video_id) VALUES (?, ?, ?)",
+                    (playlist_id, position, song.id)
+                )
+                position += 1
+
+    def remove_track(self, name, video_id):
+        """Quita la primera aparición de `video_id` en la lista"""
+        with self._transaction() as conn:
+            playlist_id = self._playlist_id(conn, name)
+            if playlist_id is None:
+                return False
+            cur = conn.execute(
+                """DELETE FROM playlist_tracks WHERE playlist_id = ? AND position = (
+                       SELECT MIN(position) FROM playlist_tracks
+                       WHERE playlist_id = ? AND video_id = ?)""",
+                (playlist_id, playlist_id, video_id)
+            )
+            self._drop_orphans(conn, [video_id])
+            return cur.rowcount > 0
+
+    def move_track(self, name, video_id, new_index):
+        """Mueve una canción a `new_index` cambiando sólo su propia posición"""
+        with self._transaction() as conn:
+            playlist_id = self._playlist_id(conn, name)
+            if playlist_id is None:
+                return False
+            row = conn.execute(
+                "SELECT MIN(position) AS position FROM playlist_tracks WHERE playlist_id = ? AND video_id = ?",
+                (playlist_id, video_id)
+            ).fetchone()
+            if row['position'] is None:
+                return False
+            old_position = row['position']
+            new_position = self._position_for_index(conn, playlist_id, new_index, old_position)
+            if new_position is None:
+                self._renumber(conn, playlist_id)
+                old_position = conn.execute(
+                    "SELECT MIN(position) AS position FROM playlist_tracks WHERE playlist_id = ? AND video_id = ?",
+                    (playlist_id, video_id)
+                ).fetchone()['position']
+                new_position = self._position_for_index(conn, playlist_id, new_index, old_position)
+            conn.execute(
+                "UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND position = ?",
+                (new_position, playlist_id, old_position)
+            )
+            return True
+
+    @staticmethod
+    def _position_for_index(conn, playlist_id, new_index, moving_position):
+        """Posición intermedia entre los vecinos de `new_index` (sin contar la canción que se mueve)"""
+        neighbours = conn.execute(
+            """SELECT position FROM playlist_tracks
+               WHERE playlist_id = ? AND position != ?
+               ORDER BY position LIMIT 2 OFFSET ?""",
+            (playlist_id, moving_position, max(new_index - 1, 0))
+        ).fetchall()
+        if new_index <= 0:
+            first = neighbours[0]['position'] if neighbours else 1
+            return first - 1
+        if not neighbours:
+            return PlaylistStore._next_position(conn, playlist_id)
+        before = neighbours[0]['position']
+        if len(neighbours) == 1:
+            return before + 1
+        after = neighbours[1]['position']
+        if after - before < MIN_POSITION_GAP:
+            return None
+        return (before + after) / 2
+
+    @staticmethod
+    def _renumber(conn, playlist_id):
+        """Reparte de nuevo las posiciones 1..n cuando los huecos se agotan (muy raro)"""
+        rows = conn.execute(
+            "SELECT position FROM playlist_tracks WHERE playlist_id = ? ORDER BY position", (playlist_id,)
+        ).fetchall()
+        # Primero por debajo de todas las posiciones actuales (que también pueden ser negativas,
+        # al mover al principio) para no chocar con la clave primaria, y después a 1..n
+        offset = math.floor(max(abs(row['position']) for row in rows)) + 1 if rows else 1
+        for i, row in enumerate(rows, start=1):
+            conn.execute(
+                "UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND position = ?",
+                (-(offset + i), playlist_id, row['position'])
+            )
+        conn.execute(
+            "UPDATE playlist_tracks SET position = -position - ? WHERE playlist_id = ?", (offset, playlist_id)
+        )
+
+    def replace_tracks(self, name, songs):
+        """Reemplaza el contenido completo de una lista (botón "Guardar" y "Limpiar lista")"""
+        with self._transaction() as conn:
+            playlist_id = self._playlist_id(conn, name, create=True)
+            previous = self._playlist_video_ids(conn, playlist_id)
+            conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+            for position, song in enumerate(songs, start=1):
+                self._upsert_track(conn, song)
+                conn.execute(
+                    "INSERT INTO playlist_tracks (playlist_id, position, video_id) VALUES (?, ?, ?)",
+                    (playlist_id, position, song.id)
+                )
+            self._drop_orphans(conn, previous)
+
+    def remember_tracks(self, songs):
+        """Guarda en el historial las canciones vistas en una búsqueda (quedan en el índice)
+
+        Al pasar de `history_size` se olvidan las más antiguas que no están en ninguna lista.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            for song in songs:
+                if not song.id:
+                    continue
+                self._upsert_track(conn, song)
+                conn.execute(
+                    "INSERT INTO history (video_id, seen_at) VALUES (?, ?) ON CONFLICT(video_id) DO UPDATE SET seen_at = excluded.seen_at",
+                    (song.id, now)
+                )
+            forgotten = conn.execute(
+                "SELECT video_id FROM history ORDER BY seen_at DESC LIMIT -1 OFFSET ?", (self.history_size,)
+            ).fetchall()
+            if forgotten:
+                video_ids = [row['video_id'] for row in forgotten]
+                conn.executemany("DELETE FROM history WHERE video_id = ?", [(video_id,) for video_id in video_ids])
+                self._drop_orphans(conn, video_ids)
+
+    # Migración
+
+    def migrate_from_pickle(self, pickle_path):
+        """Importa una sola vez el antiguo playlists_data.pkl; devuelve cuántas listas importó
+
+        Las canciones del pickle son diccionarios del formato antiguo (o ya Track).
+        """
+        if not os.path.exists(pickle_path):
+            return 0
+        with self._transaction() as conn:
+            done = conn.execute("SELECT value FROM meta WHERE key = 'pickle_migrated'").fetchone()
+            if done is not None:
+                return 0
+            try:
+                with open(pickle_path, 'rb') as f:
+                    legacy = pickle.load(f)
+            except Exception:
+                legacy = {}
+            imported = 0
+            for name, songs in legacy.items():
+                playlist_id = self._playlist_id(conn, name, create=True)
+                position = self._next_position(conn, playlist_id)
+                for song in map(as_track, songs):
+                    if not song.id:
+                        continue
+                    self._upsert_track(conn, song)
+                    conn.execute(
+                        "INSERT INTO playlist_tracks (playlist_id, position, video_id) VALUES (?, ?, ?)",
+                        (playlist_id, position, song.id)
+                    )
+                    position += 1
+                imported += 1
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('pickle_migrated', ?)", (str(time.time()),)
+            )
+            return imported
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: el bloqueo de escritura se toma al empezar"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
@@ -0,0 +1,148 @@
+"""Resolución anticipada de URLs de audio en segundo plano"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError
+
+# Canciones siguientes que se resuelven por defecto mientras suena la actual
+DEFAULT_DEPTH = 3
+DEFAULT_WORKERS = 4
+
+
+def neighbour_ids(playlist, current_index, depth=DEFAULT_DEPTH):
+    """IDs de las `depth` canciones siguientes y de la anterior (en orden de prioridad)"""
+    n = len(playlist)
+    if n <= 1 or depth <= 0:
+        return []
+    ids = []
+    offsets = list(range(1, min(depth, n - 1) + 1)) + [-1]
+    for offset in offsets:
+        video_id = playlist[(current_index + offset) % n].id
+        if video_id and video_id not in ids and video_id != playlist[current_index % n].id:
+            ids.append(video_id)
+    return ids
+
+
+class Prefetcher:
+    """Pool de hilos compartido que llena la caché de URLs antes de que se necesiten
+
+    Cada sesión (owner) tiene su propio conjunto de canciones pendientes; al pedir
+    un conjunto nuevo o al cancelar, las tareas que nadie más espera se cancelan.
+    """
+
+    def __init__(self, resolve, cache, max_workers=DEFAULT_WORKERS):
+        self._resolve = resolve
+        self._cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._inflight = {}  # video_id -> Future
+        self._wanted = {}  # owner -> set(video_id)
+        self._tasks = {}  # clave -> Future de run_once
+        self._retry_at = {}  # clave -> instante a partir del cual se reintenta una tarea fallida
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def _run(self, video_id):
+        url = None
+        try:
+            url = self._resolve(video_id)
+            if url:
+                self._cache.put(video_id, url)
+            return url
+        except Exception:
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(video_id, None)
+                self._forget(video_id)
+                if url:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def prefetch(self, owner, video_ids):
+        """Programa la resolución de `video_ids` para `owner`, reemplazando su petición anterior"""
+        video_ids = [v for v in video_ids if v]
+        with self._lock:
+            previous = self._wanted.pop(owner, set())
+            wanted = set()
+            for video_id in video_ids:
+                if video_id in self._cache and video_id not in self._inflight:
+                    continue
+                wanted.add(video_id)
+            # Sólo se guarda lo pendiente: una sesión que se va sin cancelar no deja nada al terminar sus tareas
+            if wanted:
+                self._wanted[owner] = wanted
+            self._cancel_unwanted(previous - wanted)
+            for video_id in video_ids:
+                if video_id in wanted and video_id not in self._inflight:
+                    self._inflight[video_id] = self._executor.submit(self._run, video_id)
+
+    def cancel(self, owner):
+        """Cancela lo pendiente de una sesión (p.ej. al cambiar de lista)"""
+        with self._lock:
+            self._cancel_unwanted(self._wanted.pop(owner, set()))
+
+    def _forget(self, video_id):
+        # Llamar con self._lock tomado: la tarea terminó y ya nadie la espera
+        for owner in [owner for owner, wanted in self._wanted.items() if video_id in wanted]:
+            self._wanted[owner].discard(video_id)
+            if not self._wanted[owner]:
+                del self._wanted[owner]
+
+    def _cancel_unwanted(self, video_ids):
+        # Llamar con self._lock tomado
+        still_wanted = set().union(*self._wanted.values()) if self._wanted else set()
+        for video_id in video_ids - still_wanted:
+            future = self._inflight.get(video_id)
+            if future is not None and future.cancel():
+                del self._inflight[video_id]
+                self.cancelled += 1
+
+    def wait(self, video_id, timeout=None):
+        """Si ya se está resolviendo `video_id`, espera ese resultado en lugar de repetirlo"""
+        with self._lock:
+            future = self._inflight.get(video_id)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except (CancelledError, TimeoutError):
+            return None
+
+    def run_once(self, key, fn, retry_after=0):
+        """Ejecuta `fn()` en el pool salvo que la tarea `key` ya esté en curso o haya fallado hace poco
+
+        Para tareas secundarias de la precarga (p.ej. la sonoridad): `fn` devuelve un valor
+        falso si falló, y entonces no se reintenta hasta pasados `retry_after` segundos.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for expired in [k for k, at in self._retry_at.items() if at <= now]:
+                del self._retry_at[expired]
+            if key in self._tasks or key in self._retry_at:
+                return False
+            self._tasks[key] = self._executor.submit(self._run_once, key, fn, retry_after)
+            return True
+
+    def _run_once(self, key, fn, retry_after):
+        ok = False
+        try:
+            ok = bool(fn())
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._tasks.pop(key, None)
+                if not ok and retry_after > 0:
+                    self._retry_at[key] = time.monotonic() + retry_after
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._inflight)
+        return {
+            'inflight': inflight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+        }
@@ -0,0 +1,274 @@
+"""Llamadas a YouTube con tiempo máximo, reintentos, cortocircuito y concurrencia acotada
+
+Cuando YouTube limita las peticiones, cada llamada a yt-dlp tarda o falla y, sin
+límites, las de todas las sesiones se acumulan hasta bloquear la app. `Resolver`
+envuelve esas llamadas:
+
+- como mucho `max_concurrency` a la vez en todo el proceso (las demás esperan un
+  hueco sólo mientras les quede tiempo);
+- cada intento tiene `timeout` segundos y la llamada completa, incluidos los
+  reintentos con espera exponencial aleatoria ("full jitter"), `deadline`;
+- tras `failure_threshold` fallos seguidos el circuito se abre y durante
+  `reset_timeout` segundos las llamadas fallan al instante; después se deja pasar
+  una de prueba que decide si se cierra o se vuelve a abrir.
+
+Si la llamada no se puede completar se devuelve `stale()` si lo hay (p.ej. la URL
+en caché aunque esté a punto de caducar) en lugar del error.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 20
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 5
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Errores de yt-dlp que no se arreglan reintentando (y que no indican que YouTube esté fallando)
+PERMANENT_MARKERS = (
+    'video unavailable',
+    'this video is unavailable',
+    'private video',
+    'this video has been removed',
+    'copyright',
+    'sign in to confirm your age',
+    'members-only',
+    'unsupported url',
+    'is not a valid url',
+)
+
+
+class ResolverError(Exception):
+    """La llamada no se completó por el estado del resolver, no por el extractor"""
+
+
+class CircuitOpenError(ResolverError):
+    """El circuito está abierto: YouTube falló varias veces seguidas"""
+
+
+class ResolverTimeoutError(ResolverError):
+    """El intento superó su tiempo máximo (la llamada sigue en segundo plano hasta terminar)"""
+
+
+class ResolverBusyError(ResolverError):
+    """No quedó un hueco libre antes del plazo de la llamada"""
+
+
+def permanent_error(error):
+    """Si reintentar no tiene sentido (video privado, eliminado, URL no válida...)"""
+    message = str(error).lower()
+    return any(marker in message for marker in PERMANENT_MARKERS)
+
+
+class CircuitBreaker:
+    """Circuito cerrado / abierto / medio abierto según los fallos seguidos"""
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        # Llamar con self._lock tomado
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial = False
+        return self._state
+
+    def allow(self):
+        """Si se puede llamar ahora; medio abierto sólo deja pasar una llamada de prueba"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release(self):
+        """Devuelve el turno de prueba si la llamada no llegó a hacerse"""
+        with self._lock:
+            self._trial = False
+            self._settled.notify_all()
+
+    def wait(self, timeout):
+        """Espera (como mucho `timeout` s) a la llamada de prueba en curso; True si ya se puede volver a pedir turno"""
+        with self._lock:
+            if self._current_state() == HALF_OPEN and self._trial and timeout > 0:
+                self._settled.wait(timeout)
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and not self._trial)
+
+    def success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial = False
+            self._settled.notify_all()
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opens += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._trial = False
+                self._settled.notify_all()
+
+    def retry_after(self):
+        """Segundos hasta la siguiente llamada de prueba (0 si no está abierto)"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(self.reset_timeout - (self._clock() - self._opened_at), 0.0)
+
+
+class Resolver:
+    """Ejecuta las llamadas al extractor con los límites del proceso
+
+    `call(operation, fn, stale)` llama a `fn()` en un hilo del resolver; `operation`
+    ('search', 'resolve'...) sólo sirve para las estadísticas.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF, deadline=None, breaker=None,
+                 is_permanent=permanent_error, sleep=time.sleep, rng=random.random):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # Por defecto: dos intentos completos y sus esperas
+        self.deadline = deadline if deadline is not None else 2 * timeout + max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._is_permanent = is_permanent
+        self._sleep = sleep
+        self._rng = rng
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="resolver")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._outcomes = {}  # (operation, resultado) -> llamadas
+        self.retried = 0
+
+    def _count(self, operation, outcome):
+        with self._lock:
+            key = (operation, outcome)
+            self._outcomes[key] = self._outcomes.get(key, 0) + 1
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _attempt(self, fn, remaining):
+        """Un intento: espera un hueco y el resultado sin pasar de `remaining` segundos"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=max(remaining, 0)):
+            raise ResolverBusyError(f"Sin hueco para llamar al extractor en {remaining:.1f} s")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn)
+        except BaseException:
+            self._done(None)
+            raise
+        # El hueco se libera cuando termina de verdad, no cuando el llamante deja de esperar
+        future.add_done_callback(self._done)
+        timeout = min(self.timeout, remaining - (time.monotonic() - started))
+        try:
+            return future.result(timeout=max(timeout, 0))
+        except FutureTimeout:
+            raise ResolverTimeoutError(f"El extractor no respondió en {max(timeout, 0):.1f} s") from None
+
+    def _delay(self, attempt):
+        return self._rng() * min(self.max_backoff, self.backoff * 2 ** attempt)
+
+    def call(self, operation, fn, stale=None):
+        """Resultado de `fn()` respetando concurrencia, tiempos, reintentos y circuito
+
+        Si no se consigue y `stale()` devuelve algo distinto de None, se entrega eso.
+        Los errores permanentes (según `is_permanent`) se lanzan sin reintentar.
+        """
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for attempt in range(self.retries + 1):
+            allowed = self.breaker.allow()
+            if not allowed and self.breaker.wait(deadline - time.monotonic()):
+                # Había una llamada de prueba en curso: las demás esperan su resultado en vez de fallar
+                allowed = self.breaker.allow()
+            if not allowed:
+                error = CircuitOpenError(
+                    f"YouTube no responde; se reintentará en {self.breaker.retry_after():.0f} s"
+                )
+                self._count(operation, 'open')
+                break
+            try:
+                result = self._attempt(fn, deadline - time.monotonic())
+            except ResolverBusyError as e:
+                # Saturación propia, no de YouTube: no cuenta para el circuito
+                self.breaker.release()
+                self._count(operation, 'busy')
+                error = e
+                break
+            except Exception as e:
+                if self._is_permanent(e):
+                    # YouTube respondió: el circuito no se abre por un video privado
+                    self.breaker.success()
+                    self._count(operation, 'permanent')
+                    raise
+                self.breaker.failure()
+                self._count(operation, 'timeout' if isinstance(e, ResolverTimeoutError) else 'error')
+                error = e
+            else:
+                self.breaker.success()
+                self._count(operation, 'ok')
+                return result
+            delay = self._delay(attempt)
+            if attempt == self.retries or time.monotonic() + delay >= deadline:
+                break
+            with self._lock:
+                self.retried += 1
+            self._sleep(delay)
+        value = stale() if stale else None
+        if value is not None:
+            self._count(operation, 'stale')
+            return value
+        raise error
+
+    def stats(self):
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            in_flight = self._in_flight
+            retried = self.retried
+        return {
+            'state': self.breaker.state,
+            'opens': self.breaker.opens,
+            'in_flight': in_flight,
+            'max_concurrency': self.max_concurrency,
+            'retries': retried,
+            'outcomes': outcomes,
+        }
@@ -0,0 +1,162 @@
+"""Caché de búsquedas con resultados paginados que se van obteniendo bajo demanda"""
+import threading
+import time
+from collections import OrderedDict
+
+# Segundos que se reutiliza una búsqueda antes de volver a preguntar a YouTube
+DEFAULT_TTL = 15 * 60
+DEFAULT_MAX_QUERIES = 128
+
+
+def normalize_query(query):
+    """Normaliza la consulta para que 'Queen ', 'queen' y 'QUEEN' compartan entrada"""
+    return ' '.join(query.lower().split())
+
+
+class SearchResults:
+    """Resultados de una consulta: lo ya obtenido más el iterador para pedir más"""
+
+    def __init__(self, query, entries_iter):
+        self.query = query
+        self.entries = []
+        self.exhausted = False
+        self.created = time.time()
+        self._iter = entries_iter
+        self._lock = threading.Lock()
+
+    def fetch(self, count):
+        """Devuelve los primeros `count` resultados, pidiendo al extractor sólo los que faltan"""
+        with self._lock:
+            while len(self.entries) < count and not self.exhausted:
+                try:
+                    entry = next(self._iter)
+                except StopIteration:
+                    self.exhausted = True
+                    self._iter = None
+                    break
+                if entry:
+                    self.entries.append(entry)
+            return self.entries[:count]
+
+    def has_more(self, count):
+        return len(self.entries) > count or not self.exhausted
+
+    def has(self, count):
+        """Si los primeros `count` resultados ya están sin pedir nada al extractor"""
+        return len(self.entries) >= count or self.exhausted
+
+
+class SearchCache:
+    """Caché LRU con TTL de búsquedas, indexada por consulta normalizada
+
+    `open_search(query)` debe devolver un iterador perezoso de resultados; sólo
+    se llama una vez por consulta mientras la entrada siga vigente. Si se indica,
+    `guard(fn)` ejecuta cada lectura que tiene que pedir páginas al extractor
+    (p.ej. `Resolver.call` con tiempo máximo y reintentos). Si una búsqueda
+    caducada no se puede renovar se siguen entregando sus resultados anteriores.
+    `on_fetch(entries)` recibe sólo los resultados recién llegados del extractor.
+    """
+
+    def __init__(self, open_search, ttl=DEFAULT_TTL, max_queries=DEFAULT_MAX_QUERIES, guard=None, on_fetch=None):
+        self._open_search = open_search
+        self.ttl = ttl
+        self.max_queries = max_queries
+        self._guard = guard
+        self._on_fetch = on_fetch
+        self._searches = OrderedDict()  # consulta normalizada -> SearchResults
+        self._previous = {}  # consulta normalizada -> SearchResults caducada, de reserva mientras se renueva
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _fresh(self, key):
+        # Llamar con self._lock tomado
+        search = self._searches.get(key)
+        if search is not None and time.time() - search.created < self.ttl:
+            self._searches.move_to_end(key)
+            return search
+        return None
+
+    def _get_search(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            search = self._fresh(key)
+            if search is not None:
+                self.hits += 1
+                return search
+            self.misses += 1
+        # Abrir la búsqueda (p.ej. crear el YoutubeDL) fuera del lock: no hace esperar a las demás consultas
+        opened = SearchResults(key, iter(self._open_search(key)))
+        with self._lock:
+            # Otra sesión pudo abrir la misma consulta mientras tanto: se usa esa
+            search = self._fresh(key)
+            if search is not None:
+                return search
+            stale = self._searches.get(key)
+            if stale is not None and stale.entries:
+                self._previous[key] = stale
+            self._searches[key] = opened
+            self._searches.move_to_end(key)
+            while len(self._searches) > self.max_queries:
+                evicted, _ = self._searches.popitem(last=False)
+                self._previous.pop(evicted, None)
+            return opened
+
+    def _fetch(self, search, count):
+        if search.has(count):
+            return search.fetch(count)
+        before = len(search.entries)
+        try:
+            entries = self._guard(lambda: search.fetch(count)) if self._guard else search.fetch(count)
+        except Exception:
+            # No guardar búsquedas a medias que fallaron: el siguiente intento empieza de cero
+            with self._lock:
+                if self._searches.get(search.query) is search:
+                    del self._searches[search.query]
+                previous = self._previous.get(search.query)
+                if previous is not None:
+                    self.stale += 1
+            if previous is not None:
+                return previous.entries[:count]
+            raise
+        with self._lock:
+            self._previous.pop(search.query, None)
+        if self._on_fetch and len(entries) > before:
+            self._on_fetch(entries[before:])
+        return entries
+
+    def results(self, query, count):
+        """Primeros `count` resultados de la consulta"""
+        return self._fetch(self._get_search(query), count)
+
+    def page(self, query, page, page_size):
+        """Página `page` (desde 0) y si quedan más resultados después de ella"""
+        search = self._get_search(query)
+        end = (page + 1) * page_size
+        entries = self._fetch(search, end)
+        return entries[page * page_size:end], search.has_more(end)
+
+    def has_more(self, query, count):
+        """Si la consulta tiene más resultados después de los primeros `count`"""
+        key = normalize_query(query)
+        with self._lock:
+            search = self._searches.get(key)
+        return search is None or search.has_more(count)
+
+    def cached(self, query):
+        """Resultados ya obtenidos de la consulta, vigentes o no, sin pedir nada al extractor"""
+        key = normalize_query(query)
+        with self._lock:
+            search = self._searches.get(key) or self._previous.get(key)
+        return list(search.entries) if search is not None else []
+
+    def invalidate(self, query):
+        with self._lock:
+            self._searches.pop(normalize_query(query), None)
+            self._previous.pop(normalize_query(query), None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._searches)
+        return {'size': size, 'hits': self.hits, 'misses': self.misses, 'stale': self.stale}
@@ -0,0 +1,55 @@
+"""Pruebas de PlaylistStore
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist_store import PlaylistStore
+from track import Track
+
+
+def make_store(tmp_path, n=5):
+    store = PlaylistStore(str(tmp_path / 'playlists.db'))
+    store.add_tracks('lista', [Track(f'v{i}', f'Canción {i}') for i in range(n)])
+    return store
+
+
+def ids(store):
+    return [song.id for song in store.get_tracks('lista')]
+
+
+def test_move_track_renumbers_with_negative_positions(tmp_path):
+    store = make_store(tmp_path)
+    # Al mover al principio las posiciones pasan a ser negativas
+    for video_id in ('v2', 'v3', 'v4'):
+        store.move_track('lista', video_id, 0)
+    expected = ids(store)
+    # Los puntos medios agotan el hueco y obligan a renumerar varias veces
+    for _ in range(100):
+        video_id = expected[3]
+        store.move_track('lista', video_id, 2)
+        expected.remove(video_id)
+        expected.insert(2, video_id)
+        assert ids(store) == expected
+
+
+def test_renumber_keeps_order(tmp_path):
+    store = make_store(tmp_path)
+    store.move_track('lista', 'v4', 0)
+    with store._transaction() as conn:
+        playlist_id = store._playlist_id(conn, 'lista')
+        store._renumber(conn, playlist_id)
+        positions = [row['position'] for row in conn.execute(
+            "SELECT position FROM playlist_tracks WHERE playlist_id = ? ORDER BY position", (playlist_id,)
+        )]
+    assert positions == [1, 2, 3, 4, 5]
+    assert ids(store) == ['v4', 'v0', 'v1', 'v2', 'v3']
+
+
+def test_add_tracks_skips_songs_already_in_playlist(tmp_path):
+    store = make_store(tmp_path, n=3)
+    store.add_tracks('lista', [Track('v1', 'Canción 1'), Track('v3', 'Canción 3'), Track('v3', 'Canción 3')])
+    assert ids(store) == ['v0', 'v1', 'v2', 'v3']
@@ -0,0 +1,35 @@
+"""Pruebas de Prefetcher
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prefetch import Prefetcher
+from url_cache import UrlCache
+
+
+def test_finished_sessions_leave_no_owner_behind():
+    gate = threading.Event()
+
+    def resolve(video_id):
+        gate.wait(5)
+        return f"https://cdn.example/{video_id}?expire={int(time.time()) + 3600}"
+
+    prefetcher = Prefetcher(resolve, UrlCache(100))
+    # Sesiones que piden precarga y se van sin cancelar
+    for session in range(20):
+        prefetcher.prefetch(f"sesion-{session}", [f"video-{session}", "compartido"])
+    gate.set()
+    for _ in range(100):
+        if not prefetcher.stats()['inflight']:
+            break
+        time.sleep(0.01)
+    assert prefetcher._wanted == {}
+    # Lo que ya está en la caché no se vuelve a apuntar
+    prefetcher.prefetch("sesion-nueva", ["video-1", "compartido"])
+    assert prefetcher._wanted == {}
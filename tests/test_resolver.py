@@ -0,0 +1,89 @@
+"""Pruebas del circuito y los reintentos de Resolver
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resolver import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Resolver
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_resolver(clock, retries=0, threshold=2):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=10, clock=clock)
+    return Resolver(timeout=1, retries=retries, breaker=breaker, sleep=lambda seconds: None, rng=lambda: 0)
+
+
+def fail():
+    raise RuntimeError("HTTP Error 429: Too Many Requests")
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = Clock()
+    resolver = make_resolver(clock)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            resolver.call('resolve', fail)
+    assert resolver.breaker.state == OPEN
+    # Abierto: falla al instante sin llamar al extractor
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        resolver.call('resolve', lambda: calls.append(1))
+    assert calls == []
+    clock.now = 10
+    assert resolver.breaker.state == HALF_OPEN
+    assert resolver.call('resolve', lambda: 'ok') == 'ok'
+    assert resolver.breaker.state == CLOSED
+
+
+def test_failed_trial_reopens_breaker():
+    clock = Clock()
+    resolver = make_resolver(clock)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            resolver.call('resolve', fail)
+    clock.now = 10
+    with pytest.raises(RuntimeError):
+        resolver.call('resolve', fail)
+    assert resolver.breaker.state == OPEN
+    assert resolver.breaker.opens == 2
+
+
+def test_retries_transient_errors_then_serves_stale():
+    resolver = make_resolver(Clock(), retries=2, threshold=10)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        fail()
+
+    assert resolver.call('resolve', flaky, stale=lambda: 'stale') == 'stale'
+    assert len(calls) == 3
+    assert resolver.retried == 2
+
+
+@pytest.mark.parametrize('message', ["ERROR: Private video", "ERROR: This video has been removed by the uploader"])
+def test_permanent_errors_are_not_retried(message):
+    resolver = make_resolver(Clock(), retries=2, threshold=1)
+    calls = []
+
+    def unavailable():
+        calls.append(1)
+        raise RuntimeError(message)
+
+    with pytest.raises(RuntimeError, match=message):
+        resolver.call('resolve', unavailable, stale=lambda: 'stale')
+    assert len(calls) == 1
+    # Un video privado no indica que YouTube esté fallando
+    assert resolver.breaker.state == CLOSED
@@ -0,0 +1,39 @@
+"""Pruebas de SearchCache
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_cache import SearchCache
+
+
+def test_slow_open_does_not_block_other_queries():
+    opening = threading.Event()
+    release = threading.Event()
+
+    def open_search(query):
+        if query == 'lenta':
+            opening.set()
+            release.wait(5)
+        return iter([f"{query} {i}" for i in range(3)])
+
+    cache = SearchCache(open_search)
+    slow = threading.Thread(target=cache.results, args=('lenta', 3))
+    slow.start()
+    assert opening.wait(5)
+    # Mientras se abre la consulta lenta, las demás se responden sin esperarla
+    fast = []
+    reader = threading.Thread(target=lambda: fast.extend(cache.results('rapida', 2)))
+    reader.start()
+    reader.join(1)
+    answered = list(fast)
+    release.set()
+    reader.join(5)
+    slow.join(5)
+    assert answered == ['rapida 0', 'rapida 1']
+    assert cache.results('lenta', 3) == ['lenta 0', 'lenta 1', 'lenta 2']
+    assert cache.stats()['misses'] == 2
@@ -0,0 +1,128 @@
+"""Miniaturas de YouTube reducidas al tamaño de la cuadrícula, con caché en disco
+
+La cuadrícula de resultados mostraba la miniatura original (480x360 o más) de
+cada resultado. Aquí se pide a i.ytimg.com la variante más pequeña que cubre el
+ancho pedido (con una sesión HTTP reutilizable), se reduce y recomprime en WebP
+o JPEG y se guarda en una TranscodeCache propia, así que cada miniatura se
+descarga y procesa una sola vez.
+
+Pillow es opcional: sin él se guarda y sirve la variante de YouTube tal cual.
+"""
+import os
+import shutil
+import threading
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depende del entorno
+    Image = None
+
+# Anchos que se sirven: cualquier otro se redondea al siguiente para no multiplicar variantes en caché
+WIDTHS = (160, 240, 320, 480, 640)
+DEFAULT_WIDTH = 320
+# Variantes que publica YouTube para cada video, de menor a mayor ancho
+YOUTUBE_VARIANTS = ((120, 'default.jpg'), (320, 'mqdefault.jpg'), (480, 'hqdefault.jpg'), (640, 'sddefault.jpg'))
+FORMATS = {'webp': ('.webp', 'image/webp'), 'jpeg': ('.jpg', 'image/jpeg')}
+QUALITY = {'webp': 75, 'jpeg': 80}
+
+
+def snap_width(width):
+    """Ancho de WIDTHS más cercano por arriba (o el mayor)"""
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return DEFAULT_WIDTH
+    return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+
+def pick_format(requested, accept):
+    """'webp' si se pide o si el navegador lo acepta (Accept: image/webp); si no, 'jpeg'"""
+    if requested in FORMATS:
+        return requested
+    return 'webp' if 'image/webp' in (accept or '') else 'jpeg'
+
+
+def youtube_sources(video_id, width):
+    """URLs de i.ytimg.com a probar: primero la menor variante que cubre `width`"""
+    variants = [name for w, name in YOUTUBE_VARIANTS if w >= width] or [YOUTUBE_VARIANTS[-1][1]]
+    # hqdefault existe siempre; sddefault falta en videos antiguos
+    if 'hqdefault.jpg' not in variants:
+        variants.append('hqdefault.jpg')
+    return [f"https://i.ytimg.com/vi/{video_id}/{name}" for name in variants]
+
+
+def resize(data, width, fmt):
+    """Reduce la imagen a `width` de ancho (sin agrandarla) y la codifica en `fmt`"""
+    with Image.open(BytesIO(data)) as image:
+        image = image.convert('RGB')
+        if image.width > width:
+            image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+        out = BytesIO()
+        if fmt == 'webp':
+            image.save(out, 'WEBP', quality=QUALITY['webp'], method=4)
+        else:
+            image.save(out, 'JPEG', quality=QUALITY['jpeg'], optimize=True, progressive=True)
+        return out.getvalue()
+
+
+class ThumbnailProxy:
+    """Obtiene, reduce y guarda miniaturas; `sources(video_id, width)` da las URLs de origen"""
+
+    def __init__(self, cache, sources=youtube_sources, pool_size=16, timeout=10):
+        self.cache = cache
+        self._sources = sources
+        self.timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.original_bytes = 0
+        self.resized_bytes = 0
+
+    def _fetch(self, video_id, width):
+        last_error = None
+        for url in self._sources(video_id, width):
+            response = self._session.get(url, timeout=self.timeout)
+            if response.status_code == 200:
+                return response.content
+            last_error = f"{response.status_code} en {url}"
+        raise FileNotFoundError(f"Miniatura no disponible: {last_error}")
+
+    def get(self, video_id, width=DEFAULT_WIDTH, fmt='jpeg'):
+        """(ruta en caché, tipo MIME) de la miniatura de `video_id` reducida a `width`"""
+        width = snap_width(width)
+        if Image is None:
+            # Sin Pillow no se puede recodificar: la variante de YouTube ya es JPEG
+            fmt = 'jpeg'
+        path = self.cache.get(video_id, fmt, width)
+        if path is None:
+            original = self._fetch(video_id, width)
+            data = resize(original, width, fmt) if Image is not None else original
+            work_dir = self.cache.temp_dir()
+            tmp = os.path.join(work_dir, video_id + FORMATS[fmt][0])
+            try:
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                path = self.cache.put(video_id, fmt, width, tmp, {'format': fmt})
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            with self._lock:
+                self.processed += 1
+                self.original_bytes += len(original)
+                self.resized_bytes += len(data)
+        return path, FORMATS[fmt][1]
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.cache.stats(),
+                processed=self.processed,
+                original_bytes=self.original_bytes,
+                resized_bytes=self.resized_bytes,
+            )
@@ -0,0 +1,67 @@
+"""Canción compacta con __slots__ en lugar de un diccionario por canción
+
+Un diccionario de siete claves ocupa varias veces lo que un objeto con los
+mismos campos en __slots__, y al serializarlo repite los nombres de las claves
+en cada canción. Las búsquedas, las listas, la cola y la base de listas usan
+`Track`; `from_dict()` y `to_dict()` convierten desde y hacia el formato
+antiguo (el playlists_data.pkl o el JSON de MetadataStore).
+"""
+
+# Orden de los campos en el formato antiguo de diccionario
+SONG_FIELDS = ('title', 'url', 'id', 'duration', 'thumbnail', 'uploader', 'view_count')
+# Valores de relleno de los campos vacíos: no pisan datos reales al combinar canciones
+SONG_DEFAULTS = {'title': 'Sin título', 'url': '', 'duration': 0, 'thumbnail': '', 'uploader': 'Desconocido', 'view_count': 0}
+PLACEHOLDERS = {None, *SONG_DEFAULTS.values()}
+
+
+class Track:
+    """Metadatos de una canción; `id` es el video_id (o 'local:...' en la biblioteca local)"""
+
+    __slots__ = ('id', 'title', 'url', 'duration', 'thumbnail', 'uploader', 'view_count')
+
+    def __init__(self, id, title=None, url=None, duration=None, thumbnail=None, uploader=None, view_count=None):
+        self.id = id
+        self.title = SONG_DEFAULTS['title'] if title is None else title
+        self.url = SONG_DEFAULTS['url'] if url is None else url
+        self.duration = SONG_DEFAULTS['duration'] if duration is None else duration
+        self.thumbnail = SONG_DEFAULTS['thumbnail'] if thumbnail is None else thumbnail
+        self.uploader = SONG_DEFAULTS['uploader'] if uploader is None else uploader
+        self.view_count = SONG_DEFAULTS['view_count'] if view_count is None else view_count
+
+    @classmethod
+    def from_dict(cls, song):
+        """Track a partir de un diccionario de canción del formato antiguo"""
+        return cls(**{field: song.get(field) for field in SONG_FIELDS})
+
+    def to_dict(self):
+        """Diccionario de canción del formato antiguo"""
+        return {field: getattr(self, field) for field in SONG_FIELDS}
+
+    def merge(self, other):
+        """Completa los campos con los de `other` sin pisar datos reales con valores de relleno"""
+        for field in self.__slots__:
+            value = getattr(other, field)
+            if value not in PLACEHOLDERS or getattr(self, field) in PLACEHOLDERS:
+                setattr(self, field, value)
+
+    def _values(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __reduce__(self):
+        # Se serializa como una tupla de valores, sin nombres de campo
+        return (Track, self._values())
+
+    def __eq__(self, other):
+        if not isinstance(other, Track):
+            return NotImplemented
+        return self._values() == other._values()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.title!r})"
+
+
+def as_track(song):
+    """Track tal cual o convertida desde el diccionario antiguo"""
+    return song if isinstance(song, Track) else Track.from_dict(song)
@@ -0,0 +1,206 @@
+"""Conversión de audio con ffmpeg como subproceso, leyendo la salida en streaming"""
+import json
+import os
+import shutil
+import subprocess
+
+# codec -> (argumentos del codificador, formato de salida, extensión, tipo MIME)
+STREAM_FORMATS = {
+    'mp3': (['-c:a', 'libmp3lame'], 'mp3', '.mp3', 'audio/mpeg'),
+    # MP4 normal necesita reescribir la cabecera al final; fragmentado se puede emitir en vivo
+    'm4a': (['-c:a', 'aac', '-movflags', 'frag_keyframe+empty_moov'], 'mp4', '.m4a', 'audio/mp4'),
+    'aac': (['-c:a', 'aac'], 'adts', '.aac', 'audio/aac'),
+    'opus': (['-c:a', 'libopus'], 'ogg', '.opus', 'audio/ogg'),
+    'vorbis': (['-c:a', 'libvorbis'], 'ogg', '.ogg', 'audio/ogg'),
+    'flac': (['-c:a', 'flac'], 'flac', '.flac', 'audio/flac'),
+    'wav': (['-c:a', 'pcm_s16le'], 'wav', '.wav', 'audio/wav'),
+}
+
+# codec de salida -> codecs de origen que se pueden copiar tal cual (sin recodificar)
+PASSTHROUGH_SOURCES = {
+    'm4a': {'aac'},
+    'aac': {'aac'},
+    'opus': {'opus'},
+    'vorbis': {'vorbis'},
+    'mp3': {'mp3'},
+    'flac': {'flac'},
+}
+
+# Codec de origen -> formato de STREAM_FORMATS con su contenedor natural
+NATIVE_FORMATS = {
+    'aac': 'm4a',
+    'opus': 'opus',
+    'vorbis': 'vorbis',
+    'mp3': 'mp3',
+    'flac': 'flac',
+}
+# "codec" que pide el audio de origen sin recodificar, sólo cambiando el contenedor
+ORIGINAL = 'original'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def source_codec(acodec):
+    """Nombre de ffmpeg del codec que informa yt-dlp (p.ej. 'mp4a.40.2' -> 'aac')"""
+    acodec = (acodec or '').lower()
+    if acodec.startswith('mp4a'):
+        return 'aac'
+    return acodec.split('.')[0] or None
+
+
+def can_passthrough(codec, source):
+    """Si el audio de origen (`source`, nombre de ffmpeg) ya está en el codec pedido"""
+    return source in PASSTHROUGH_SOURCES.get(codec, ())
+
+
+def ffmpeg_binary(location='ffmpeg'):
+    """Ruta del ejecutable de ffmpeg: dentro de `location` si es un directorio, si no el del PATH"""
+    for candidate in (shutil.which('ffmpeg', path=location), shutil.which(location)):
+        if candidate:
+            return candidate
+    return 'ffmpeg'
+
+
+def ffprobe_binary(location='ffmpeg'):
+    """Ruta de ffprobe: junto a ffmpeg dentro de `location` si es un directorio, si no la del PATH"""
+    return shutil.which('ffprobe', path=location) or shutil.which('ffprobe') or 'ffprobe'
+
+
+def probe(source, ffprobe='ffprobe', headers=None, timeout=30):
+    """Formato, duración, etiquetas y primera pista de audio según ffprobe, o None si falla
+
+    Devuelve {'format_name', 'duration', 'bit_rate', 'tags', 'codec'}; las
+    etiquetas van en minúsculas porque cada contenedor las escribe distinto.
+    """
+    cmd = [ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', '-select_streams', 'a:0']
+    if headers:
+        cmd += ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in headers.items())]
+    cmd.append(source)
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout, stdin=subprocess.DEVNULL)
+        data = json.loads(result.stdout or b'{}')
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+    if result.returncode != 0 or 'format' not in data:
+        return None
+    fmt = data['format']
+    streams = data.get('streams') or []
+    tags = {key.lower(): value for key, value in (fmt.get('tags') or {}).items()}
+    if streams:
+        # Ogg/Opus guarda las etiquetas en la pista, no en el contenedor
+        for key, value in (streams[0].get('tags') or {}).items():
+            tags.setdefault(key.lower(), value)
+    duration = fmt.get('duration') or (streams[0].get('duration') if streams else None)
+    return {
+        'format_name': fmt.get('format_name', ''),
+        'duration': float(duration) if duration else None,
+        'bit_rate': int(fmt['bit_rate']) if str(fmt.get('bit_rate', '')).isdigit() else None,
+        'tags': tags,
+        'codec': streams[0].get('codec_name') if streams else None,
+    }
+
+
+def ffmpeg_command(source_url, codec, bitrate, headers=None, ffmpeg='ffmpeg', copy=False):
+    """Línea de comandos de ffmpeg que lee `source_url` y escribe el audio convertido en stdout
+
+    Con `copy` el audio no se recodifica: sólo se cambia al contenedor de `codec`.
+    """
+    encoder_args, muxer, _, _ = STREAM_FORMATS[codec]
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if headers:
+        cmd += ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in headers.items())]
+    cmd += ['-i', source_url, '-vn']
+    if copy:
+        # Las opciones de muxer (p.ej. -movflags del mp4 fragmentado) se mantienen
+        cmd += ['-c:a', 'copy'] + encoder_args[2:]
+    else:
+        cmd += encoder_args
+        if codec not in ('flac', 'wav'):
+            cmd += ['-b:a', f"{bitrate}k"]
+    cmd += ['-f', muxer, 'pipe:1']
+    return cmd
+
+
+def ffmpeg_file_command(source, dest, codec, bitrate, copy=False, ffmpeg='ffmpeg'):
+    """Línea de comandos de ffmpeg que convierte (o con `copy`, remuxa) un archivo a `dest`"""
+    encoder_args, muxer, _, _ = STREAM_FORMATS[codec]
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-i', source, '-vn']
+    if copy:
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += encoder_args
+        if codec not in ('flac', 'wav'):
+            cmd += ['-b:a', f"{bitrate}k"]
+    cmd += ['-f', muxer, dest]
+    return cmd
+
+
+def prepare_audio(source, dest_base, codec, bitrate, acodec=None, passthrough=True, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+    """Deja el audio descargado en `source` en el formato pedido; devuelve (ruta, formato, copiado)
+
+    ffprobe (o, si no está, el `acodec` que informó yt-dlp) dice en qué codec
+    viene el origen. Con ORIGINAL, o con `passthrough` y el mismo codec, sólo se
+    cambia el contenedor; si ya es el contenedor correcto ni siquiera se ejecuta
+    ffmpeg. La salida se escribe en `dest_base` + extensión.
+    """
+    detected = (probe(source, ffprobe) or {}).get('codec') or source_codec(acodec)
+    if codec == ORIGINAL:
+        target = NATIVE_FORMATS.get(detected)
+        if target is None:
+            # Codec sin contenedor conocido: se entrega el archivo descargado tal cual
+            return source, None, True
+        copy = True
+    else:
+        target, copy = codec, passthrough and can_passthrough(codec, detected)
+    ext = STREAM_FORMATS[target][2]
+    if copy and os.path.splitext(source)[1].lower() == ext:
+        return source, target, True
+    output = dest_base + ext
+    subprocess.run(
+        ffmpeg_file_command(source, output, target, bitrate, copy, ffmpeg),
+        check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    os.remove(source)
+    return output, target, copy
+
+
+def stream_transcode(source_url, codec, bitrate, headers=None, ffmpeg='ffmpeg', tee_path=None, on_finish=None, copy=False):
+    """Generador de bloques del audio convertido según los va produciendo ffmpeg
+
+    Si se indica `tee_path`, la salida también se escribe allí; `on_finish(ok)` se
+    llama al terminar (ok=False si ffmpeg falló o el cliente cortó la conexión).
+    """
+    cmd = ffmpeg_command(source_url, codec, bitrate, headers, ffmpeg, copy)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+    tee = open(tee_path, 'wb') if tee_path else None
+    ok = produced = False
+    try:
+        while True:
+            # read1 devuelve lo que haya disponible: el primer byte sale en cuanto ffmpeg lo produce
+            chunk = proc.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            produced = True
+            if tee:
+                tee.write(chunk)
+            yield chunk
+        # Una salida vacía no se da por buena aunque ffmpeg termine sin error
+        ok = proc.wait() == 0 and produced
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        if tee:
+            tee.close()
+        if on_finish:
+            on_finish(ok)
+
+
+def prepend(first, body):
+    """Vuelve a poner delante de `body` el bloque ya leído; cerrarlo también cierra `body`"""
+    try:
+        yield first
+        yield from body
+    finally:
+        body.close()
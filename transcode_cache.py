@@ -0,0 +1,145 @@
+"""Caché en disco de audios convertidos, direccionada por (video_id, codec, bitrate)
+
+Cada resultado vive en `<raíz>/<hh>/<hash>.<ext>` junto a un `<hash>.json` con
+sus metadatos. Los archivos se escriben primero en `<raíz>/tmp` y se mueven con
+os.replace, así que nunca se sirve un archivo a medio escribir.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def cache_key(video_id, codec, bitrate):
+    return hashlib.sha1(f"{video_id}:{codec}:{bitrate}".encode('utf-8')).hexdigest()
+
+
+class TranscodeCache:
+    """Índice en memoria de la caché en disco con expulsión LRU por tamaño total"""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # hash -> (ruta, tamaño), de menos a más reciente
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.scan()
+
+    def scan(self):
+        """Reconstruye el índice a partir del disco (al arrancar)"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        found = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for filename in os.listdir(shard_dir):
+                digest, ext = os.path.splitext(filename)
+                if ext == '.json' or len(digest) != 40:
+                    continue
+                path = os.path.join(shard_dir, filename)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, digest, path, stat.st_size))
+        found.sort()
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            for _, digest, path, size in found:
+                self._entries[digest] = (path, size)
+                self.total_bytes += size
+            self._evict()
+
+    def get(self, video_id, codec, bitrate):
+        """Ruta del archivo en caché o None"""
+        digest = cache_key(video_id, codec, bitrate)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or not os.path.exists(entry[0]):
+                if entry is not None:
+                    self._forget(digest)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+        # El mtime guarda el orden LRU entre reinicios
+        try:
+            os.utime(entry[0])
+        except OSError:
+            pass
+        return entry[0]
+
+    def metadata(self, path):
+        """Metadatos guardados junto al archivo (título, video_id, ...)"""
+        try:
+            with open(os.path.splitext(path)[0] + '.json', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def temp_dir(self):
+        """Directorio de trabajo privado para una conversión"""
+        path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        os.makedirs(path)
+        return path
+
+    def put(self, video_id, codec, bitrate, source_path, metadata=None):
+        """Mueve atómicamente `source_path` a la caché y devuelve su ruta final"""
+        digest = cache_key(video_id, codec, bitrate)
+        ext = os.path.splitext(source_path)[1]
+        shard_dir = os.path.join(self.root, digest[:2])
+        os.makedirs(shard_dir, exist_ok=True)
+        final_path = os.path.join(shard_dir, digest + ext)
+        meta = dict(metadata or {}, video_id=video_id, codec=codec, bitrate=bitrate, created=time.time())
+        meta_tmp = source_path + '.json'
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_tmp, os.path.join(shard_dir, digest + '.json'))
+        os.replace(source_path, final_path)
+        size = os.path.getsize(final_path)
+        with self._lock:
+            if digest in self._entries:
+                self._forget(digest, delete=False)
+            self._entries[digest] = (final_path, size)
+            self.total_bytes += size
+            self._evict()
+        return final_path
+
+    def _forget(self, digest, delete=True):
+        # Llamar con self._lock tomado
+        path, size = self._entries.pop(digest)
+        self.total_bytes -= size
+        if delete:
+            for stale in (path, os.path.splitext(path)[0] + '.json'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        # Llamar con self._lock tomado; nunca expulsa la entrada más reciente
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            digest = next(iter(self._entries))
+            self._forget(digest)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
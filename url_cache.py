@@ -0,0 +1,126 @@
+"""Caché de URLs de audio resueltas, compartida por todo el proceso"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+# Tamaño máximo por defecto (número de videos)
+DEFAULT_MAX_ENTRIES = 256
+# Vida útil si la URL no trae el parámetro expire= (en segundos)
+DEFAULT_TTL = 60 * 60
+# Margen para no entregar URLs que caducan en plena reproducción
+EXPIRY_MARGIN = 5 * 60
+
+
+def url_expiry(url, default_ttl=DEFAULT_TTL, now=None):
+    """Devuelve el instante (epoch) en que caduca una URL firmada de googlevideo"""
+    now = time.time() if now is None else now
+    try:
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        if 'expire' in query:
+            return float(query['expire'][0])
+        # Las URLs de manifiesto llevan los parámetros en la ruta: /expire/1700000000/
+        parts = parsed.path.split('/')
+        if 'expire' in parts:
+            return float(parts[parts.index('expire') + 1])
+    except (ValueError, IndexError):
+        pass
+    return now + default_ttl
+
+
+class UrlCache:
+    """Caché LRU de video_id -> URL de audio con expiración según la firma de la URL"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, margin=EXPIRY_MARGIN, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # video_id -> (url, expira_en)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, video_id):
+        """Devuelve la URL en caché o None si no existe o ya caducó"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            url, expires_at = entry
+            if expires_at - self.margin <= now:
+                # Dentro del margen ya no se entrega, pero se guarda como reserva (stale) hasta que caduque
+                if expires_at <= now:
+                    del self._entries[video_id]
+                    self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+            return url
+
+    def peek(self, video_id):
+        """Como get() pero sin tocar contadores ni el orden LRU"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+        if entry and entry[1] - self.margin > time.time():
+            return entry[0]
+        return None
+
+    def stale(self, video_id):
+        """URL aunque esté dentro del margen de caducidad (mientras no haya caducado), o None
+
+        Sirve de reserva cuando no se puede resolver una nueva (p.ej. YouTube limita las peticiones).
+        """
+        with self._lock:
+            entry = self._entries.get(video_id)
+        if entry and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def put(self, video_id, url):
+        """Guarda una URL resuelta, expulsando la menos usada si se supera el límite"""
+        if not url:
+            return
+        expires_at = url_expiry(url, self.default_ttl)
+        with self._lock:
+            self._entries[video_id] = (url, expires_at)
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, video_id):
+        """Elimina una entrada (p.ej. cuando la URL devuelve 403)"""
+        with self._lock:
+            self._entries.pop(video_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores para dimensionar la caché"""
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, video_id):
+        return self.peek(video_id) is not None